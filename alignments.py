@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+from concurrent.futures import ProcessPoolExecutor  # Python 2: futures
+import os
+
+import numpy as np  # >=1.7
+import pandas as pd  # >=0.17
+import pysam  # >=0.8
+
+from windows import strided_windows
+
+_cigar_ops = np.frombuffer(b'MID', dtype=np.uint8)
+
+def decode_cigars(cigars):
+    """Sums the lengths of the M, I and D operations of each CIGAR string
+
+    All strings are decoded together: they are joined into one uint8
+    array, the value of every digit is weighted by its place in its
+    number, and the numbers are summed per (string, operation) with
+    `np.bincount`.
+
+    Parameters
+    ----------
+    cigars : list of str
+        CIGAR strings, e.g. 50M2I18M; '*' counts as no operations
+
+    Returns
+    -------
+    numpy.ndarray
+        (strings, 3) int64 array of the total M, I and D lengths
+
+    """
+
+    if not cigars:
+        return np.zeros((0, 3), dtype=np.int64)
+    text = np.frombuffer(';'.join(cigars).encode('ascii'), dtype=np.uint8)
+    is_digit = (text >= 48) & (text <= 57)
+    # every digit belongs to the operation at the next non-digit position
+    non_digits = np.flatnonzero(~is_digit)
+    digits = np.flatnonzero(is_digit)
+    op_pos = non_digits[np.searchsorted(non_digits, digits)]
+    values = (text[digits] - 48).astype(np.int64) * 10 ** (op_pos - digits - 1)
+
+    ops = text[op_pos]
+    rows = np.cumsum(text == ord(';'))[op_pos]
+    totals = np.zeros((len(cigars), 3), dtype=np.int64)
+    for i, op in enumerate(_cigar_ops):
+        is_op = ops == op
+        totals[:, i] = np.bincount(rows[is_op], weights=values[is_op],
+                                   minlength=len(cigars))
+
+    return totals
+
+def _indexer(names):
+    return names if isinstance(names, pd.Index) else pd.Index(names)
+
+def _oligo_rows(index, names):
+    """Returns the row of every name in `index`"""
+
+    rows = index.get_indexer(names)
+    if (rows < 0).any():
+        raise KeyError('{} is not one of the designed oligos'.format(
+            names[int(np.flatnonzero(rows < 0)[0])]))
+
+    return rows
+
+def _fields(buf, starts, stops):
+    """Gathers byte ranges of `buf` into a fixed-width bytes array"""
+
+    lengths = stops - starts
+    width = max(int(lengths.max()), 1) if len(lengths) else 1
+    padded = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+    matrix = strided_windows(padded, width, 1)[starts]
+    matrix[np.arange(width) >= lengths[:, None]] = 0
+
+    return matrix.view('S{}'.format(width)).ravel()
+
+def _integers(buf, starts, stops):
+    """Parses the decimal integers in byte ranges of `buf`"""
+
+    values = np.zeros(len(starts), dtype=np.int64)
+    for i in range(int((stops - starts).max()) if len(starts) else 0):
+        digit = starts + i < stops
+        values[digit] = (values[digit] * 10 +
+                         buf[(starts + i)[digit]].astype(np.int64) - 48)
+
+    return values
+
+def _sam_blocks(sam, block_size, start=0, stop=None):
+    """Yields uint8 arrays of whole lines of a text SAM file; with `start`
+    and `stop`, only the lines that begin in that byte range
+
+    """
+
+    with open(sam, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline()
+        tail = b''
+        while True:
+            data_start = f.tell() - len(tail)
+            chunk = f.read(block_size)
+            data = tail + chunk
+            if stop is not None and data_start + len(data) >= stop:
+                cut = data.find(b'\n', max(stop - 1 - data_start, 0)) + 1
+                if cut or not chunk:
+                    data = data[:cut] if cut else data
+                    if data.strip():
+                        yield np.frombuffer(data.rstrip(b'\n') + b'\n',
+                                            dtype=np.uint8)
+                    return
+                tail = data
+                continue
+            if not chunk:
+                if data.strip():
+                    yield np.frombuffer(data + b'\n', dtype=np.uint8)
+                return
+            cut = data.rfind(b'\n') + 1
+            tail = data[cut:]
+            if cut:
+                yield np.frombuffer(data[:cut], dtype=np.uint8)
+
+def _parse_sam_block(buf):
+    """Returns the read names, CIGAR strings (as bytes arrays) and NH
+    values (-1 where absent) of the alignment lines in a block of SAM text
+
+    """
+
+    line_stops = np.flatnonzero(buf == 10)
+    line_starts = np.concatenate(([0], line_stops[:-1] + 1))
+    is_record = (line_stops > line_starts) & (buf[line_starts] != ord('@'))
+    line_starts, line_stops = line_starts[is_record], line_stops[is_record]
+
+    tabs = np.flatnonzero(buf == 9)
+    first_tab = np.searchsorted(tabs, line_starts)
+    names = _fields(buf, line_starts, tabs[first_tab])
+    cigars = _fields(buf, tabs[first_tab + 4] + 1, tabs[first_tab + 5])
+
+    # STAR writes NH as the first optional field, after the 11th tab of a
+    # line; other lines are searched one at a time
+    hits = np.full(len(line_starts), -1, dtype=np.int64)
+    tag = np.frombuffer(b'NH:i:', dtype=np.uint8)
+    tag_starts = np.minimum(tabs[np.minimum(first_tab + 10, len(tabs) - 1)] + 1,
+                            line_stops)
+    has_tag = tag_starts + len(tag) < line_stops
+    for i, code in enumerate(tag):
+        has_tag[has_tag] = buf[tag_starts[has_tag] + i] == code
+    field_stops = tabs[np.minimum(first_tab + 11, len(tabs) - 1)]
+    field_stops = np.where((field_stops > tag_starts) &
+                           (field_stops < line_stops), field_stops, line_stops)
+    hits[has_tag] = _integers(buf, tag_starts[has_tag] + len(tag),
+                              field_stops[has_tag])
+    for i in np.flatnonzero(~has_tag).tolist():
+        fields = buf[line_starts[i]:line_stops[i]].tobytes().split(b'\t')
+        for field in fields[11:]:
+            if field.startswith(b'NH:i:'):
+                hits[i] = int(field[5:])
+
+    return names, cigars, hits
+
+def _tally_batch(index, counts, names, cigars, hits):
+    """Adds a batch of alignment records to the (multimap, matches,
+    mismatches) arrays in `counts`
+
+    `names`, `cigars` and `hits` (the NH tag, needed at least at the first
+    record of each run of a name) are arrays with one entry per record.
+
+    """
+
+    multimap, matches, mismatches = counts
+    names = np.asarray(names)
+    # STAR writes all alignments of a read together, so each name is
+    # looked up once per run of records rather than once per record
+    new_run = np.ones(len(names), dtype=bool)
+    new_run[1:] = names[1:] != names[:-1]
+    run_starts = np.flatnonzero(new_run)
+    run_rows = _oligo_rows(index, names[run_starts])
+    rows = np.repeat(run_rows, np.diff(np.append(run_starts, len(names))))
+
+    # oligos have few distinct CIGAR strings; decode each once
+    codes, uniques = pd.factorize(np.asarray(cigars))
+    totals = decode_cigars([x if isinstance(x, str) else x.decode('ascii')
+                            for x in uniques])[codes]
+    matches += np.bincount(rows, weights=totals[:, 0],
+                           minlength=len(index)).astype(np.int64)
+    mismatches += np.bincount(rows, weights=totals[:, 1] + totals[:, 2],
+                              minlength=len(index)).astype(np.int64)
+
+    # every record of an oligo carries the same NH; take it from the first
+    # one seen
+    run_rows, first = np.unique(run_rows, return_index=True)
+    unset = multimap[run_rows] == 0
+    first_hits = np.asarray(hits)[run_starts[first[unset]]]
+    if (first_hits < 0).any():
+        name = index[run_rows[unset][first_hits < 0][0]]
+        raise ValueError('The alignment of {} has no NH tag, so its number '
+                         'of alignments is unknown'.format(
+                             name.decode('ascii') if isinstance(name, bytes)
+                             else name))
+    multimap[run_rows[unset]] = first_hits
+
+    return None
+
+def _tally_sam_range(sam, index, start, stop, block_size):
+    """Tallies the lines of a text SAM file that begin in a byte range"""
+
+    counts = tuple(np.zeros(len(index), dtype=np.int64) for _ in range(3))
+    byte_index = pd.Index([x.encode('ascii') for x in index])
+    for buf in _sam_blocks(sam, block_size, start, stop):
+        _tally_batch(byte_index, counts, *_parse_sam_block(buf))
+
+    return counts
+
+def tally_sam(sam, names, threads=1, batch_size=100000,
+              block_size=2**26):
+    """Counts the alignments of every oligo in a STAR SAM or BAM file
+
+    Text SAM is read in blocks of `block_size` bytes, and the read name,
+    CIGAR string and NH tag of every line of a block are located with
+    vectorized searches for tabs and line breaks; with `threads` > 1, a
+    file of at least two blocks is split into up to `threads` byte ranges
+    of at least one block each, tallied in separate processes, and smaller
+    files are parsed in this process. BAM is read through pysam in batches
+    of `batch_size` records, decompressed with `threads` threads. Either
+    way, read names are mapped to rows of `names` with a hash index (once
+    per run of records with the same name), each distinct CIGAR string is
+    decoded once with `decode_cigars`, and the totals are added to NumPy
+    arrays.
+
+    Parameters
+    ----------
+    sam : str
+        Path to the SAM or BAM file
+    names : sequence of str
+        Oligo names; the output arrays follow this order
+    threads : int, optional
+        Processes used to parse SAM input, or threads used to decompress
+        BAM input, default = 1
+    batch_size : int, optional
+        The number of BAM records decoded at a time, default = 100000
+    block_size : int, optional
+        The number of bytes of SAM text parsed at a time, default = 2**26
+
+    Returns
+    -------
+    multimap, matches, mismatches : numpy.ndarray
+        For each oligo, the number of alignments reported by STAR (NH tag),
+        and the total length of the matched (M) and inserted or deleted
+        (I, D) bases over all of its alignments
+
+    Raises
+    ------
+    KeyError
+        If a record names an oligo that is not in `names`
+    ValueError
+        If the first record of an oligo has no NH tag
+
+    """
+
+    index = _indexer(names)
+    if not sam.endswith('.bam'):
+        size = os.path.getsize(sam)
+        # a process pool only pays off for files of several blocks
+        n_parts = max(min(threads, size // block_size), 1)
+        bounds = [size * i // n_parts for i in range(n_parts + 1)]
+        if n_parts == 1:
+            return _tally_sam_range(sam, index, 0, size, block_size)
+        with ProcessPoolExecutor(max_workers=n_parts) as pool:
+            parts = list(pool.map(_tally_sam_range, *zip(*[
+                (sam, index, x, y, block_size)
+                for x, y in zip(bounds[:-1], bounds[1:])])))
+        # an oligo's multimap count is the same in every part it appears in
+        return (np.max([x[0] for x in parts], axis=0),
+                np.sum([x[1] for x in parts], axis=0),
+                np.sum([x[2] for x in parts], axis=0))
+
+    counts = tuple(np.zeros(len(index), dtype=np.int64) for _ in range(3))
+    with pysam.AlignmentFile(sam, 'rb', threads=threads) as sf:
+        records = sf.fetch(until_eof=True)
+        while True:
+            batch_names, cigars, hits = [], [], []
+            last_name = None
+            for r in records:
+                name = r.query_name
+                if name != last_name:
+                    hits.append(r.get_tag('NH'))
+                    last_name = name
+                else:
+                    hits.append(-1)
+                batch_names.append(name)
+                cigars.append(r.cigarstring or '*')
+                if len(batch_names) == batch_size:
+                    break
+            if not batch_names:
+                break
+            _tally_batch(index, counts, batch_names, cigars, hits)
+
+    return counts
+
+def tally_psl(psl, names, chunk_size=1000000):
+    """Counts the alignments of every oligo in a BLAT .psl file
+
+    The file is read `chunk_size` lines at a time into typed columns (query
+    name, inserted query bases, query start and end), and each chunk is
+    aggregated per oligo with `np.bincount`, so memory use depends on the
+    chunk size rather than the size of the file.
+
+    Parameters
+    ----------
+    psl : str
+        Path to the .psl file, with its 5-line header
+    names : sequence of str
+        Oligo names; the output arrays follow this order
+    chunk_size : int, optional
+        The number of alignments read at a time, default = 1000000
+
+    Returns
+    -------
+    multimap, matches, mismatches : numpy.ndarray
+        For each oligo, the number of alignments, the total number of query
+        bases spanned by them and the total number of inserted query bases
+
+    Raises
+    ------
+    KeyError
+        If an alignment names an oligo that is not in `names`
+
+    """
+
+    index = _indexer(names)
+    counts = tuple(np.zeros(len(index), dtype=np.int64) for _ in range(3))
+    columns = {5: 'q_gap_bases', 9: 'q_name', 11: 'q_start', 12: 'q_end'}
+    try:
+        chunks = pd.read_csv(psl, sep='\t', header=None, skiprows=5,
+                             usecols=sorted(columns), chunksize=chunk_size,
+                             dtype={5: np.int64, 9: str, 11: np.int64,
+                                    12: np.int64})
+        for chunk in chunks:
+            chunk = chunk.rename(columns=columns)
+            codes, uniques = pd.factorize(chunk['q_name'])
+            rows = _oligo_rows(index, np.asarray(uniques))[codes]
+            for total, values in zip(counts, (
+                    None, chunk['q_end'] - chunk['q_start'] + 1,
+                    chunk['q_gap_bases'])):
+                total += np.bincount(
+                    rows, weights=None if values is None else values.values,
+                    minlength=len(index)).astype(np.int64)
+    except pd.errors.EmptyDataError:  # no alignments
+        pass
+
+    return counts
+
+def tally_hits(hits_file, names, size):
+    """Counts the hits of every oligo in a hits file written by
+    `Tools.count_seed_hits`
+
+    Parameters
+    ----------
+    hits_file : str
+        Path to the tab-delimited hits file (oligo, exact, hits)
+    names : sequence of str
+        Oligo names; the output arrays follow this order
+    size : int
+        Oligo length (bp)
+
+    Returns
+    -------
+    multimap, matches, mismatches : numpy.ndarray
+        For each oligo, the number of hits, and the total length of the
+        matched and inserted or deleted bases over all of them; hits are
+        ungapped, so each one adds `size` matched bases, as an all-M CIGAR
+        string would
+
+    Raises
+    ------
+    KeyError
+        If a hit names an oligo that is not in `names`
+
+    """
+
+    index = _indexer(names)
+    multimap = np.zeros(len(index), dtype=np.int64)
+    hits = pd.read_csv(hits_file, sep='\t', dtype={'oligo': str,
+                                                   'hits': np.int64})
+    rows = _oligo_rows(index, hits['oligo'].values)
+    multimap[rows] = hits['hits'].values
+
+    return multimap, multimap * size, np.zeros(len(index), dtype=np.int64)
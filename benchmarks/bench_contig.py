@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""Benchmarks contiguous tiling (`Tiled.gen_oligos_contig`) with the
+strided-window engine against the per-oligo tuple/str implementation it
+replaced, reporting throughput in oligos per second.
+
+Usage: python bench_contig.py [region size in Mb, default=5] [step, default=5]
+"""
+
+from __future__ import print_function, division
+
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from oligos import OligoTable
+from windows import ContigWindows
+
+OLIGO = 70
+
+def per_oligo(chrom_seq, start, stop, step, oligo=OLIGO):
+    """The original implementation: a tuple, a str slice and a formatted
+    key for every oligo"""
+    
+    coors = [(x, x + oligo) for x in range(start, stop - oligo + 1, step)]
+    keys = (':'.join(('chr1', '-'.join(map(str, x + ('000', '000', 'X')))))
+            for x in coors)
+    return dict(zip(keys, (chrom_seq[x[0]:x[1]] for x in coors)))
+
+def main(size=5, step=5):
+    rng = np.random.RandomState(0)
+    seq = np.frombuffer(b'ACGT', dtype=np.uint8)[
+        rng.randint(0, 4, size=size * 10**6)].copy()
+    chrom_seq = seq.tobytes().decode('ascii')
+    
+    t0 = time.time()
+    old = per_oligo(chrom_seq, 0, len(seq), step)
+    t_old = time.time() - t0
+    n_oligos = len(old)
+    old_fasta = ''.join('>{}\n{}\n'.format(*x) for x in old.items())
+    del old
+    
+    windows = ContigWindows('chr1', seq, 0, OLIGO, step)
+    t0 = time.time()
+    new = dict(iter(windows))
+    t_dict = time.time() - t0
+    del new
+    
+    t0 = time.time()
+    out = io.BytesIO()
+    for block in windows.fasta_blocks():
+        out.write(block)
+    t_fasta = time.time() - t0
+    assert out.getvalue().decode('ascii') == old_fasta
+    
+    t0 = time.time()
+    table = OligoTable(OLIGO).append('chr1', windows.starts, windows.windows)
+    out = io.BytesIO()
+    for block in table.fasta_blocks():
+        out.write(block)
+    t_table = time.time() - t0
+    assert out.getvalue().decode('ascii') == old_fasta
+    
+    print('{} oligos ({} Mb, step {})'.format(n_oligos, size, step))
+    for label, t in (('per-oligo dict (original)', t_old),
+                     ('strided view -> dict', t_dict),
+                     ('strided view -> fasta bytes', t_fasta),
+                     ('OligoTable -> fasta bytes', t_table)):
+        print('{:<30}{:>14,.0f} oligos/s'.format(label, n_oligos / t))
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""Benchmarks BLAT .psl tallying (`alignments.tally_psl`) against the
+per-line regex split and dict updates it replaced, on a synthetic file.
+
+Usage: python bench_psl.py [alignments in millions, default=1]
+"""
+
+from __future__ import print_function, division
+
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from alignments import tally_psl
+
+def dict_tally(psl, names):
+    """The original tally: one regex split and dict update per line"""
+
+    stats = dict((x, {'multimap': 0, 'matches': 0, 'mismatches': 0})
+                 for x in names)
+    with open(psl) as f:
+        for _ in range(5):
+            next(f)
+        for line in f:
+            parts = re.split(r"\s+", line.strip())
+            oligo_name = parts[9]
+            qgapbases, qstart, qend = map(int, (parts[5], parts[11],
+                                                parts[12]))
+            stats[oligo_name]['multimap'] += 1
+            stats[oligo_name]['matches'] += (int(qend) - int(qstart)) + 1
+            stats[oligo_name]['mismatches'] += int(qgapbases)
+
+    return stats
+
+def write_psl(path, n_lines):
+    rng = np.random.RandomState(0)
+    n_oligos = max(n_lines // 20, 1)
+    names = ['chr1:{}-{}-000-000-X'.format(i * 70, i * 70 + 70)
+             for i in range(n_oligos)]
+    oligos = rng.randint(0, n_oligos, size=n_lines)
+    q_starts = rng.randint(0, 30, size=n_lines)
+    q_ends = q_starts + rng.randint(20, 40, size=n_lines)
+    gaps = rng.randint(0, 3, size=n_lines)
+    with open(path, 'w') as f:
+        f.write('psLayout version 3\n\nmatch\tmis-\n\tmatch\n---\n')
+        for oligo, q_start, q_end, gap in zip(oligos.tolist(),
+                                              q_starts.tolist(),
+                                              q_ends.tolist(), gaps.tolist()):
+            f.write('{0}\t0\t0\t0\t0\t{1}\t0\t0\t+\t{2}\t70\t{3}\t{4}\tchr1\t'
+                    '1000000\t0\t{0}\t1\t{0},\t{3},\t0,\n'.format(
+                        q_end - q_start, gap, names[oligo], q_start, q_end))
+
+    return names
+
+def main(millions=1):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        psl = os.path.join(tmp_dir, 'blat_out.psl')
+        names = write_psl(psl, int(millions * 10**6))
+
+        t0 = time.time()
+        expected = dict_tally(psl, names)
+        t_dict = time.time() - t0
+        t0 = time.time()
+        multimap, matches, mismatches = tally_psl(psl, names)
+        t_tally = time.time() - t0
+        for key, values in (('multimap', multimap), ('matches', matches),
+                            ('mismatches', mismatches)):
+            assert values.tolist() == [expected[x][key] for x in names]
+        print('{:<24}{:>8.2f}s'.format('regex split per line', t_dict))
+        print('{:<24}{:>8.2f}s{:>8.1f}x'.format('tally_psl', t_tally,
+                                               t_dict / t_tally))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+
+"""Benchmarks the NumPy recognition-site scanner (`enzymes.find_sites`)
+against the `re.finditer` scan it replaced, on a random sequence.
+
+Usage: python bench_scanner.py [size in Mb, default=50]
+"""
+
+from __future__ import print_function, division
+
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from enzymes import find_sites, recognition_seq
+
+def regex_sites(seq, site):
+    """The original scan: an upper-case str copy and one match object per
+    site"""
+    
+    chrom_seq = seq.tobytes().decode('ascii').upper()
+    return np.array([x.start() for x in re.finditer(site, chrom_seq)])
+
+def main(size=50):
+    rng = np.random.RandomState(0)
+    seq = np.frombuffer(b'ACGTacgt', dtype=np.uint8)[
+        rng.randint(0, 8, size=size * 10**6)]
+    
+    print('{:<10}{:<10}{:>12}{:>12}{:>12}{:>10}'.format(
+        'enzyme', 'site', 'sites', 're (s)', 'numpy (s)', 'speed-up'))
+    for enzyme in ('DpnII', 'NlaIII', 'HindIII', 'MseI', 'HinfI', 'ApoI'):
+        site = recognition_seq[enzyme]
+        t0 = time.time()
+        sites = find_sites(seq, site)
+        t_numpy = time.time() - t0
+        if set(site) <= set('ACGT'):
+            t0 = time.time()
+            expected = regex_sites(seq, site)
+            t_re = time.time() - t0
+            assert np.array_equal(sites, expected)
+            t_re_str, ratio = '{:.2f}'.format(t_re), '{:.1f}x'.format(
+                t_re / t_numpy)
+        else:
+            t_re_str, ratio = '-', '-'
+        print('{:<10}{:<10}{:>12}{:>12}{:>12.2f}{:>10}'.format(
+            enzyme, site, len(sites), t_re_str, t_numpy, ratio))
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""Times and memory-profiles the stages of the pipelines on a synthetic
+genome (see `synthetic.py`): oligo generation by each design class, the
+fasta write, and parsing of recorded RepeatMasker, STAR and BLAT outputs.
+
+Each stage is run `--repeat` times and the fastest time is kept, then once
+more under `tracemalloc` for its peak memory (NumPy arrays included). The
+synthetic data are generated on the first run and reused afterwards, so
+results stay comparable between commits. Results are saved to
+results/<commit>.json; with `--compare <commit>`, the saved results of
+that commit are shown alongside.
+
+Usage: python bench_suite.py [--size Mb] [--viewpoints n] [--oligos n]
+       [--repeat n] [--data directory] [--compare commit]
+"""
+
+from __future__ import print_function, division
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(here, '..'))
+from alignments import tally_psl, tally_sam
+from design import Capture, OffTarget, Tiled
+from repeats import read_repeats
+import tools
+
+import synthetic
+
+def commit():
+    """Returns the short hash of the checked out commit, marked -dirty if
+    tracked files have uncommitted changes
+
+    """
+
+    def git(*args):
+        return subprocess.check_output(('git',) + args, cwd=here).decode(
+            'ascii').strip()
+
+    try:
+        head = git('rev-parse', '--short', 'HEAD')
+        dirty = git('status', '--porcelain', '--untracked-files=no')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+    return head + ('-dirty' if dirty else '')
+
+def stages(data, work_dir, n_oligos):
+    """Returns (name, function) pairs for every benchmarked stage; each
+    function runs the stage and returns the number of items (oligos, or
+    oligos scored) it produced
+
+    """
+
+    fa = os.path.join(data, 'genome.fa')
+    viewpoints = os.path.join(data, 'viewpoints.bed')
+    off_targets = os.path.join(data, 'off_targets.bed')
+    with contextlib.redirect_stdout(io.StringIO()):
+        capture = Capture(genome='mm10', fa=fa)
+        tiled = Tiled(genome='mm10', fa=fa)
+        off_target = OffTarget(genome='mm10', fa=fa)
+    capture.fasta = os.path.join(work_dir, 'oligo_seqs.fa')
+    names = synthetic.oligo_names(n_oligos)
+
+    def gen_capture():
+        return len(capture.gen_oligos(bed=viewpoints).oligo_seqs)
+
+    def gen_tiled_capture():
+        return len(tiled.gen_oligos_capture(chrom='chr1').oligo_seqs)
+
+    def gen_tiled_contig():
+        return len(tiled.gen_oligos_contig(chrom='chr1', step=35).oligo_seqs)
+
+    def gen_off_target():
+        return len(off_target.gen_oligos(bed=off_targets).oligo_seqs)
+
+    def write_fasta():
+        capture.write_fasta()
+        return len(capture.oligo_seqs)
+
+    def parse_repeats():
+        return len(read_repeats(os.path.join(data, 'oligo_seqs.fa.out'),
+                                names)[0])
+
+    def parse_sam():
+        return len(tally_sam(os.path.join(data, 'oligos_Aligned.out.sam'),
+                             names)[0])
+
+    def parse_psl():
+        return len(tally_psl(os.path.join(data, 'blat_out.psl'), names)[0])
+
+    return [('Capture.gen_oligos', gen_capture),
+            ('Tiled.gen_oligos_capture', gen_tiled_capture),
+            ('Tiled.gen_oligos_contig', gen_tiled_contig),
+            ('OffTarget.gen_oligos', gen_off_target),
+            ('write_fasta', write_fasta),
+            ('read_repeats', parse_repeats),
+            ('tally_sam', parse_sam),
+            ('tally_psl', parse_psl)]
+
+def measure(stage, repeat):
+    """Returns the fastest of `repeat` runs of a stage (s), its peak
+    memory (MB) and the number of items it produced
+
+    """
+
+    seconds = []
+    # progress and skipped-viewpoint messages are not timed output
+    with contextlib.redirect_stdout(io.StringIO()), \
+            contextlib.redirect_stderr(io.StringIO()):
+        for _ in range(repeat):
+            t0 = time.time()
+            items = stage()
+            seconds.append(time.time() - t0)
+        tracemalloc.start()
+        try:
+            stage()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return min(seconds), peak / 2**20, items
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the pipeline stages on a synthetic genome')
+    parser.add_argument('--size', type=int, default=10,
+                        help='Genome size (Mb), default=10')
+    parser.add_argument('--viewpoints', type=int, default=1000,
+                        help='Capture viewpoints and off-target sites, '
+                             'default=1000')
+    parser.add_argument('--oligos', type=int, default=100000,
+                        help='Oligos in the recorded tool outputs, '
+                             'default=100000')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Timed runs of each stage, default=3')
+    parser.add_argument('--data', default=os.path.join(here, 'data'),
+                        help='Directory of the synthetic data, '
+                             'default=benchmarks/data')
+    parser.add_argument('--compare', help='Commit whose saved results are '
+                                          'shown alongside')
+    args = parser.parse_args(argv)
+
+    settings = {'size': args.size, 'viewpoints': args.viewpoints,
+                'oligos': args.oligos}
+    results_dir = os.path.join(here, 'results')
+    baseline = {}
+    if args.compare:
+        baseline_file = os.path.join(results_dir, args.compare + '.json')
+        if not os.path.exists(baseline_file):
+            parser.error('no saved results for {}'.format(args.compare))
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+        if baseline['settings'] != settings:
+            print('{} was benchmarked with other settings: {}'.format(
+                args.compare, baseline['settings']), file=sys.stderr)
+        baseline = baseline['stages']
+
+    settings_file = os.path.join(args.data, 'synthetic.json')
+    stored = None
+    if os.path.exists(settings_file):
+        with open(settings_file) as f:
+            stored = json.load(f)
+    if stored != settings:
+        print('Generating synthetic data in {}...'.format(args.data))
+        synthetic.generate(args.data, args.size, args.viewpoints, args.oligos)
+
+    # cut sites are indexed with the data, so later runs find them cached
+    tools.paths['CACHE_PATH'] = os.path.join(args.data, 'cache')
+    work_dir = tempfile.mkdtemp()
+    try:
+        results, order = {}, []
+        for name, stage in stages(args.data, work_dir, args.oligos):
+            order.append(name)
+            seconds, peak, items = measure(stage, args.repeat)
+            results[name] = {'seconds': seconds, 'peak_mb': peak,
+                             'items': items}
+    finally:
+        shutil.rmtree(work_dir)
+
+    report = {'commit': commit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(), 'numpy': np.__version__,
+              'machine': platform.node(), 'settings': settings,
+              'stages': results}
+    if not os.path.isdir(results_dir):
+        os.makedirs(results_dir)
+    with open(os.path.join(results_dir, report['commit'] + '.json'),
+              'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print('{} ({size} Mb, {viewpoints} viewpoints, {oligos} oligos)'.format(
+        report['commit'], **settings))
+    print('{:<26}{:>10}{:>10}{:>12}{:>14}'.format(
+        'stage', 'time (s)', 'peak MB', 'items', 'vs ' + (args.compare or '-')))
+    for name in order:
+        result = results[name]
+        change = ''
+        if name in baseline:
+            change = '{:.2f}x time'.format(result['seconds'] /
+                                           baseline[name]['seconds'])
+        print('{:<26}{:>10.3f}{:>10.1f}{:>12}{:>14}'.format(
+            name, result['seconds'], result['peak_mb'], result['items'],
+            change))
+
+    return report
+
+if __name__ == '__main__':
+    main()
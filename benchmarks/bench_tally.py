@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""Benchmarks alignment tallying (`alignments.tally_sam`) against the
+per-record, per-CIGAR-block dict updates it replaced, on a synthetic SAM
+file of multimapping oligos.
+
+Usage: python bench_tally.py [alignments in millions, default=1]
+"""
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from alignments import tally_sam
+
+def dict_tally(sam, names):
+    """The original tally: one dict update per record and CIGAR block"""
+
+    stats = dict((x, {'multimap': 0, 'matches': 0, 'mismatches': 0})
+                 for x in names)
+    sf = pysam.AlignmentFile(sam, 'r')
+    for r in sf.fetch(until_eof=True):
+        oligo_name = r.query_name
+        if stats[oligo_name]['multimap'] == 0:
+            stats[oligo_name]['multimap'] = r.get_tag('NH')
+        for block in r.cigartuples:
+            if block[0] == 0:
+                stats[oligo_name]['matches'] += block[1]
+            elif (block[0] == 1) | (block[0] == 2):
+                stats[oligo_name]['mismatches'] += block[1]
+
+    return stats
+
+def write_sam(path, n_records, mode):
+    rng = np.random.RandomState(0)
+    n_oligos = max(n_records // 20, 1)
+    names = ['chr1:{}-{}-000-000-X'.format(i * 70, i * 70 + 70)
+             for i in range(n_oligos)]
+    oligos = np.sort(rng.randint(0, n_oligos, size=n_records))
+    hits = np.bincount(oligos, minlength=n_oligos)
+    cigars = ('70M', '30M2I38M', '10S55M5S', '40M1D30M')
+    header = {'HD': {'VN': '1.4'}, 'SQ': [{'SN': 'chr1', 'LN': 10**9}]}
+    with pysam.AlignmentFile(path, mode, header=header) as sf:
+        for i, oligo in enumerate(oligos.tolist()):
+            r = pysam.AlignedSegment(sf.header)
+            r.query_name, r.reference_id = names[oligo], 0
+            r.reference_start = int(rng.randint(0, 10**9 - 100))
+            r.cigarstring = cigars[i % len(cigars)]
+            r.set_tag('NH', int(hits[oligo]))
+            sf.write(r)
+
+    return names
+
+def main(millions=1):
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        sam = os.path.join(tmp_dir, 'oligos.sam')
+        bam = os.path.join(tmp_dir, 'oligos.bam')
+        names = write_sam(sam, int(millions * 10**6), 'w')
+        write_sam(bam, int(millions * 10**6), 'wb')
+
+        t0 = time.time()
+        expected = dict_tally(sam, names)
+        t_dict = time.time() - t0
+        print('{:<28}{:>8.2f}s'.format('dict per CIGAR block', t_dict))
+        for label, path, threads in (('tally_sam (SAM, 1 process)', sam, 1),
+                                     ('tally_sam (SAM, 4 processes)', sam, 4),
+                                     ('tally_sam (BAM, 1 thread)', bam, 1),
+                                     ('tally_sam (BAM, 4 threads)', bam, 4)):
+            t0 = time.time()
+            multimap, matches, mismatches = tally_sam(path, names,
+                                                      threads=threads)
+            t_tally = time.time() - t0
+            assert matches.tolist() == [expected[x]['matches'] for x in names]
+            assert mismatches.tolist() == [expected[x]['mismatches']
+                                           for x in names]
+            assert multimap.tolist() == [expected[x]['multimap']
+                                         for x in names]
+            print('{:<28}{:>8.2f}s{:>8.1f}x'.format(label, t_tally,
+                                                   t_dict / t_tally))
+    finally:
+        shutil.rmtree(tmp_dir)
+
+if __name__ == '__main__':
+    main(*map(float, sys.argv[1:]))
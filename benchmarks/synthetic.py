@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+"""Generates a synthetic reference genome, matching bed files and recorded
+RepeatMasker, STAR and BLAT outputs, for the benchmark suite
+(`bench_suite.py`), so that the pipelines can be measured without a real
+genome or the external tools.
+
+Usage: python synthetic.py <output directory> [genome size in Mb, default=10]
+       [viewpoints, default=1000] [oligos in the tool outputs, default=100000]
+"""
+
+from __future__ import print_function, division
+
+import json
+import os
+import sys
+
+import numpy as np
+import pysam
+
+# an interspersed repeat, copied (with a few mutations) across the genome
+ELEMENT_SIZE = 300
+# bases of N at either end of every chromosome, as in assembled genomes
+TELOMERE = 1000
+
+def _bases(rng, size):
+    return np.frombuffer(b'ACGT', dtype=np.uint8)[rng.randint(0, 4, size=size)]
+
+def _plant(seq, starts, insert):
+    """Writes `insert` into `seq` at each of `starts`"""
+
+    seq[starts[:, None] + np.arange(len(insert))] = insert
+
+    return None
+
+def chrom_seq(rng, length, site='GATC', site_spacing=1000,
+              repeat_fraction=0.1):
+    """Returns a random chromosome sequence as a uint8 array
+
+    A restriction `site` is planted every `site_spacing` bp on average (on
+    top of those that occur by chance), and soft-masked (lower case)
+    repeats, (CA)n microsatellites and copies of one interspersed element,
+    cover about `repeat_fraction` of the sequence. The first and last
+    `TELOMERE` bases are N.
+
+    """
+
+    seq = _bases(rng, length)
+    inner = length - 2 * TELOMERE - ELEMENT_SIZE
+    site = np.frombuffer(site.encode('ascii'), dtype=np.uint8)
+    _plant(seq, TELOMERE + rng.randint(0, inner, size=inner // site_spacing),
+           site)
+
+    lower = np.frombuffer(b'acgt', dtype=np.uint8)
+    element = _bases(np.random.RandomState(1), ELEMENT_SIZE)
+    n_repeats = int(inner * repeat_fraction / ELEMENT_SIZE)
+    for start in (TELOMERE + rng.randint(0, inner, size=n_repeats)).tolist():
+        copy = element.copy()
+        mutated = rng.randint(0, ELEMENT_SIZE, size=ELEMENT_SIZE // 20)
+        copy[mutated] = _bases(rng, len(mutated))
+        seq[start:start + ELEMENT_SIZE] = copy | 32
+    for start in (TELOMERE + rng.randint(0, inner, size=n_repeats)).tolist():
+        size = int(rng.randint(10, 60))
+        seq[start:start + 2 * size] = np.tile(lower[[1, 0]], size)
+    seq[:TELOMERE] = seq[-TELOMERE:] = ord('N')
+
+    return seq
+
+def write_genome(path, size=10, chroms=4, seed=0, **kwargs):
+    """Writes a synthetic genome of `size` Mb, split equally over
+    `chroms` chromosomes (chr1, chr2, ...), to a fasta with 60bp lines and
+    returns the length of each chromosome; `kwargs` are passed to
+    `chrom_seq`
+
+    """
+
+    rng = np.random.RandomState(seed)
+    length = int(size * 10**6 // chroms)
+    lengths = {}
+    with open(path, 'wb') as fa:
+        for i in range(1, chroms + 1):
+            chrom = 'chr{}'.format(i)
+            seq = chrom_seq(rng, length, **kwargs)
+            n_lines = -(-length // 60)
+            lines = np.full((n_lines, 61), ord('\n'), dtype=np.uint8)
+            lines[:, :60].flat[:length] = seq
+            text = lines.tobytes()
+            if length % 60:
+                text = text[:length + n_lines - 1] + b'\n'
+            fa.write('>{}\n'.format(chrom).encode('ascii'))
+            fa.write(text)
+            lengths[chrom] = length
+
+    return lengths
+
+def write_bed(path, lengths, n_sites, prefix='site', seed=0):
+    """Writes `n_sites` 1bp sites spread at random over the chromosomes,
+    away from their N ends, to a 4-column bed file
+
+    """
+
+    rng = np.random.RandomState(seed)
+    chroms = sorted(lengths)
+    with open(path, 'w') as bed:
+        for i in range(n_sites):
+            chrom = chroms[int(rng.randint(0, len(chroms)))]
+            start = int(rng.randint(TELOMERE + 500,
+                                    lengths[chrom] - TELOMERE - 500))
+            bed.write('{}\t{}\t{}\t{}{}\n'.format(chrom, start, start + 1,
+                                                   prefix, i))
+
+    return None
+
+def oligo_names(n_oligos, oligo=70):
+    """Returns the names of `n_oligos` fragment-independent oligos, the
+    queries of the recorded tool outputs
+
+    """
+
+    return ['chr1:{}-{}-000-000-X'.format(i * oligo, (i + 1) * oligo)
+            for i in range(n_oligos)]
+
+def write_tool_outputs(directory, names, oligo=70, seed=0):
+    """Writes the RepeatMasker (oligo_seqs.fa.out), STAR
+    (oligos_Aligned.out.sam) and BLAT (blat_out.psl) outputs of a run on
+    the oligos `names`, with a few repeats and alignments for each
+
+    """
+
+    rng = np.random.RandomState(seed)
+
+    # RepeatMasker: 0-2 repeats per oligo
+    repeats = np.repeat(np.arange(len(names)), rng.randint(0, 3,
+                                                           size=len(names)))
+    q_starts = rng.randint(1, oligo // 2, size=len(repeats))
+    q_ends = q_starts + rng.randint(5, oligo // 2, size=len(repeats))
+    with open(os.path.join(directory, 'oligo_seqs.fa.out'), 'w') as rm_out:
+        rm_out.write('   SW  perc perc perc  query      position in query\n'
+                     'score  div. del. ins.  sequence    begin     end\n\n')
+        rm_out.writelines(
+            '  20  0.0  0.0  0.0  {}  {}  {}  (0) +  ({})n  Simple_repeat  '
+            '1  20  (0)  {}\n'.format(names[x], s, e, 'ACGT'[x % 4], i)
+            for i, (x, s, e) in enumerate(zip(repeats.tolist(),
+                                              q_starts.tolist(),
+                                              q_ends.tolist()), 1))
+
+    # STAR: 1-4 alignments per oligo, with indels and soft clipping
+    hits = rng.randint(1, 5, size=len(names))
+    cigars = ('{}M'.format(oligo), '30M2I{}M'.format(oligo - 32),
+              '10S{}M5S'.format(oligo - 15), '40M1D{}M'.format(oligo - 40))
+    header = {'HD': {'VN': '1.4'}, 'SQ': [{'SN': 'chr1', 'LN': 10**9}]}
+    sam = os.path.join(directory, 'oligos_Aligned.out.sam')
+    with pysam.AlignmentFile(sam, 'w', header=header) as sf:
+        for i, n_hits in enumerate(hits.tolist()):
+            for j in range(n_hits):
+                r = pysam.AlignedSegment(sf.header)
+                r.query_name, r.reference_id = names[i], 0
+                r.reference_start = int(rng.randint(0, 10**9 - 100))
+                r.cigarstring = cigars[(i + j) % len(cigars)]
+                r.set_tag('NH', n_hits)
+                sf.write(r)
+
+    # BLAT: 0-3 alignments per oligo
+    blats = np.repeat(np.arange(len(names)), rng.randint(0, 4,
+                                                         size=len(names)))
+    q_starts = rng.randint(0, oligo // 3, size=len(blats))
+    q_ends = q_starts + rng.randint(oligo // 3, oligo - oligo // 3,
+                                    size=len(blats))
+    gaps = rng.randint(0, 3, size=len(blats))
+    with open(os.path.join(directory, 'blat_out.psl'), 'w') as psl:
+        psl.write('psLayout version 3\n\nmatch\tmis-\n\tmatch\n---\n')
+        psl.writelines(
+            '{0}\t0\t0\t0\t0\t{1}\t0\t0\t+\t{2}\t{3}\t{4}\t{5}\tchr1\t1000\t0\t'
+            '{3}\t1\t{3},\t0,\t0,\n'.format(e - s, g, names[x], oligo, s, e)
+            for x, s, e, g in zip(blats.tolist(), q_starts.tolist(),
+                                  q_ends.tolist(), gaps.tolist()))
+
+    return None
+
+def generate(directory, size=10, viewpoints=1000, n_oligos=100000):
+    """Writes a synthetic genome (genome.fa), Capture viewpoints
+    (viewpoints.bed), off-target sites (off_targets.bed) and recorded tool
+    outputs to `directory`, and the settings they were made with to
+    synthetic.json
+
+    """
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    lengths = write_genome(os.path.join(directory, 'genome.fa'), size)
+    write_bed(os.path.join(directory, 'viewpoints.bed'), lengths, viewpoints,
+              'vp', seed=1)
+    write_bed(os.path.join(directory, 'off_targets.bed'), lengths,
+              viewpoints, 'ot', seed=2)
+    write_tool_outputs(directory, oligo_names(n_oligos))
+    with open(os.path.join(directory, 'synthetic.json'), 'w') as f:
+        json.dump({'size': size, 'viewpoints': viewpoints,
+                   'oligos': n_oligos}, f)
+
+    return lengths
+
+if __name__ == '__main__':
+    generate(sys.argv[1], *map(int, sys.argv[2:]))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import numpy as np  # >=1.7
+
+from enzymes import find_sites
+from indexcache import ArrayIndex
+
+class CutSiteIndex(ArrayIndex):
+    """Persistent index of restriction enzyme cut sites in a genome
+
+    The sorted start coordinates of every recognition site on a chromosome
+    are computed the first time that chromosome is requested and saved to
+    `<cache_dir>/<genome fingerprint>/<recognition sequence>/<chrom>.npy`.
+    Later requests, from this or any other run against the same fasta,
+    memory-map the saved array instead of scanning the sequence again.
+    Only chromosomes that are requested are ever scanned or loaded.
+
+    Parameters
+    ----------
+    genome : Genome
+        Indexed reference genome
+    site : str
+        Recognition sequence of the restriction enzyme e.g. GATC; may
+        contain IUPAC degenerate bases
+    cache_dir : str, optional
+        Directory in which indexes are stored, default = CACHE_PATH in
+        config.txt
+
+    """
+
+    def __init__(self, genome, site, cache_dir=None):
+        self.site = site.upper()
+        ArrayIndex.__init__(self, genome, self.site, cache_dir)
+
+    def __getitem__(self, chrom):
+        """Returns the sorted cut site coordinates for a chromosome"""
+
+        if chrom not in self.genome:
+            raise KeyError('{} is not in {}'.format(chrom, self.genome.fa))
+
+        return self._arrays([chrom], lambda: self._build(chrom))[0]
+
+    def __contains__(self, chrom):
+
+        return chrom in self.genome
+
+    def in_range(self, chrom, start, stop):
+        """Returns cut sites whose recognition sequence lies entirely
+        within `start`-`stop` on a chromosome
+
+        """
+
+        sites = self[chrom]
+        first = np.searchsorted(sites, start, side='left')
+        last = np.searchsorted(sites, stop - len(self.site), side='right')
+
+        return sites[first:last]
+
+    def _build(self, chrom):
+        """Scans a chromosome for the recognition sequence and returns the
+        cut site coordinates
+
+        """
+
+        dtype = np.uint32 if self.genome.length(chrom) < 2**32 else np.int64
+        sites = find_sites(self.genome.fetch_array(chrom), self.site)
+
+        return (sites.astype(dtype),)
+
+    def __repr__(self):
+
+        return 'CutSiteIndex(genome={}, site={})'.format(self.genome.fa,
+                                                         self.site)
@@ -3,17 +3,22 @@
 from __future__ import print_function, division
 
 import argparse
+import contextlib
 import math
+import os
 import re
 import sys
 
 import numpy as np  # >=1.7
+import pandas as pd  # >=0.17
 
+from cutsites import CutSiteIndex
+from enzymes import recognition_seq
+from genome import Genome
+from runreport import RunReport
 from tools import Tools
-
-recognition_seq = {'DpnII': 'GATC',
-                   'NlaIII': 'CATG',
-                   'HindIII': 'AAGCTT'}
+from oligos import OligoTable
+from windows import ContigWindows, oligo_names, strided_windows
 
 def _check_value(values, labels):
     for value, label in zip(values, labels):
@@ -33,17 +38,41 @@ def _compile_chr_regex(genome):
     
     return valid_chroms
 
-def _create_key(chrom, *args):
-    return (':'.join((chrom, '-'.join((map(str, x + ('000','000','X')))))) for x in args)
+def _filter_chroms(coordinates, genome):
+    """Drops rows of a bed DataFrame that are on unrecognised chromosomes"""
+    
+    valid_chroms = _compile_chr_regex(genome)
+    is_valid = np.ones(len(coordinates), dtype=bool)
+    for i, chrom in enumerate(coordinates['chrom']):
+        try:
+            _validate_chrom(chrom, valid_chroms)
+        except ChromosomeError as e:
+            print(str(e).format(chrom), file=sys.stderr)
+            is_valid[i] = False
+    
+    return coordinates[is_valid]
 
-def _create_key_frag(chrom, oligo_coor, frag_coor, side):
-    key = ':'.join((chrom, '-'.join(map(str, (oligo_coor + frag_coor)))))
-    key = '-'.join((key, side))
-            
-    return key
+def _by_chrom(coordinates, genome):
+    """Splits a bed DataFrame into (chrom, rows) groups, in the order the
+    chromosomes appear in the genome fasta
+    
+    """
+    
+    order = dict((chrom, i) for i, chrom in enumerate(genome))
+    
+    return sorted(coordinates.groupby('chrom', sort=False),
+                  key=lambda x: order.get(x[0], len(order)))
 
-def _get_sequence(seq, *args):
-    return (str(seq[x[0]:x[1]]) for x in args)  # returns a generator so that all sequences outside of the dictionary are not retained in the memory
+def _read_bed(bed):
+    """Reads a 4-column bed file of named coordinates into a DataFrame"""
+    
+    columns = ('chrom', 'start', 'stop', 'name')
+    try:
+        return pd.read_table(bed, header=None, names=columns,
+                             usecols=range(4),
+                             dtype={'chrom': str, 'name': str})
+    except pd.errors.EmptyDataError:
+        return pd.DataFrame(columns=columns)
 
 def _validate_chrom(chrom, regex):
     if not regex.match(chrom):
@@ -58,48 +87,94 @@ class FragmentError(Exception):
 
 class FragmentMixin(object):
     
-    def _get_fragment_seqs(self, chrom, start, stop, chrom_seq=''):
-        frag_length = stop - start
-        if frag_length < self.oligo:
-            raise FragmentError('{} is too small to design oligos in. Skipping.')
-        
-        left_coor = (start, start + self.oligo)
-        right_coor = (stop - self.oligo, stop)
-        frag_coor = (start, stop)
-        
-        left_key = _create_key_frag(chrom, left_coor, frag_coor, 'L')
-        right_key = _create_key_frag(chrom, right_coor, frag_coor, 'R')
-        
-        if left_key in self.oligo_seqs:
-            raise FragmentError('{} is redundant to another position. Skipping.')
+    def _get_fragment_seqs(self, chrom, frag_starts, frag_stops, chrom_seq=None):
+        """Adds the left and right oligos of every fragment to `oligo_seqs`
+
+        Fragments are supplied as arrays of start and stop coordinates and
+        must not contain duplicates. Returns a boolean array marking the
+        fragments that were too small to design oligos in.
+
+        """
+
+        frag_starts = np.asarray(frag_starts, dtype=np.int64)
+        frag_stops = np.asarray(frag_stops, dtype=np.int64)
+        too_small = (frag_stops - frag_starts) < self.oligo
+        self.oligo_seqs.extend(self._fragment_table(
+            chrom, frag_starts[~too_small], frag_stops[~too_small],
+            chrom_seq=chrom_seq))
         
-        if not chrom_seq: chrom_seq = self.genome_seq[chrom].seq.upper()
-        left_seq, right_seq = _get_sequence(chrom_seq, *(left_coor, right_coor))
+        return too_small
+
+    def _cut_site_index(self, enzyme):
+        """Returns the `CutSiteIndex` of an enzyme from `cut_sites`, adding
+        it the first time the enzyme is used
+
+        """
+
+        site = recognition_seq[enzyme]
+        if site not in self.cut_sites:
+            self.cut_sites[site] = CutSiteIndex(self.genome_seq, site)
+
+        return self.cut_sites[site]
+
+    def _fragment_table(self, chrom, frag_starts, frag_stops, chrom_seq=None,
+                        offset=0):
+        """Returns an `OligoTable` of the left and right oligos of every
+        fragment, in fragment order. Fragments must be at least the oligo
+        length; fragments exactly the oligo length only have a left oligo.
+        Sequences are taken from `chrom_seq` (a uint8 array starting at
+        `offset`) if it is supplied, otherwise read from the genome one
+        oligo at a time.
+
+        """
+
+        has_right = (frag_stops - frag_starts) > self.oligo
+        keep = np.column_stack((np.ones(len(frag_starts), dtype=bool),
+                                has_right))
+        starts = np.column_stack((frag_starts, frag_stops - self.oligo))[keep]
+        sides = np.tile(np.array([ord('L'), ord('R')], dtype=np.uint8),
+                        (len(frag_starts), 1))[keep]
+        n_oligos = 1 + has_right
         
-        self.oligo_seqs[left_key] = left_seq     
-        if frag_length > self.oligo: self.oligo_seqs[right_key] = right_seq
+        if chrom_seq is None:
+            seqs = ''.join(self.genome_seq.fetch(chrom, x, x + self.oligo)
+                           for x in starts.tolist())
+            seqs = np.frombuffer(seqs.encode('ascii'), dtype=np.uint8)
+        else:
+            seqs = strided_windows(chrom_seq, self.oligo, 1)[starts - offset]
         
-        return None
+        return OligoTable(self.oligo).append(
+            chrom, starts, seqs, np.repeat(frag_starts, n_oligos),
+            np.repeat(frag_stops, n_oligos), sides)
 
 class Capture(Tools, FragmentMixin):
     """Designs oligos for Capture-C"""
     
     __doc__ += Tools.__doc__
         
-    def gen_oligos(self, bed, enzyme='DpnII', oligo=70):
+    def gen_oligos(self, bed, enzyme='DpnII', oligo=70, jobs=1):
         r"""Generates oligos flanking restriction fragments that encompass the
         coordinates supplied in the bed file
         
+        Each viewpoint is assigned the fragment that contains its start; a
+        viewpoint starting within a cut site is assigned the fragment that
+        begins with that site. Viewpoints that share a fragment are all
+        associated with its oligos, which are designed once.
+        
         Parameters
         ----------
         bed : str
             Path to tab-delimited bed file containing a list of coordinates for
             viewpoints in the capture experiment. Must be in the format
             'chr'\\t'start'\\t'stop'\\t'name'\\n
-        enzyme : {'DpnII', 'NlaIII', 'HindIII'}, optional
-            The enzyme for digestion, default = DpnII
+        enzyme : str, optional
+            The enzyme for digestion, any key of `enzymes.recognition_seq`,
+            default = DpnII
         oligo : int, optional
             The length of the oligo to design (bp), default = 70
+        jobs : int, optional
+            The number of processes to design oligos in, one chromosome at
+            a time, default = 1
         
         Returns
         -------
@@ -107,52 +182,14 @@ class Capture(Tools, FragmentMixin):
         
         """
         
-        _check_value((oligo,), ('Oligo size',))
+        _check_value((oligo, jobs), ('Oligo size', 'Number of jobs'))
         self._create_attr(oligo)
         
-        cut_sites = {}
-        cut_size = len(recognition_seq[enzyme])
-        rec_seq = re.compile(recognition_seq[enzyme])
-        
         print('Generating oligos...')
-        for chrom, attr in self.genome_seq.items():
-            chrom_seq = str(attr.seq).upper()
-            cut_sites[chrom] = [cut_site.start() for cut_site
-                                in rec_seq.finditer(chrom_seq)]
-            cut_sites[chrom] = np.array(cut_sites[chrom])
-            
-        valid_chroms = _compile_chr_regex(self.genome)
-            
-        with open(bed) as viewpoints:
-            for vp in viewpoints:
-                chrom, vp_start, vp_stop, name = vp.strip().split('\t')
-                
-                try:
-                    _validate_chrom(chrom, valid_chroms)
-                except ChromosomeError as e:
-                    print(str(e).format(chrom), file=sys.stderr)
-                    continue
-                
-                vp_start = int(vp_start)
-                try:
-                    frag_start = cut_sites[chrom][cut_sites[chrom] <= vp_start][-1]
-                    frag_stop = cut_sites[chrom][cut_sites[chrom] > vp_start][0] + cut_size # currently this picks an adjacent fragment if the site is in a cutsite; are we okay with that?
-                except IndexError:
-                    print('Viewpoint {} is not in a closed fragment. '
-                          'Skipping.'.format(name))
-                    continue
-                
-                try:
-                    self._get_fragment_seqs(chrom, frag_start, frag_stop)
-                except FragmentError as e:
-                    frag_id = '{}:{}-{} ({}) is in a fragment that'.format(
-                        chrom, vp_start, vp_stop, name)
-                    print(str(e).format(frag_id), file=sys.stderr)
-                    continue
-                
-                frag_key = '{}:{}-{}'.format(chrom, frag_start, frag_stop)
-                self._assoc[frag_key] = '{}{},'.format(
-                    self._assoc.get(frag_key, ''), name)
+        viewpoints = _filter_chroms(_read_bed(bed), self.genome)
+        chunks = [(chrom, vps, enzyme) for chrom, vps in _by_chrom(
+            viewpoints, self.genome_seq)]
+        self._run_chunks('_capture_chunk', chunks, jobs)
         
         print('\t...complete.')
         if __name__ != '__main__':
@@ -160,6 +197,51 @@ class Capture(Tools, FragmentMixin):
         
         return self
     
+    def _capture_chunk(self, chrom, vps, enzyme):
+        """Designs the oligos for the viewpoints on one chromosome"""
+        
+        cut_sites = self._cut_site_index(enzyme)
+        cut_size = len(recognition_seq[enzyme])
+        with self.run_report.stage('cut_sites') as stage:
+            sites = cut_sites[chrom]
+            stage['items'] = len(sites)
+        # index of the first cut site downstream of each viewpoint start,
+        # i.e. the end of its fragment
+        idx = np.searchsorted(sites, vps['start'].values, side='right')
+        closed = (idx > 0) & (idx < len(sites))
+        for name in vps.loc[~closed, 'name']:
+            print('Viewpoint {} is not in a closed fragment. '
+                  'Skipping.'.format(name))
+        vps, idx = vps[closed], idx[closed]
+        
+        frag_idx, first, inverse = np.unique(idx, return_index=True,
+                                             return_inverse=True)
+        frag_starts = sites[frag_idx-1].astype(np.int64)
+        frag_stops = sites[frag_idx].astype(np.int64) + cut_size
+        too_small = self._get_fragment_seqs(chrom, frag_starts, frag_stops)
+        
+        redundant = np.ones(len(vps), dtype=bool)
+        redundant[first] = False
+        vp_too_small = too_small[inverse]
+        skipped = vp_too_small | redundant
+        for (_, vp), small in zip(vps[skipped].iterrows(),
+                                  vp_too_small[skipped]):
+            msg = ('is too small to design oligos in. Skipping' if small
+                   else 'is shared with another viewpoint; its oligos are '
+                   'only designed once')
+            print('{}:{}-{} ({}) is in a fragment that {}.'.format(
+                chrom, vp['start'], vp['stop'], vp['name'], msg),
+                file=sys.stderr)
+        
+        vps = vps.assign(frag=inverse)[~vp_too_small]
+        names = vps.groupby('frag', sort=False)['name'].agg(
+            lambda x: ''.join('{},'.format(y) for y in x))
+        frag_keys = ['{}:{}-{}'.format(chrom, frag_starts[x], frag_stops[x])
+                     for x in names.index]
+        self._assoc.update(zip(frag_keys, names.values))
+        
+        return None
+    
     def __str__(self):
         
         return 'Capture-C oligo design object for the {} genome'.format(
@@ -170,7 +252,8 @@ class Tiled(Tools, FragmentMixin):
     
     __doc__ += Tools.__doc__
     
-    def gen_oligos_capture(self, chrom, region='', enzyme='DpnII', oligo=70):
+    def gen_oligos_capture(self, chrom, region='', enzyme='DpnII', oligo=70,
+                           jobs=1):
         """Designs oligos for multiple adjacent restriction fragments
         across a specified region of a chromosome, or for the entire
         chromosome.
@@ -183,43 +266,34 @@ class Tiled(Tools, FragmentMixin):
             The region of the chromosome to design oligos, e.g.
             10000-20000; omit this option to design oligos over the
             entire chromosome
-        enzyme : {'DpnII', 'NlaIII', 'HindIII'}, optional
-            The enzyme for digestion, default=DpnII
+        enzyme : str, optional
+            The enzyme for digestion, any key of `enzymes.recognition_seq`,
+            default=DpnII
         oligo : int, optional
             The length of the oligos to design (bp), default=70
+        jobs : int, optional
+            The number of processes to design oligos in; the fragments are
+            split into this many runs of adjacent fragments, default=1
             
         Returns
         -------
         self : object
+        
+        See Also
+        --------
+        iter_oligos_capture : streaming version for very large regions
     
         """
         
-        _check_value((oligo,), ('Oligo size',))
+        _check_value((oligo, jobs), ('Oligo size', 'Number of jobs'))
         self._create_attr(oligo)
         
-        if 'chr' not in str(chrom): chrom = ''.join(('chr'+str(chrom)))
-        chrom_seq = self.genome_seq[chrom].seq.upper()
-            
-        start, stop = (0, len(chrom_seq)) if not region else map(int, region.split('-'))
-        
-        rec_seq = re.compile(recognition_seq[enzyme])
-        cut_size = len(recognition_seq[enzyme])
-        cut_sites = [cut_site.start()+start for cut_site
-                     in rec_seq.finditer(str(chrom_seq[start:stop]))]
-        
-        print('Generating oligos...')   
-        for i in range(len(cut_sites)-1):
-            j = i + 1
-            
-            frag_start = cut_sites[i]
-            frag_stop = cut_sites[j]+cut_size 
-            
-            try:
-                self._get_fragment_seqs(chrom, frag_start, frag_stop, chrom_seq=chrom_seq)
-            except FragmentError as e:
-                frag_id = 'The fragment {}:{}-{}'.format(chrom, frag_start, frag_stop)
-                print(str(e).format(frag_id), file=sys.stderr)
-                continue
+        print('Generating oligos...')
+        chrom, frag_starts, frag_stops = self._tiled_fragments(chrom, region,
+                                                               enzyme)
+        chunks = [(chrom, x, y) for x, y in zip(
+            np.array_split(frag_starts, jobs), np.array_split(frag_stops, jobs))]
+        self._run_chunks('_tiled_chunk', chunks, jobs)
                 
         print('\t...complete.')
         if __name__ != '__main__':
@@ -227,7 +301,112 @@ class Tiled(Tools, FragmentMixin):
         
         return self
     
-    def gen_oligos_contig(self, chrom, region='', step=70, oligo=70):
+    def iter_oligos_capture(self, chrom, region='', enzyme='DpnII', oligo=70,
+                            batch_size=100000):
+        """Streaming version of `gen_oligos_capture`: oligos are yielded as
+        (key, sequence) records instead of being stored in the `oligo_seqs`
+        attribute. Pass the result to `write_fasta` to write a design of any
+        size without holding it in memory.
+        
+        Parameters
+        ----------
+        chrom : str
+            Chromosome number/letter e.g. 7 or X
+        region : str, optional
+            The region of the chromosome to design oligos, e.g.
+            10000-20000; omit this option to design oligos over the
+            entire chromosome
+        enzyme : str, optional
+            The enzyme for digestion, any key of `enzymes.recognition_seq`,
+            default=DpnII
+        oligo : int, optional
+            The length of the oligos to design (bp), default=70
+        batch_size : int, optional
+            The number of fragments converted to records at a time,
+            default=100000
+            
+        Returns
+        -------
+        generator
+            (key, sequence) records
+    
+        """
+        
+        _check_value((oligo,), ('Oligo size',))
+        self.oligo = oligo
+        chrom, frag_starts, frag_stops = self._tiled_fragments(chrom, region,
+                                                               enzyme)
+        
+        def records():
+            for i in range(0, len(frag_starts), batch_size):
+                table = self._tiled_table(chrom, frag_starts[i:i + batch_size],
+                                          frag_stops[i:i + batch_size])
+                for record in table.items():
+                    yield record
+        
+        return records()
+    
+    def _region(self, chrom, region):
+        """Returns the chromosome name and the start and stop of `region`
+        on it (the whole chromosome if `region` is empty)
+        
+        """
+        
+        if not str(chrom).startswith('chr'): chrom = ''.join(('chr'+str(chrom)))
+        start, stop = (0, self.genome_seq.length(chrom)) if not region else map(
+            int, region.split('-'))
+        
+        return chrom, start, min(stop, self.genome_seq.length(chrom))
+    
+    def _tiled_fragments(self, chrom, region, enzyme):
+        """Finds the restriction fragments across a region (or the whole
+        chromosome) that are large enough to design oligos in. Returns the
+        chromosome name and the fragment starts and stops.
+        
+        """
+        
+        chrom, start, stop = self._region(chrom, region)
+        
+        cut_size = len(recognition_seq[enzyme])
+        cut_sites = self._cut_site_index(enzyme)
+        with self.run_report.stage('cut_sites') as stage:
+            cut_sites = cut_sites.in_range(chrom, start, stop)
+            stage['items'] = len(cut_sites)
+        
+        frag_starts = cut_sites[:-1].astype(np.int64)
+        frag_stops = cut_sites[1:].astype(np.int64) + cut_size
+        too_small = (frag_stops - frag_starts) < self.oligo
+        for frag_start, frag_stop in zip(frag_starts[too_small],
+                                         frag_stops[too_small]):
+            print('The fragment {}:{}-{} is too small to design oligos in. '
+                  'Skipping.'.format(chrom, frag_start, frag_stop),
+                  file=sys.stderr)
+        
+        return chrom, frag_starts[~too_small], frag_stops[~too_small]
+    
+    def _tiled_table(self, chrom, frag_starts, frag_stops):
+        """Returns the `OligoTable` of a run of adjacent fragments, reading
+        the sequence they span from the genome in one go
+        
+        """
+        
+        if not len(frag_starts):
+            return OligoTable(self.oligo)
+        start = int(frag_starts[0])
+        chrom_seq = self.genome_seq.fetch_array(chrom, start,
+                                                int(frag_stops[-1]), upper=True)
+        
+        return self._fragment_table(chrom, frag_starts, frag_stops, chrom_seq,
+                                    start)
+    
+    def _tiled_chunk(self, chrom, frag_starts, frag_stops):
+        
+        self.oligo_seqs.extend(self._tiled_table(chrom, frag_starts,
+                                                 frag_stops))
+        
+        return None
+    
+    def gen_oligos_contig(self, chrom, region='', step=70, oligo=70, jobs=1):
         """Designs adjacent oligos based on a user-defined step size,
         across a specified region of a chromosome, or for the entire
         chromosome.
@@ -239,38 +418,44 @@ class Tiled(Tools, FragmentMixin):
         region : str, optional
             The region of the chromosome to design oligos, e.g.
             10000-20000; omit this option to design oligos over the
+            entire chromosome
         step : int, optional
             The step size, or how close adjacent oligos should be, default=70;
             for end-to-end oligos, set `step` to equal `oligo`
         oligo : int, optional
             The length of the oligos to design (bp), default=70
+        jobs : int, optional
+            The number of processes to design oligos in; the region is split
+            into this many sub-regions, default=1
             
         Raises
         ------
         ValueError
-            If `step` or `oligo` <1 or not an integer
+            If `step`, `oligo` or `jobs` <1 or not an integer
             
         Returns
         -------
         self : object
         
+        See Also
+        --------
+        iter_oligos_contig : streaming version for very large regions
+        
         """
         
-        _check_value((step, oligo), ('Step size', 'Oligo size'))
+        _check_value((step, oligo, jobs),
+                     ('Step size', 'Oligo size', 'Number of jobs'))
         self._create_attr(oligo)
-        
-        if not chrom.startswith('chr'): chrom = ''.join(('chr'+str(chrom)))
-        chrom_seq = self.genome_seq[chrom].seq.upper()
-            
-        start, stop = (0, len(chrom_seq)) if not region else map(
-            int, region.split('-'))
-        stop = stop - oligo
+        chrom, start, stop = self._region(chrom, region)
         
         print('Generating oligos...')
-        coors = [(x, x + oligo) for x in range(start, stop+1, step)]
-        sequences = _get_sequence(chrom_seq, *coors)
-        keys = _create_key(chrom, *coors)
-        self.oligo_seqs.update(zip(keys, sequences))
+        # sub-regions hold whole runs of oligos, so they overlap by
+        # `oligo` - `step` bp
+        n_oligos = max((stop - start - oligo) // step + 1, 0)
+        bounds = [start + step * (n_oligos * i // jobs) for i in range(jobs + 1)]
+        chunks = [(chrom, x, y - step + oligo, step)
+                  for x, y in zip(bounds[:-1], bounds[1:]) if y > x]
+        self._run_chunks('_contig_chunk', chunks, jobs)
         
         print('\t...complete.')
         if __name__ != '__main__':
@@ -278,6 +463,60 @@ class Tiled(Tools, FragmentMixin):
         
         return self
     
+    def iter_oligos_contig(self, chrom, region='', step=70, oligo=70,
+                           batch_size=100000):
+        """Streaming version of `gen_oligos_contig`: oligos are yielded as
+        (key, sequence) records instead of being stored in the `oligo_seqs`
+        attribute. Pass the result to `write_fasta` to write a design of any
+        size without holding it in memory.
+        
+        Parameters
+        ----------
+        chrom : str
+            Chromosome number/letter e.g. 7 or X
+        region : str, optional
+            The region of the chromosome to design oligos, e.g.
+            10000-20000; omit this option to design oligos over the
+            entire chromosome
+        step : int, optional
+            The step size, or how close adjacent oligos should be, default=70;
+            for end-to-end oligos, set `step` to equal `oligo`
+        oligo : int, optional
+            The length of the oligos to design (bp), default=70
+        batch_size : int, optional
+            The number of oligos converted to text at a time, default=100000
+            
+        Raises
+        ------
+        ValueError
+            If `step` or `oligo` <1 or not an integer
+            
+        Returns
+        -------
+        windows.ContigWindows
+            Iterable of (key, sequence) records; the oligos are held as a
+            strided view over the region's sequence, so no per-oligo
+            objects are created until the records are consumed
+        
+        """
+        
+        _check_value((step, oligo), ('Step size', 'Oligo size'))
+        self.oligo = oligo
+        
+        chrom, start, stop = self._region(chrom, region)
+        chrom_seq = self.genome_seq.fetch_array(chrom, start, stop, upper=True)
+        
+        return ContigWindows(chrom, chrom_seq, start, oligo, step,
+                             batch_size=batch_size)
+    
+    def _contig_chunk(self, chrom, start, stop, step):
+        
+        chrom_seq = self.genome_seq.fetch_array(chrom, start, stop, upper=True)
+        windows = ContigWindows(chrom, chrom_seq, start, self.oligo, step)
+        self.oligo_seqs.append(chrom, windows.starts, windows.windows)
+        
+        return None
+    
     def __str__(self):
         
         return 'Tiled Capture oligo design object for the {} genome'.format(
@@ -288,7 +527,7 @@ class OffTarget(Tools):
     
     __doc__ += Tools.__doc__
     
-    def gen_oligos(self, bed, oligo=70, step=10, max_dist=200):
+    def gen_oligos(self, bed, oligo=70, step=10, max_dist=200, jobs=1):
         r"""Designs oligos adjacent to user-supplied coordinates for
         potential CRISPR off-target cleavage sites
         
@@ -306,6 +545,9 @@ class OffTarget(Tools):
         max_dist : int, optional
             The maximum distance away from the off-target site to design
             oligos to, default = 200
+        jobs : int, optional
+            The number of processes to design oligos in, one chromosome at
+            a time, default = 1
         
         Returns
         -------
@@ -313,40 +555,16 @@ class OffTarget(Tools):
         
         """
         
-        _check_value((step, oligo, max_dist),
-                    ('Step size', 'Oligo size', 'Maximum distance'))
+        _check_value((step, oligo, max_dist, jobs),
+                    ('Step size', 'Oligo size', 'Maximum distance',
+                     'Number of jobs'))
         self._create_attr(oligo)
     
-        valid_chroms = _compile_chr_regex(self.genome)
         print('Generating oligos...')
-        with open(bed) as crispr_sites:
-            for site in crispr_sites:
-                chrom, start, stop, name = site.strip().split('\t')
-                
-                try:
-                    _validate_chrom(chrom, valid_chroms)
-                except ChromosomeError as e:
-                    print(str(e).format(chrom), file=sys.stderr)
-                    continue
-                  
-                start, stop = map(int, (start, stop))
-                chrom_seq = self.genome_seq[chrom].seq.upper()
-                chrom_length = len(chrom_seq)
-                
-                exc_start = start-10
-                exc_stop = stop+10
-                
-                upstream = [(x-oligo, x) for x in
-                    range(start-max_dist+oligo, exc_start+1, step)
-                    if x-oligo>=0]
-                downstream = [(x, x+oligo) for x in
-                    range(exc_stop, stop+max_dist-oligo+1, step)
-                    if x+oligo<=chrom_length]
-                all_coors = upstream+downstream
-                sequences = _get_sequence(chrom_seq, *all_coors)
-                keys = list(_create_key(chrom, *all_coors))
-                self.oligo_seqs.update(zip(keys, sequences))
-                self._assoc.update({x[:-10]: name for x in keys})
+        sites = _filter_chroms(_read_bed(bed), self.genome)
+        chunks = [(chrom, chrom_sites, step, max_dist) for chrom, chrom_sites
+                  in _by_chrom(sites, self.genome_seq)]
+        self._run_chunks('_offtarget_chunk', chunks, jobs)
         
         print('\t...complete.')
         if __name__ != '__main__':
@@ -354,13 +572,298 @@ class OffTarget(Tools):
         
         return self
     
+    def _offtarget_chunk(self, chrom, chrom_sites, step, max_dist):
+        """Designs the oligos for the off-target sites on one chromosome"""
+        
+        oligo = self.oligo
+        chrom_seq = self.genome_seq.fetch_array(chrom, upper=True)
+        chrom_length = len(chrom_seq)
+        
+        # oligo starts relative to the site start (upstream) and stop
+        # (downstream) are the same for every site
+        upstream = np.arange(oligo - max_dist, -9, step) - oligo
+        downstream = np.arange(10, max_dist - oligo + 1, step)
+        starts = np.hstack((
+            chrom_sites['start'].values[:, None] + upstream,
+            chrom_sites['stop'].values[:, None] + downstream)).astype(np.int64)
+        names = np.repeat(chrom_sites['name'].values, starts.shape[1])
+        starts = starts.ravel()
+        in_chrom = (starts >= 0) & (starts + oligo <= chrom_length)
+        starts, names = starts[in_chrom], names[in_chrom]
+        
+        # sites close together can share oligos; keep the first
+        # position of each, but the name of the last site
+        unique_starts, first = np.unique(starts, return_index=True)
+        self.oligo_seqs.append(
+            chrom, starts[np.sort(first)],
+            strided_windows(chrom_seq, oligo, 1)[starts[np.sort(first)]])
+        last = len(starts) - 1 - np.unique(starts[::-1], return_index=True)[1]
+        keys = oligo_names(chrom, unique_starts, oligo, suffix=b'')
+        self._assoc.update(zip(keys, names[last]))
+        
+        return None
+    
     def __str__(self):
         
         return 'OffTarget Capture oligo design object for the {} genome'.format(
             self.genome)
 
+def read_manifest(path):
+    """Reads a tab-delimited batch manifest into a list of jobs for
+    `Batch.run`
+    
+    The first line names the columns. `design` (Capture, Tiled or
+    OffTarget) and `output` (the directory the job's files are written to)
+    are required; any other column is a keyword argument of the design's
+    oligo generating method (e.g. bed, chrom, region, enzyme, oligo, step,
+    max_dist), `contig` (true or false) to run a Tiled design in
+    contiguous mode, or `previous`, the oligo_info file of a previous
+    design (see `Tools.load_oligo_info`). Empty cells take the method's
+    default, and lines starting with '#' are ignored. Relative paths in
+    the output, bed and previous columns are relative to the manifest.
+    
+    """
+    
+    manifest = pd.read_table(path, dtype=str, keep_default_na=False,
+                             comment='#')
+    missing = {'design', 'output'}.difference(manifest.columns)
+    if missing:
+        raise ValueError('The manifest {} has no {} column'.format(
+            path, ' or '.join(sorted(missing))))
+    base = os.path.dirname(os.path.abspath(path))
+    
+    jobs = []
+    for row in manifest.to_dict('records'):
+        job = dict((k, v.strip()) for k, v in row.items() if v.strip())
+        for key in ('output', 'bed', 'previous'):
+            if key in job:
+                job[key] = os.path.join(base, job[key])
+        for key in ('oligo', 'step', 'max_dist'):
+            if key in job:
+                job[key] = int(job[key])
+        if 'contig' in job:
+            job['contig'] = job['contig'].lower() in ('true', 'yes', '1')
+        jobs.append(job)
+    
+    return jobs
+
+@contextlib.contextmanager
+def _working_dir(path):
+    """Context manager that runs its body in directory `path`, creating it
+    if needed
+    
+    """
+    
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+
+class Batch(object):
+    """Runs many designs, of any of the design classes, against one
+    reference genome
+    
+    The genome is opened once for the whole batch, and the cut sites of
+    each enzyme are loaded once, the first time a design uses them; every
+    design shares both. With STAR, the index is loaded into shared memory
+    before the first alignment and used by all of them. Each job runs the
+    full pipeline (oligos, fasta, repeats, off-target alignment and oligo
+    information) in its own output directory.
+    
+    Parameters
+    ----------
+    genome : {'mm9', 'mm10', 'hg18', 'hg19', 'hg38'}
+        Genome build
+    fa : str
+        Path to reference genome fasta
+    **options
+        Keyword arguments of `Tools` (blat, threads, shared_memory,
+        seed_index, mismatches, soft_mask, cache) used for every design
+    
+    Attributes
+    ----------
+    genome_seq : Genome
+        Indexed reference genome shared by the designs
+    cut_sites : dict
+        The `cutsites.CutSiteIndex` of each recognition sequence used by
+        the designs, keyed by sequence
+    run_report : runreport.RunReport
+        The genome load and, under 'job', the wall time, CPU time and
+        oligos of each job; the stages of each job are in the run report
+        of its design
+    
+    """
+    
+    classes = {'Capture': Capture, 'Tiled': Tiled, 'OffTarget': OffTarget}
+    
+    def __init__(self, genome, fa, **options):
+        self.genome = genome
+        # jobs run in their own directories, so paths must be absolute
+        self.fa = os.path.abspath(fa)
+        if options.get('cache'):
+            options['cache'] = os.path.abspath(options['cache'])
+        self.options = options
+        self.cut_sites = {}
+        self.run_report = RunReport()
+        print('Loading reference fasta file...')
+        with self.run_report.stage('genome_load') as stage:
+            self.genome_seq = Genome(self.fa)
+            stage['items'] = len(self.genome_seq)
+        print('\t...complete')
+    
+    def design(self, job, jobs=1):
+        """Creates the design object of a job, sharing the genome and cut
+        sites of the batch, and generates its oligos
+        
+        Parameters
+        ----------
+        job : dict
+            The design class name (key 'design') and keyword arguments of
+            its oligo generating method; for Tiled, 'contig' = True runs
+            `gen_oligos_contig` instead of `gen_oligos_capture`. The
+            'output' and 'previous' keys of `Batch.run` jobs are ignored
+        jobs : int, optional
+            The number of processes to design oligos in, default = 1
+        
+        Returns
+        -------
+        Capture, Tiled or OffTarget
+        
+        """
+        
+        kwargs = dict(job)
+        name = kwargs.pop('design')
+        if name not in self.classes:
+            raise ValueError('{} is not a recognised design, choose from one '
+                             'of the following: {}'.format(
+                                 name, ', '.join(sorted(self.classes))))
+        for key in ('output', 'previous'):
+            kwargs.pop(key, None)
+        
+        c = self.classes[name](self.genome, self.fa,
+                               genome_seq=self.genome_seq, **self.options)
+        c.cut_sites = self.cut_sites
+        if name != 'Tiled':
+            c.gen_oligos(jobs=jobs, **kwargs)
+        elif kwargs.pop('contig', False):
+            c.gen_oligos_contig(jobs=jobs, **kwargs)
+        else:
+            c.gen_oligos_capture(jobs=jobs, **kwargs)
+        
+        return c
+    
+    def run(self, jobs, s_idx='', output='oligo_info.txt', processes=1,
+            max_kmer_count=None, mean_kmer_count=None, kmer_size=17,
+            remove_index=None, report=None, fasta_only=False):
+        """Runs the pipeline of every job, one after another
+        
+        Parameters
+        ----------
+        jobs : list of dict
+            The design class name (key 'design'), output directory
+            ('output') and keyword arguments of the oligo generating method
+            of each design, as for `design`, and optionally the oligo_info
+            file of a previous design ('previous'); see `read_manifest`
+        s_idx : str, optional
+            Path to the directory containing the STAR index for this
+            genome; not needed with `blat` or `seed_index`
+        output : str, optional
+            Name of the oligo information file written to each output
+            directory, default = oligo_info.txt
+        processes : int, optional
+            The number of processes each design generates oligos in,
+            default = 1
+        max_kmer_count, mean_kmer_count : int or float, optional
+            Remove oligos with common k-mers before checking them, see
+            `Tools.filter_kmers`; default = None (no filter)
+        kmer_size : int, optional
+            The k-mer length (bp) of the filter, default = 17
+        remove_index : bool, optional
+            Remove the STAR index from shared memory after the last
+            alignment; default = True unless `shared_memory` = True
+        report : str, optional
+            Name of the JSON run report (see `runreport.RunReport`) written
+            to each output directory, default = None (no report)
+        fasta_only : bool, optional
+            Stop each job once its fasta is written, default = False
+        
+        Returns
+        -------
+        self : object
+        
+        """
+        
+        jobs = [dict(x) for x in jobs]
+        for job in jobs:
+            if 'output' not in job:
+                raise ValueError('Every job needs an output directory')
+            for key in ('output', 'bed', 'previous'):
+                if key in job:
+                    job[key] = os.path.abspath(job[key])
+        
+        star = not (fasta_only or self.options.get('blat') or
+                    self.options.get('seed_index'))
+        shared_memory = self.options.get('shared_memory', False)
+        if remove_index is None:
+            remove_index = not shared_memory
+        tools = Tools(self.genome, self.fa, **self.options)
+        if star:
+            if not s_idx:
+                raise AttributeError('Path to STAR index must be set if '
+                                     'blat=False')
+            s_idx = os.path.abspath(s_idx)
+            tools.load_star_index(s_idx)
+            self.options['shared_memory'] = True
+        try:
+            for i, job in enumerate(jobs, 1):
+                print('Job {} of {}: {} design in {}'.format(
+                    i, len(jobs), job['design'], job['output']))
+                with self.run_report.stage('job') as stage:
+                    stage['items'] = self._run_job(
+                        job, s_idx, output, processes, max_kmer_count,
+                        mean_kmer_count, kmer_size, report, fasta_only)
+        finally:
+            self.options['shared_memory'] = shared_memory
+            if star and remove_index:
+                tools.remove_star_index(s_idx)
+        
+        return self
+    
+    def _run_job(self, job, s_idx, output, processes, max_kmer_count,
+                 mean_kmer_count, kmer_size, report, fasta_only):
+        """Runs the pipeline of one job in its output directory and returns
+        the number of oligos it designed
+        
+        """
+        
+        c = self.design(job, processes)
+        with _working_dir(job['output']):
+            try:
+                if max_kmer_count is not None or mean_kmer_count is not None:
+                    c.filter_kmers(max_kmer_count, mean_kmer_count, kmer_size)
+                c.write_fasta()
+                if not fasta_only:
+                    if 'previous' in job:
+                        c.load_oligo_info(job['previous'])
+                    c.detect_repeats_and_align(s_idx=s_idx)
+                    c.extract_repeats().calculate_density().write_oligo_info(
+                        output)
+            finally:
+                if report:
+                    c.run_report.write(report)
+        
+        return len(c.oligo_seqs)
+    
+    def __repr__(self):
+        
+        return 'Batch(genome={}, fa={})'.format(self.genome, self.fa)
+
 if __name__ == '__main__':
-    classes = ('Capture', 'Tiled', 'OffTarget')
+    classes = ('Capture', 'Tiled', 'OffTarget', 'Batch')
     try:
         class_arg = sys.argv[1]
         if class_arg not in classes:
@@ -402,7 +905,7 @@ if __name__ == '__main__':
             '-e',
             '--enzyme',
             type = str,
-            choices = ['DpnII', 'NlaIII', 'HindIII'],
+            choices = sorted(recognition_seq),
             help = 'Name of restriction enzyme, default=DpnII',
             default = 'DpnII',
             required = False,
@@ -434,12 +937,21 @@ if __name__ == '__main__':
             '-e',
             '--enzyme',
             type = str,
-            choices = ['DpnII', 'NlaIII', 'HindIII'],
+            choices = sorted(recognition_seq),
             help = 'Name of restriction enzyme, default=DpnII. Omit this ' \
                    'option if running in contiguous mode (--contig)',
             default = 'DpnII',
             required = False,
         )
+        parser.add_argument(
+            '--stream',
+            action = 'store_true',
+            help = 'Write oligos straight to the fasta file as they are ' \
+                   'generated, instead of holding them all in memory. ' \
+                   'Streamed designs run in a single process (-j/--jobs ' \
+                   'is ignored).',
+            required = False,
+        )
         parser.add_argument(
             '-t',
             '--step_size',
@@ -450,6 +962,18 @@ if __name__ == '__main__':
             default = 70,
             required = False,
         )
+    elif class_arg == 'Batch':
+        parser.add_argument(
+            '-m',
+            '--manifest',
+            type = str,
+            help = 'Path to tab-delimited manifest of the designs to run, ' \
+                   'with a design (Capture, Tiled or OffTarget) and output ' \
+                   '(directory) column and a column for each of their ' \
+                   'other options e.g. bed, chrom, region, contig, enzyme, ' \
+                   'oligo, step, max_dist, previous',
+            required = True,
+        )
     elif class_arg == 'OffTarget':
         parser.add_argument(
             '-b',
@@ -476,20 +1000,28 @@ if __name__ == '__main__':
             required = False,
         )
     
-    parser.add_argument(
-        '-o',
-        '--oligo',
-        type = int,
-        help = 'The size (in bp) of the oligo to design, default=70',
-        default = 70,
-        required = False,
-    )
+    if class_arg != 'Batch':
+        parser.add_argument(
+            '-o',
+            '--oligo',
+            type = int,
+            help = 'The size (in bp) of the oligo to design, default=70',
+            default = 70,
+            required = False,
+        )
+        parser.add_argument(
+            '--previous',
+            type = str,
+            help = 'oligo_info file of a previous design; oligos it already ' \
+                   'scored are not checked for repeats or aligned again',
+            required = False,
+        )
     parser.add_argument(
         '-s',
         '--star_index',
         type = str,
         help = 'Path to STAR index directory. Omit this option if running ' \
-               'with BLAT (--blat)',
+               'with BLAT (--blat) or a seed index (--seed_index)',
         required = False,
     )
     parser.add_argument(
@@ -498,6 +1030,110 @@ if __name__ == '__main__':
         help = 'Detect off-targets using BLAT instead of STAR.',
         required = False,
     )
+    parser.add_argument(
+        '--threads',
+        type = int,
+        help = 'Number of threads STAR aligns with, or processes the seed ' \
+               'index searches in, default=4',
+        default = 4,
+        required = False,
+    )
+    parser.add_argument(
+        '--shared_memory',
+        action = 'store_true',
+        help = 'Align with the STAR index held in shared memory, loading ' \
+               'it if needed; it stays loaded for later runs on the same ' \
+               'machine until a run with --remove_index.',
+        required = False,
+    )
+    parser.add_argument(
+        '--remove_index',
+        action = 'store_true',
+        help = 'Remove the STAR index from shared memory when the ' \
+               'pipeline finishes.',
+        required = False,
+    )
+    parser.add_argument(
+        '--seed_index',
+        action = 'store_true',
+        help = 'Count off-target hits with a seed index of the reference ' \
+               'genome, built on first use, instead of STAR or BLAT.',
+        required = False,
+    )
+    parser.add_argument(
+        '--mismatches',
+        type = int,
+        help = 'The most mismatches an off-target hit can have with ' \
+               '--seed_index, default=2',
+        default = 2,
+        required = False,
+    )
+    parser.add_argument(
+        '--soft_mask',
+        action = 'store_true',
+        help = 'Take repeats from the soft-masked (lower case) bases of ' \
+               'the reference fasta instead of running RepeatMasker.',
+        required = False,
+    )
+    parser.add_argument(
+        '--cache',
+        type = str,
+        help = 'SQLite file of repeat and alignment results, reused for ' \
+               'oligos checked by earlier runs and updated with this one',
+        required = False,
+    )
+    parser.add_argument(
+        '--max_kmer_count',
+        type = int,
+        help = 'Remove oligos with any k-mer that occurs more than this ' \
+               'many times in the genome before checking repeats and ' \
+               'off-target binding',
+        required = False,
+    )
+    parser.add_argument(
+        '--mean_kmer_count',
+        type = float,
+        help = 'Remove oligos whose k-mers occur more than this many ' \
+               'times in the genome on average before checking repeats ' \
+               'and off-target binding',
+        required = False,
+    )
+    parser.add_argument(
+        '--kmer_size',
+        type = int,
+        help = 'The k-mer length (bp) used by --max_kmer_count and ' \
+               '--mean_kmer_count, default=17',
+        default = 17,
+        required = False,
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type = int,
+        help = 'Number of processes to design oligos in, default=1',
+        default = 1,
+        required = False,
+    )
+    parser.add_argument(
+        '--output',
+        type = str,
+        help = 'Name of the oligo information file (in each output ' \
+               'directory with Batch); names ending in .gz are ' \
+               'gzip-compressed and names ending in .parquet are written ' \
+               'as Parquet (requires pyarrow or fastparquet), ' \
+               'default=oligo_info.txt',
+        default = 'oligo_info.txt',
+        required = False,
+    )
+    parser.add_argument(
+        '--report',
+        type = str,
+        help = 'Write the wall time, CPU time, peak memory and item ' \
+               'count of each stage of the run to this JSON file; with ' \
+               'Batch, each job\'s stages are written to a file of this ' \
+               'name in its output directory',
+        required = False,
+    )
     parser.add_argument(
         '--test_fasta',
         action = 'store_true',
@@ -506,46 +1142,93 @@ if __name__ == '__main__':
     )
     
     args = parser.parse_args(sys.argv[2:])
+    records = None
     
-    if not args.blat and not args.star_index:
-        msg = '-s/--star_index argument is required if --blat is not selected'
+    if not (args.blat or args.seed_index or args.star_index):
+        msg = '-s/--star_index argument is required if --blat or ' \
+              '--seed_index is not selected'
         parser.error(msg)
+    if args.blat and args.seed_index:
+        parser.error('--blat and --seed_index cannot be used together')
+    if (args.blat or args.seed_index) and (args.shared_memory or
+                                           args.remove_index):
+        parser.error('--shared_memory and --remove_index are only used with '
+                     'STAR, not --blat or --seed_index')
+    
+    kmer_filter = (args.max_kmer_count is not None or
+                   args.mean_kmer_count is not None)
+    if kmer_filter and getattr(args, 'stream', False):
+        parser.error('--max_kmer_count and --mean_kmer_count cannot be used '
+                     'with --stream')
     
-    if class_arg == 'Capture':
-        c = Capture(genome=args.genome, fa=args.fasta, blat=args.blat)
+    options = dict(genome=args.genome, fa=args.fasta, blat=args.blat,
+                   threads=args.threads, shared_memory=args.shared_memory,
+                   seed_index=args.seed_index, mismatches=args.mismatches,
+                   soft_mask=args.soft_mask, cache=args.cache)
+    if class_arg == 'Batch':
+        batch = Batch(**options)
+        try:
+            batch.run(
+                read_manifest(args.manifest),
+                s_idx = args.star_index,
+                output = args.output,
+                processes = args.jobs,
+                max_kmer_count = args.max_kmer_count,
+                mean_kmer_count = args.mean_kmer_count,
+                kmer_size = args.kmer_size,
+                remove_index = args.remove_index or not args.shared_memory,
+                report = args.report,
+                fasta_only = args.test_fasta,
+            )
+        finally:
+            if args.report:
+                batch.run_report.write(args.report)
+        sys.exit()
+    elif class_arg == 'Capture':
+        c = Capture(**options)
         c.gen_oligos(
             bed = args.bed,
             enzyme = args.enzyme,
             oligo = args.oligo,
+            jobs = args.jobs,
         )
     elif class_arg == 'Tiled':
-        c = Tiled(genome=args.genome, fa=args.fasta, blat=args.blat)
+        c = Tiled(**options)
         if args.contig:
-            c.gen_oligos_contig(
-                chrom = args.chr,
-                region = args.region,
-                step = args.step_size,
-                oligo = args.oligo
-            )
+            mode, kwargs = 'oligos_contig', {'step': args.step_size}
         else:
-            c.gen_oligos_capture(
-                chrom = args.chr,
-                region = args.region,
-                enzyme = args.enzyme,
-                oligo = args.oligo
-            )
+            mode, kwargs = 'oligos_capture', {'enzyme': args.enzyme}
+        kwargs.update(chrom=args.chr, region=args.region, oligo=args.oligo)
+        if args.stream:
+            records = getattr(c, 'iter_' + mode)(**kwargs)
+        else:
+            getattr(c, 'gen_' + mode)(jobs=args.jobs, **kwargs)
     elif class_arg == 'OffTarget':
-        c = OffTarget(genome=args.genome, fa=args.fasta, blat=args.blat)
+        c = OffTarget(**options)
         c.gen_oligos(
             bed = args.bed,
             step = args.step_size,
             max_dist = args.max_dist,
             oligo = args.oligo,
+            jobs = args.jobs,
         )
         
-    c.write_fasta()
-    if not args.test_fasta:    
-        c.detect_repeats().align_to_genome(s_idx=args.star_index)
-        c.extract_repeats().calculate_density().write_oligo_info()
-    
-
+    try:
+        if kmer_filter:
+            c.filter_kmers(args.max_kmer_count, args.mean_kmer_count,
+                           args.kmer_size)
+        c.write_fasta(records)
+        if not args.test_fasta:
+            if args.previous:
+                c.load_oligo_info(args.previous)
+            try:
+                c.detect_repeats_and_align(s_idx=args.star_index)
+            finally:
+                if args.remove_index:
+                    c.remove_star_index(args.star_index)
+            c.extract_repeats().calculate_density().write_oligo_info(
+                args.output)
+    finally:
+        # written for failed runs too, to show how far they got
+        if args.report:
+            c.run_report.write(args.report)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import numpy as np  # >=1.7
+
+iupac = {'A': 'A', 'C': 'C', 'G': 'G', 'T': 'T',
+         'R': 'AG', 'Y': 'CT', 'S': 'CG', 'W': 'AT', 'K': 'GT', 'M': 'AC',
+         'B': 'CGT', 'D': 'AGT', 'H': 'ACT', 'V': 'ACG',
+         'N': 'ACGT'}
+
+recognition_seq = {'DpnII': 'GATC',
+                   'MboI': 'GATC',
+                   'Sau3AI': 'GATC',
+                   'NlaIII': 'CATG',
+                   'CviAII': 'CATG',
+                   'HindIII': 'AAGCTT',
+                   'Csp6I': 'GTAC',
+                   'CviQI': 'GTAC',
+                   'MseI': 'TTAA',
+                   'EcoRI': 'GAATTC',
+                   'BglII': 'AGATCT',
+                   'NcoI': 'CCATGG',
+                   'HinfI': 'GANTC',
+                   'DdeI': 'CTNAG',
+                   'AvaII': 'GGWCC',
+                   'StyI': 'CCWWGG',
+                   'BsaJI': 'CCNNGG',
+                   'ApoI': 'RAATTY'}
+
+def register_enzyme(name, site):
+    """Adds a restriction enzyme to the `recognition_seq` registry
+
+    Parameters
+    ----------
+    name : str
+        Name of the enzyme, as it will be passed to the design methods
+    site : str
+        Recognition sequence; may contain IUPAC degenerate bases
+
+    Raises
+    ------
+    ValueError
+        If `site` is empty or contains letters that are not IUPAC bases
+
+    """
+
+    site = _validate_site(site)
+    recognition_seq[name] = site
+
+    return None
+
+def find_sites(seq, site, chunk_size=2**24, n_anchors=3):
+    """Finds the start coordinate of every match to a recognition sequence
+
+    The sequence is scanned as a uint8 array. The `n_anchors` most specific
+    bases of `site` are tested across the sequence with vectorized
+    comparisons (case-folded by setting the 0x20 bit), then the remaining
+    bases are checked only at the surviving candidate positions, through a
+    256-entry lookup table of the bytes each accepts. The scan runs over
+    chunks of `chunk_size` bp so that temporary arrays stay small.
+    Overlapping matches, which are possible for some degenerate sites, are
+    all reported.
+
+    Parameters
+    ----------
+    seq : numpy.ndarray, bytes or str
+        DNA sequence; arrays must be uint8 ASCII codes, e.g. from
+        `Genome.fetch_array`
+    site : str
+        Recognition sequence; may contain IUPAC degenerate bases
+    chunk_size : int, optional
+        Number of positions tested at a time, default = 2**24
+    n_anchors : int, optional
+        Number of bases tested with whole-chunk comparisons, default = 3
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted 0-based start coordinates (int64)
+
+    """
+
+    site = _validate_site(site)
+    if not isinstance(seq, np.ndarray):
+        if not isinstance(seq, bytes): seq = seq.encode('ascii')
+        seq = np.frombuffer(seq, dtype=np.uint8)
+
+    # the most specific bases are tested on whole chunks with vectorized
+    # comparisons; the rest are looked up at the surviving candidates only
+    order = sorted(range(len(site)), key=lambda i: len(iupac[site[i]]))
+    anchors = [(i, [ord(x.lower()) for x in iupac[site[i]]])
+               for i in order[:n_anchors]]
+    tables = [(i, _lookup_table(site[i])) for i in order[n_anchors:]]
+    n_pos = len(seq) - len(site) + 1
+    hits = [np.zeros(0, dtype=np.int64)]
+    for chunk_start in range(0, max(n_pos, 0), chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, n_pos)
+        n_chunk = chunk_stop - chunk_start
+        folded = seq[chunk_start:chunk_stop + len(site) - 1] | 0x20
+        match = np.ones(n_chunk, dtype=bool)
+        for i, codes in anchors:
+            base_match = folded[i:i + n_chunk] == codes[0]
+            for code in codes[1:]:
+                base_match |= folded[i:i + n_chunk] == code
+            match &= base_match
+        candidates = np.flatnonzero(match) + chunk_start
+        for i, table in tables:
+            candidates = candidates[table[seq[candidates + i]]]
+        hits.append(candidates)
+
+    return np.concatenate(hits)
+
+def _lookup_table(base):
+    """Returns a boolean array, indexed by ASCII code, of the nucleotides
+    accepted by an IUPAC base
+
+    """
+
+    table = np.zeros(256, dtype=bool)
+    for nuc in iupac[base]:
+        table[ord(nuc)] = table[ord(nuc.lower())] = True
+
+    return table
+
+def _validate_site(site):
+    site = site.upper()
+    if not site or any(x not in iupac for x in site):
+        raise ValueError('{} is not a valid recognition sequence; use IUPAC '
+                         'bases only'.format(site))
+
+    return site
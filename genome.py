@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import hashlib
+import os
+
+import numpy as np  # >=1.7
+import pysam  # >=0.8
+
+# blocks of the fasta read into its checksum, and their size (bytes)
+SAMPLE_BLOCKS = 256
+SAMPLE_SIZE = 4096
+
+class Genome(object):
+    """Lazy, indexed access to a reference genome fasta
+
+    Only the fasta index (.fai) is read when the object is created; it is
+    built alongside the fasta if it does not already exist. Chromosome
+    sequences, or sub-ranges of them, are read from disk on request, so
+    memory use depends on the chromosomes a design touches rather than on
+    the size of the genome.
+
+    Parameters
+    ----------
+    fa : str
+        Path to reference genome fasta
+
+    Attributes
+    ----------
+    lengths : dict
+        Length (bp) of every chromosome in the fasta, keyed by name
+
+    """
+
+    def __init__(self, fa):
+        self.fa = fa
+        if not os.path.exists(self.index):
+            print('\tIndexing {}...'.format(fa))
+        self._fasta = pysam.FastaFile(fa)  # builds the .fai if missing
+        self.lengths = dict(zip(self._fasta.references, self._fasta.lengths))
+        self._layout = {}
+        with open(self.index) as fai:
+            for line in fai:
+                name, _, offset, line_bases, line_width = line.split('\t')[:5]
+                self._layout[name] = tuple(map(int, (offset, line_bases,
+                                                     line_width)))
+        self._buffer = None
+        self._checksum = None
+
+    @property
+    def index(self):
+        """Path to the fasta index (.fai)"""
+
+        return ''.join((self.fa, '.fai'))
+
+    @property
+    def checksum(self):
+        """SHA-1 digest (hex) of this fasta
+
+        Computed from the fasta index, the size of the fasta and
+        `SAMPLE_BLOCKS` blocks of its raw contents spread evenly over the
+        file (the whole file, if it is smaller), so it is cheap to obtain
+        for a large genome and changes whenever chromosomes are added,
+        removed or resized, or their bases or masking differ in a sampled
+        block, e.g. between soft- and hard-masked copies of a build.
+
+        """
+
+        if self._checksum is None:
+            digest = hashlib.sha1()
+            with open(self.index, 'rb') as fai:
+                digest.update(fai.read())
+            size = os.path.getsize(self.fa)
+            digest.update(str(size).encode())
+            with open(self.fa, 'rb') as fa:
+                if size <= SAMPLE_BLOCKS * SAMPLE_SIZE:
+                    digest.update(fa.read())
+                else:
+                    for offset in np.linspace(0, size - SAMPLE_SIZE,
+                                              SAMPLE_BLOCKS).astype(np.int64):
+                        fa.seek(int(offset))
+                        digest.update(fa.read(SAMPLE_SIZE))
+            self._checksum = digest.hexdigest()
+
+        return self._checksum
+
+    @property
+    def fingerprint(self):
+        """Short digest identifying this fasta, used to name the
+        directories of on-disk indexes: the start of `checksum`
+
+        """
+
+        return self.checksum[:16]
+
+    def fetch(self, chrom, start=0, stop=None, upper=True):
+        """Reads a chromosome, or a sub-range of it, from the fasta;
+        coordinates beyond either end of the chromosome are clipped to it
+
+        Parameters
+        ----------
+        chrom : str
+            Chromosome name, as it appears in the fasta
+        start : int, optional
+            0-based start coordinate, default = 0
+        stop : int, optional
+            0-based, exclusive stop coordinate; omit to read to the end of
+            the chromosome
+        upper : bool, optional
+            Convert the sequence to upper case, default = True
+
+        Returns
+        -------
+        str
+
+        Raises
+        ------
+        KeyError
+            If `chrom` is not in the fasta
+
+        """
+
+        if chrom not in self.lengths:
+            raise KeyError('{} is not in {}'.format(chrom, self.fa))
+        stop = self.lengths[chrom] if stop is None else min(
+            stop, self.lengths[chrom])
+        start = max(start, 0)
+        if stop <= start:
+            return ''
+        seq = self._fasta.fetch(chrom, start, stop)
+
+        return seq.upper() if upper else seq
+
+    def fetch_array(self, chrom, start=0, stop=None, upper=False):
+        """Reads a chromosome, or a sub-range of it, as a uint8 array of
+        ASCII codes; coordinates beyond either end of the chromosome are
+        clipped to it
+
+        The bases are gathered straight from a memory map of the fasta (line
+        breaks removed), so no intermediate `str` is built. Compressed fastas
+        fall back to `fetch`.
+
+        Parameters
+        ----------
+        chrom : str
+            Chromosome name, as it appears in the fasta
+        start : int, optional
+            0-based start coordinate, default = 0
+        stop : int, optional
+            0-based, exclusive stop coordinate; omit to read to the end of
+            the chromosome
+        upper : bool, optional
+            Convert the sequence to upper case, default = False
+
+        Returns
+        -------
+        numpy.ndarray
+
+        """
+
+        if chrom not in self.lengths:
+            raise KeyError('{} is not in {}'.format(chrom, self.fa))
+        stop = self.lengths[chrom] if stop is None else min(
+            stop, self.lengths[chrom])
+        start = max(start, 0)
+        if stop <= start:
+            return np.zeros(0, dtype=np.uint8)
+        if self.fa.endswith('.gz'):
+            seq = self.fetch(chrom, start, stop, upper=upper)
+            return np.frombuffer(seq.encode('ascii'), dtype=np.uint8).copy()
+
+        if self._buffer is None:
+            self._buffer = np.memmap(self.fa, dtype=np.uint8, mode='r')
+        offset, line_bases, line_width = self._layout[chrom]
+        first, last = (offset + (x // line_bases) * line_width + x % line_bases
+                       for x in (start, stop - 1))
+        raw = self._buffer[first:last + 1]
+        if line_width == line_bases:
+            seq = np.array(raw)
+        else:
+            seq = raw[(raw != 10) & (raw != 13)]
+        if upper:
+            np.subtract(seq, 32, out=seq, where=(seq >= 97) & (seq <= 122))
+
+        return seq
+
+    def __getstate__(self):
+        # the pysam handle and memory map are not pickled; a copy sent to
+        # a worker process opens the fasta again by path
+        state = self.__dict__.copy()
+        state['_fasta'] = state['_buffer'] = None
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._fasta = pysam.FastaFile(self.fa)
+
+    def length(self, chrom):
+        """Returns the length (bp) of a chromosome"""
+
+        return self.lengths[chrom]
+
+    def __contains__(self, chrom):
+
+        return chrom in self.lengths
+
+    def __iter__(self):
+
+        return iter(self._fasta.references)
+
+    def __len__(self):
+
+        return len(self.lengths)
+
+    def __repr__(self):
+
+        return 'Genome(fa={})'.format(self.fa)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import os
+import shutil
+
+import numpy as np  # >=1.7
+
+# file, in each index directory, holding the checksum of the genome
+KEY_FILE = 'genome.sha1'
+
+def _makedirs(path):
+    """Creates a directory, unless another process already has"""
+
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    return None
+
+def cache_root():
+    """Returns the directory in which genome indexes are stored, CACHE_PATH
+    in config.txt (default = ~/.cache/oligo)
+
+    """
+
+    # imported here, as tools imports the indexes built on this module
+    from tools import paths
+
+    return os.path.expanduser(paths.get('CACHE_PATH', '~/.cache/oligo'))
+
+class ArrayIndex(object):
+    """Base class of the persistent indexes of a genome, whose arrays are
+    computed once and memory-mapped afterwards
+
+    Each array is saved as
+    `<cache_dir>/<genome fingerprint>/<name>/<stem>.npy` the first time it
+    is requested; later requests, from this or any other run against the
+    same fasta, memory-map the saved file instead. The full
+    `Genome.checksum` is stored in the directory with the arrays, and
+    arrays saved for a fasta with another checksum (or before checksums
+    were stored) are removed and built again. Mapped arrays are not
+    pickled, so a copy of the index sent to a worker process maps them
+    again.
+
+    Parameters
+    ----------
+    genome : Genome
+        Indexed reference genome
+    name : str
+        Name of the index directory
+    cache_dir : str, optional
+        Directory in which indexes are stored, default = CACHE_PATH in
+        config.txt
+
+    """
+
+    def __init__(self, genome, name, cache_dir=None):
+        self.genome = genome
+        self.path = os.path.join(cache_dir or cache_root(),
+                                 genome.fingerprint, name)
+        self._mapped = {}
+        self._checked = False
+
+    def _check_key(self):
+        """Removes the saved arrays if they were built from another fasta,
+        then records the checksum of this one
+
+        """
+
+        key_file = os.path.join(self.path, KEY_FILE)
+        if os.path.exists(key_file):
+            with open(key_file) as f:
+                if f.read().strip() == self.genome.checksum:
+                    self._checked = True
+                    return None
+        if os.path.isdir(self.path):
+            for name in os.listdir(self.path):
+                if name.endswith('.npy'):
+                    os.remove(os.path.join(self.path, name))
+        else:
+            _makedirs(self.path)
+        with open(key_file, 'w') as f:
+            f.write(self.genome.checksum + '\n')
+        self._checked = True
+
+        return None
+
+    def _files(self, stems):
+        """Returns the paths of the arrays `stems`"""
+
+        return [os.path.join(self.path, '{}.npy'.format(x)) for x in stems]
+
+    def _saved(self, stems):
+        """Returns whether all of the arrays `stems` have been saved"""
+
+        if not self._checked:
+            self._check_key()
+
+        return all(os.path.exists(x) for x in self._files(stems))
+
+    def _check_space(self, n_bytes):
+        """Raises an OSError if there are fewer than `n_bytes` bytes free
+        where the index is stored, before any time is spent building it
+
+        """
+
+        _makedirs(self.path)
+        free = shutil.disk_usage(self.path).free
+        if free < n_bytes:
+            raise OSError('Building the {} needs {:.1f} GB in {}, but only '
+                          '{:.1f} GB is free'.format(
+                              type(self).__name__, n_bytes / 2**30, self.path,
+                              free / 2**30))
+
+        return None
+
+    def _arrays(self, stems, build):
+        """Returns the saved arrays `stems`, memory-mapped, first saving
+        the arrays returned by `build()` if any of them is missing; a
+        `build` that saves the arrays itself returns None
+
+        """
+
+        stems = tuple(stems)
+        if stems not in self._mapped:
+            files = self._files(stems)
+            if not self._saved(stems):
+                arrays = build()
+                if arrays is not None:
+                    self._save(files, arrays)
+            self._mapped[stems] = tuple(np.load(x, mmap_mode='r')
+                                        for x in files)
+
+        return self._mapped[stems]
+
+    def _save(self, files, arrays):
+        """Saves arrays to .npy files; each is written to a temporary file
+        first and renamed, so that other processes never map a partly
+        written array
+
+        """
+
+        _makedirs(self.path)
+        for array_file, values in zip(files, arrays):
+            tmp_file = '{}.{}.tmp.npy'.format(array_file[:-4], os.getpid())
+            np.save(tmp_file, values)
+            os.rename(tmp_file, array_file)
+
+        return None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_mapped'] = {}
+
+        return state
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import os
+import shutil
+import tempfile
+
+import numpy as np  # >=1.7
+
+from indexcache import ArrayIndex, _makedirs
+from seeds import _code_dtype, base_codes, complement, kmer_codes
+
+def _distinct(codes, counts=None):
+    """Returns the distinct codes of an array, sorted, and how many times
+    each one occurs (summing `counts`, if given)
+
+    """
+
+    order = np.argsort(codes, kind='mergesort')
+    codes = codes[order]
+    first = np.ones(len(codes), dtype=bool)
+    first[1:] = codes[1:] != codes[:-1]
+    bounds = np.flatnonzero(first)
+    if counts is None:
+        totals = np.diff(np.append(bounds, len(codes)))
+    elif len(codes):
+        totals = np.add.reduceat(counts[order], bounds)
+    else:
+        totals = counts[:0]
+
+    return codes[first], totals.astype(np.uint32)
+
+def _merge_bounds(runs, merge_size):
+    """Splits sorted runs of codes into chunks of the code space, each
+    holding at most `merge_size` codes over all runs
+
+    Every `step`-th code of every run is sampled, so that between two
+    neighbouring samples a run holds at most `step` codes; chunks span
+    len(`runs`) samples, and hold at most 2 * len(`runs`) * `step` =
+    `merge_size` codes.
+
+    Returns
+    -------
+    bounds : list
+        For each run, the indices at which its chunks start, and its
+        length
+
+    """
+
+    step = max(merge_size // (2 * max(len(runs), 1)), 1)
+    samples = np.unique(np.concatenate(
+        [x[step::step] for x in runs] + [np.zeros(0, runs[0].dtype)]))
+    splits = samples[len(runs) - 1::len(runs)]
+
+    return [np.concatenate(([0], np.searchsorted(x, splits), [len(x)]))
+            for x in runs]
+
+class KmerTable(ArrayIndex):
+    """Persistent table of how often every k-mer occurs in a genome
+
+    k-mers are counted on both strands together (a k-mer and its reverse
+    complement share the smaller of their 2-bit codes), skipping any that
+    contain bases other than A, C, G and T. The distinct codes and their
+    counts are sorted arrays, built the first time the table is used and
+    saved to `<cache_dir>/<genome fingerprint>/kmers<k>/codes.npy` and
+    `counts.npy`; later uses, from this or any other run against the same
+    fasta, memory-map the saved arrays and look codes up with binary
+    searches. While the table is built, the sorted distinct codes of each
+    chromosome are saved to disk and merged a range of codes at a time,
+    so only one chromosome, or `merge_size` codes, are held in memory.
+
+    Parameters
+    ----------
+    genome : Genome
+        Indexed reference genome
+    k : int, optional
+        k-mer length (bp), 1-32, default = 17
+    cache_dir : str, optional
+        Directory in which tables are stored, default = CACHE_PATH in
+        config.txt
+    merge_size : int, optional
+        The most codes merged in memory at a time, default = 2**24
+
+    """
+
+    def __init__(self, genome, k=17, cache_dir=None, merge_size=2**24):
+        _code_dtype(k)
+        self.k = k
+        self.merge_size = merge_size
+        ArrayIndex.__init__(self, genome, 'kmers{}'.format(k), cache_dir)
+
+    @property
+    def table(self):
+        """The sorted distinct k-mer codes of the genome and their counts"""
+
+        return self._arrays(['codes', 'counts'], self._build)
+
+    def _build(self):
+        """Counts the k-mers of every chromosome, saving the sorted codes
+        and counts of each as a run, then merges the runs into the saved
+        table a chunk of codes at a time
+
+        """
+
+        print('\tCounting {}-mers in {}...'.format(self.k, self.genome.fa))
+        _makedirs(self.path)
+        run_dir = tempfile.mkdtemp(dir=self.path)
+        try:
+            runs = []
+            for i, chrom in enumerate(self.genome):
+                bases = base_codes[self.genome.fetch_array(chrom)]
+                forward, valid = kmer_codes(bases, self.k)
+                # reverse complement codes, at the same start positions
+                reverse = kmer_codes(complement[bases[::-1]], self.k)[0][::-1]
+                run = []
+                for name, values in zip(
+                        ('codes', 'counts'),
+                        _distinct(np.minimum(forward, reverse)[valid])):
+                    run_file = os.path.join(run_dir,
+                                            '{}.{}.npy'.format(i, name))
+                    np.save(run_file, values)
+                    run.append(np.load(run_file, mmap_mode='r'))
+                runs.append(run)
+            dtypes = (_code_dtype(self.k), np.uint32)
+            merged = [os.path.join(run_dir, x) for x in ('codes', 'counts')]
+            n_codes = 0
+            if runs:
+                bounds = _merge_bounds([x[0] for x in runs], self.merge_size)
+                with open(merged[0], 'wb') as codes_file, \
+                        open(merged[1], 'wb') as counts_file:
+                    for j in range(len(bounds[0]) - 1):
+                        chunk = [np.concatenate(
+                            [x[y][z[j]:z[j + 1]] for x, z in zip(runs, bounds)]
+                            + [np.zeros(0, dtypes[y])]) for y in (0, 1)]
+                        codes, counts = _distinct(*chunk)
+                        codes.tofile(codes_file)
+                        counts.tofile(counts_file)
+                        n_codes += len(codes)
+            self._save(self._files(['codes', 'counts']),
+                       [np.memmap(x, dtype=y, mode='r', shape=(n_codes,))
+                        if n_codes else np.zeros(0, y)
+                        for x, y in zip(merged, dtypes)])
+        finally:
+            shutil.rmtree(run_dir)
+
+        return None
+
+    def counts(self, codes):
+        """Returns how many times each of the given (canonical) k-mer codes
+        occurs in the genome
+
+        """
+
+        table_codes, table_counts = self.table
+        codes = np.asarray(codes, dtype=table_codes.dtype)
+        counts = np.zeros(len(codes), dtype=np.int64)
+        if len(table_codes):
+            rows = np.minimum(np.searchsorted(table_codes, codes),
+                              len(table_codes) - 1)
+            found = table_codes[rows] == codes
+            counts[found] = table_counts[rows[found]]
+
+        return counts
+
+    def score(self, seqs, batch_size=10000):
+        """Scores oligos by how often their k-mers occur in the genome
+
+        Parameters
+        ----------
+        seqs : numpy.ndarray
+            (oligos, length) uint8 matrix of oligo sequences
+        batch_size : int, optional
+            The number of oligos scored at a time, default = 10000
+
+        Returns
+        -------
+        max_counts : numpy.ndarray
+            For each oligo, the largest genome count of any of its k-mers
+        mean_counts : numpy.ndarray
+            For each oligo, the mean genome count of its k-mers; k-mers
+            containing bases other than A, C, G and T are not counted, and
+            oligos without any k-mers score 0
+
+        """
+
+        n_kmers = seqs.shape[1] - self.k + 1
+        if n_kmers < 1:
+            raise ValueError('Oligos must be at least {}bp long to score '
+                             'their {}-mers'.format(self.k, self.k))
+        dtype = _code_dtype(self.k)
+        max_counts = np.zeros(len(seqs), dtype=np.int64)
+        mean_counts = np.zeros(len(seqs))
+        for i in range(0, len(seqs), batch_size):
+            batch = base_codes[seqs[i:i + batch_size]]
+            codes = []
+            for strand in (batch, complement[batch[:, ::-1]]):
+                strand_codes = np.zeros((len(batch), n_kmers), dtype=dtype)
+                for j in range(self.k):
+                    strand_codes <<= dtype(2)
+                    strand_codes |= (strand[:, j:j + n_kmers] & 3).astype(
+                        dtype)
+                codes.append(strand_codes)
+            kmers = np.minimum(codes[0], codes[1][:, ::-1])
+            other = np.concatenate((np.zeros((len(batch), 1), dtype=np.int64),
+                                    np.cumsum(batch > 3, axis=1)), axis=1)
+            valid = other[:, self.k:] == other[:, :n_kmers]
+            counts = np.where(valid, self.counts(kmers.ravel()).reshape(
+                kmers.shape), 0)
+            n_valid = valid.sum(axis=1)
+            max_counts[i:i + batch_size] = counts.max(axis=1)
+            mean_counts[i:i + batch_size] = counts.sum(axis=1) / np.maximum(
+                n_valid, 1)
+
+        return max_counts, mean_counts
+
+    def __repr__(self):
+
+        return 'KmerTable(genome={}, k={})'.format(self.genome.fa, self.k)
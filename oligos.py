@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+try:
+    from collections.abc import Mapping
+except ImportError:  # Python 2
+    from collections import Mapping
+
+import itertools
+
+import numpy as np  # >=1.7
+
+from windows import ascii_digits, join_columns, oligo_sequences
+
+_columns = ('chrom_ids', 'starts', 'frag_starts', 'frag_stops', 'sides', 'seqs')
+
+def parse_key(key):
+    """Splits an `oligo_seqs` key into (chrom, start, stop, fragment start,
+    fragment stop, side); the fragment coordinates are None for oligos that
+    are not designed against a restriction fragment
+
+    """
+
+    chrom, coors = key.rsplit(':', 1)
+    start, stop, frag_start, frag_stop, side = coors.split('-')
+    if side == 'X':
+        frag_start = frag_stop = None
+    else:
+        frag_start, frag_stop = int(frag_start), int(frag_stop)
+
+    return chrom, int(start), int(stop), frag_start, frag_stop, side
+
+class OligoTable(Mapping):
+    """Array-backed store of designed oligos
+
+    Each oligo is one row of a set of NumPy columns: an integer chromosome
+    id (indexing `chroms`), start, fragment start and stop, side of the
+    fragment ('L', 'R', or 'X' for fragment-independent oligos, whose
+    fragment coordinates are stored as -1) and the sequence, as a row of a
+    fixed-width uint8 matrix. This takes around 100 bytes per 70bp oligo,
+    instead of the several hundred used by a dict of str keys and values.
+
+    The table is also a read-only mapping from the usual `oligo_seqs` keys
+    (e.g. chr1:100-170-000-000-X) to sequences, so code written for the dict
+    keeps working. Keys and sequences are formatted in vectorized batches
+    when iterated, and key lookups use a sorted index built on first use.
+
+    Parameters
+    ----------
+    size : int, optional
+        Oligo length (bp); taken from the first rows appended if omitted
+    batch_size : int, optional
+        The number of rows formatted at a time when iterating,
+        default = 100000
+
+    """
+
+    def __init__(self, size=None, batch_size=100000):
+        self.size = size
+        self.batch_size = batch_size
+        self.chroms = []
+        self._chrom_ids = {}
+        self._chunks = []
+        self._data = {'chrom_ids': np.zeros(0, dtype=np.int32),
+                      'starts': np.zeros(0, dtype=np.int64),
+                      'frag_starts': np.zeros(0, dtype=np.int64),
+                      'frag_stops': np.zeros(0, dtype=np.int64),
+                      'sides': np.zeros(0, dtype=np.uint8),
+                      'seqs': np.zeros((0, size or 0), dtype=np.uint8)}
+        self._lookup = None
+
+    @classmethod
+    def from_records(cls, records, size=None, batch_size=100000):
+        """Builds a table from (key, sequence) records, e.g. read back from
+        an oligo fasta, keeping their order
+
+        """
+
+        table = cls(size, batch_size=batch_size)
+        run, run_layout = [], None
+        for key, seq in itertools.chain(records, [(None, None)]):
+            if key is None:
+                layout = None
+            else:
+                chrom, start, _, frag_start, frag_stop, side = parse_key(key)
+                layout = (chrom, side == 'X')
+            if run and layout != run_layout:
+                chrom = run_layout[0]
+                starts, seqs, frag_starts, frag_stops, sides = zip(*run)
+                seqs = np.frombuffer(''.join(seqs).encode('ascii'),
+                                     dtype=np.uint8)
+                if run_layout[1]:
+                    table.append(chrom, starts, seqs)
+                else:
+                    table.append(chrom, starts, seqs, frag_starts, frag_stops,
+                                 sides)
+                run = []
+            if key is not None:
+                run.append((start, seq, frag_start, frag_stop, side))
+                run_layout = layout
+
+        return table
+
+    def append(self, chrom, starts, seqs, frag_starts=None, frag_stops=None,
+               sides=None):
+        """Adds oligos on one chromosome to the end of the table
+
+        Parameters
+        ----------
+        chrom : str
+            Chromosome name
+        starts : array-like
+            Oligo start coordinates
+        seqs : numpy.ndarray
+            (oligos, size) uint8 matrix of sequences
+        frag_starts, frag_stops : array-like, optional
+            Fragment coordinates; omit for fragment-independent oligos
+        sides : array-like, optional
+            Side of the fragment of each oligo, 'L' or 'R'; omit for
+            fragment-independent oligos
+
+        Returns
+        -------
+        self : object
+
+        """
+
+        starts = np.asarray(starts, dtype=np.int64)
+        seqs = np.asarray(seqs, dtype=np.uint8).reshape(len(starts), -1)
+        if self.size is None:
+            self.size = seqs.shape[1]
+            self._data['seqs'] = self._data['seqs'].reshape(0, self.size)
+        elif len(starts) and seqs.shape[1] != self.size:
+            raise ValueError('All oligos in a table must be {}bp'.format(
+                self.size))
+        if chrom not in self._chrom_ids:
+            self._chrom_ids[chrom] = len(self.chroms)
+            self.chroms.append(chrom)
+
+        if sides is None:
+            frag_starts = frag_stops = np.full(len(starts), -1, dtype=np.int64)
+            sides = np.full(len(starts), ord('X'), dtype=np.uint8)
+        elif not isinstance(sides, np.ndarray):
+            sides = np.array([ord(x) for x in sides], dtype=np.uint8)
+        chunk = {'chrom_ids': np.full(len(starts), self._chrom_ids[chrom],
+                                      dtype=np.int32),
+                 'starts': starts,
+                 'frag_starts': np.asarray(frag_starts, dtype=np.int64),
+                 'frag_stops': np.asarray(frag_stops, dtype=np.int64),
+                 'sides': np.asarray(sides, dtype=np.uint8),
+                 'seqs': seqs}
+        self._chunks.append(chunk)
+        self._lookup = None
+
+        return self
+
+    def extend(self, other):
+        """Adds every row of another `OligoTable` to the end of this one,
+        in the same order
+
+        """
+
+        for first, last in other._runs(0, None):
+            rows = slice(first, last)
+            self.append(other.chroms[other.chrom_ids[first]],
+                        other.starts[rows], other.seqs[rows],
+                        other.frag_starts[rows], other.frag_stops[rows],
+                        other.sides[rows])
+
+        return self
+
+    def _column(self, name):
+        """Returns a column, first concatenating any appended chunks"""
+
+        if self._chunks:
+            for x in _columns:
+                self._data[x] = np.concatenate(
+                    [self._data[x]] + [chunk[x] for chunk in self._chunks])
+            self._chunks = []
+
+        return self._data[name]
+
+    chrom_ids = property(lambda self: self._column('chrom_ids'))
+    starts = property(lambda self: self._column('starts'))
+    frag_starts = property(lambda self: self._column('frag_starts'))
+    frag_stops = property(lambda self: self._column('frag_stops'))
+    sides = property(lambda self: self._column('sides'))
+    seqs = property(lambda self: self._column('seqs'))
+
+    @property
+    def stops(self):
+
+        return self.starts + self.size
+
+    def select(self, rows):
+        """Returns a new table with the rows selected by a boolean mask or
+        an array of row indices, in that order
+
+        """
+
+        table = OligoTable(self.size, batch_size=self.batch_size)
+        table.chroms = list(self.chroms)
+        table._chrom_ids = dict(self._chrom_ids)
+        table._data = dict((x, self._column(x)[rows]) for x in _columns)
+
+        return table
+
+    def _runs(self, i, j):
+        """Yields the (first, last) bounds of each run of consecutive rows
+        in `i`:`j` that share a chromosome and have the same key layout
+
+        """
+
+        j = len(self) if j is None else min(j, len(self))
+        if j <= i:
+            return
+        layout = (self.chrom_ids[i:j].astype(np.int64) * 2 +
+                  (self.sides[i:j] == ord('X')))
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(layout)) + 1,
+                                 [len(layout)])) + i
+        for first, last in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            yield first, last
+
+    def _name_columns(self, first, last):
+        """Returns the `join_columns` columns of the keys of a run"""
+
+        starts = self.starts[first:last]
+        columns = [self.chroms[self.chrom_ids[first]].encode('ascii') + b':',
+                   ascii_digits(starts), b'-', ascii_digits(starts + self.size),
+                   b'-']
+        if self.sides[first] == ord('X'):
+            return columns + [b'000-000-X']
+
+        return columns + [ascii_digits(self.frag_starts[first:last]), b'-',
+                          ascii_digits(self.frag_stops[first:last]), b'-',
+                          self.sides[first:last, None]]
+
+    def names(self, i=0, j=None):
+        """Returns the keys of rows `i` to `j` as a list of str"""
+
+        names = []
+        for first, last in self._runs(i, j):
+            text = join_columns(self._name_columns(first, last) + [b'\n'],
+                                last - first)
+            names.extend(text.decode('ascii').split('\n')[:-1])
+
+        return names
+
+    def sequences(self, i=0, j=None):
+        """Returns the sequences of rows `i` to `j` as a list of str"""
+
+        return oligo_sequences(self.seqs[i:j])
+
+    def fasta(self, i=0, j=None):
+        """Returns rows `i` to `j` as fasta-formatted bytes"""
+
+        return b''.join(
+            join_columns([b'>'] + self._name_columns(first, last) +
+                         [b'\n', self.seqs[first:last], b'\n'], last - first)
+            for first, last in self._runs(i, j))
+
+    def fasta_blocks(self):
+        """Yields the fasta-formatted bytes of every batch of rows"""
+
+        for i in range(0, len(self), self.batch_size):
+            yield self.fasta(i, i + self.batch_size)
+
+    def index(self, key):
+        """Returns the row number of the oligo with the given key
+
+        Raises
+        ------
+        KeyError
+            If there is no oligo with that key
+
+        """
+
+        try:
+            chrom, start, stop, frag_start, frag_stop, side = parse_key(key)
+        except (AttributeError, ValueError):
+            raise KeyError(key)
+        if chrom not in self._chrom_ids or stop - start != self.size:
+            raise KeyError(key)
+
+        if self._lookup is None:
+            composite = (self.chrom_ids.astype(np.int64) << 40) | self.starts
+            order = np.argsort(composite, kind='mergesort')
+            self._lookup = (composite[order], order)
+        composite, order = self._lookup
+        target = (self._chrom_ids[chrom] << 40) | start
+        first, last = np.searchsorted(composite, (target, target + 1))
+        for row in order[first:last]:
+            if (self.sides[row] == ord(side) and (
+                    side == 'X' or (self.frag_starts[row] == frag_start and
+                                    self.frag_stops[row] == frag_stop))):
+                return int(row)
+
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+
+        row = self.index(key)
+
+        return self.seqs[row].tobytes().decode('ascii')
+
+    def __contains__(self, key):
+        try:
+            self.index(key)
+        except KeyError:
+            return False
+
+        return True
+
+    def __iter__(self):
+        for i in range(0, len(self), self.batch_size):
+            for name in self.names(i, i + self.batch_size):
+                yield name
+
+    def items(self):
+        """Yields (key, sequence) records, formatted in batches"""
+
+        for i in range(0, len(self), self.batch_size):
+            j = i + self.batch_size
+            for record in zip(self.names(i, j), self.sequences(i, j)):
+                yield record
+
+    def values(self):
+        """Yields sequences as str, formatted in batches"""
+
+        for i in range(0, len(self), self.batch_size):
+            for seq in self.sequences(i, i + self.batch_size):
+                yield seq
+
+    def __len__(self):
+
+        return len(self.starts)
+
+    def __repr__(self):
+
+        return 'OligoTable({} oligos of {}bp on {} chromosomes)'.format(
+            len(self), self.size, len(self.chroms))
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import itertools
+
+import numpy as np  # >=1.7
+import pandas as pd  # >=0.17
+
+def has_repeats(rm_out):
+    """Returns whether a RepeatMasker .out file lists any repeats; files
+    without repeats are a single line of text, so at most two lines are
+    read
+
+    """
+
+    with open(rm_out) as f:
+        return len(list(itertools.islice(f, 2))) > 1
+
+def _resolve(index, queries):
+    """Returns the row of each RepeatMasker query name in `index`
+
+    RepeatMasker can append a suffix to long sequence names; names that are
+    not found are looked up again without anything after the first '_'.
+
+    """
+
+    rows = index.get_indexer(queries)
+    missing = np.flatnonzero(rows < 0)
+    if len(missing):
+        rows[missing] = index.get_indexer(
+            [queries[i].split('_')[0] for i in missing])
+    if (rows < 0).any():
+        raise KeyError('{} is not one of the designed oligos'.format(
+            queries[int(np.flatnonzero(rows < 0)[0])]))
+
+    return rows
+
+def read_repeats(rm_out, names, chunk_size=1000000):
+    """Finds the longest repeat in each oligo from a RepeatMasker .out file
+
+    The file is read `chunk_size` lines at a time into typed columns (query
+    name, query start and end, and matching repeat). The distinct query
+    names of a chunk are resolved to oligos through a hash index, and the
+    longest repeat of each oligo is kept in arrays; where an oligo has
+    several repeats of the same length, the first one in the file is kept.
+
+    Parameters
+    ----------
+    rm_out : str
+        Path to the RepeatMasker .out file
+    names : sequence of str
+        Oligo names; the output arrays follow this order
+    chunk_size : int, optional
+        The number of repeats read at a time, default = 1000000
+
+    Returns
+    -------
+    lengths : numpy.ndarray
+        Length (bp) of the longest repeat in each oligo, 0 if it has none
+    types : numpy.ndarray
+        Name of that repeat, 'NA' if the oligo has none
+
+    Raises
+    ------
+    KeyError
+        If a repeat is in a sequence that is not in `names`
+
+    """
+
+    index = names if isinstance(names, pd.Index) else pd.Index(names)
+    lengths = np.zeros(len(index), dtype=np.int64)
+    types = np.full(len(index), 'NA', dtype=object)
+    if not has_repeats(rm_out):
+        return lengths, types
+
+    columns = {4: 'query', 5: 'q_start', 6: 'q_end', 9: 'repeat'}
+    chunks = pd.read_csv(rm_out, sep=r'\s+', header=None, skiprows=3,
+                         usecols=sorted(columns), chunksize=chunk_size,
+                         dtype={4: str, 5: np.int64, 6: np.int64, 9: str})
+    for chunk in chunks:
+        chunk = chunk.rename(columns=columns)
+        codes, uniques = pd.factorize(chunk['query'])
+        rows = _resolve(index, list(uniques))[codes]
+        chunk_lengths = (chunk['q_end'] - chunk['q_start']).values + 1
+
+        # longest, then earliest, repeat of each oligo in the chunk
+        order = np.lexsort((-chunk_lengths, rows))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = rows[order][1:] != rows[order][:-1]
+        best = order[first]
+        longer = chunk_lengths[best] > lengths[rows[best]]
+        best = best[longer]
+        lengths[rows[best]] = chunk_lengths[best]
+        types[rows[best]] = chunk['repeat'].values[best]
+
+    return lengths, types
+
+def longest_runs(windows):
+    """Returns the length of the longest run of True values in each row of
+    a boolean matrix
+
+    """
+
+    positions = np.arange(windows.shape[1])
+    # position of the last False value at or before each position
+    last_false = np.maximum.accumulate(np.where(windows, -1, positions),
+                                       axis=1)
+    run_ends = np.where(windows, positions - last_false, 0)
+
+    return run_ends.max(axis=1)
+
+def masked_repeats(genome, oligos, batch_size=100000, max_gap=10000):
+    """Finds the longest soft-masked (lower case) run of bases in each
+    oligo, from the coordinates of the oligos in the reference fasta
+
+    The oligos of each chromosome are grouped into clusters, split
+    wherever the starts of neighbouring oligos are more than `max_gap` bp
+    apart, and the sequence spanned by each cluster is fetched separately,
+    so that oligos spread along a chromosome do not fetch all of it.
+
+    Parameters
+    ----------
+    genome : Genome
+        Indexed reference genome, soft-masked e.g. by RepeatMasker as UCSC
+        and iGenomes fastas are
+    oligos : OligoTable
+        Designed oligos; the output array follows their order
+    batch_size : int, optional
+        The number of oligos compared at a time, default = 100000
+    max_gap : int, optional
+        The largest distance (bp) between the starts of neighbouring
+        oligos fetched together, default = 10000
+
+    Returns
+    -------
+    numpy.ndarray
+        Length (bp) of the longest lower case run in each oligo
+
+    """
+
+    lengths = np.zeros(len(oligos), dtype=np.int64)
+    chrom_ids, starts = oligos.chrom_ids, oligos.starts
+    for chrom_id in np.unique(chrom_ids).tolist():
+        rows = np.flatnonzero(chrom_ids == chrom_id)
+        rows = rows[np.argsort(starts[rows], kind='mergesort')]
+        splits = np.flatnonzero(np.diff(starts[rows]) > max_gap) + 1
+        for cluster in np.split(rows, splits):
+            first = int(starts[cluster[0]])
+            last = int(starts[cluster[-1]]) + oligos.size
+            seq = genome.fetch_array(oligos.chroms[chrom_id], first, last)
+            # bases beyond either end of the chromosome are not masked
+            mask = np.zeros(last - first, dtype=bool)
+            offset = max(-first, 0)
+            mask[offset:offset + len(seq)] = (seq >= 97) & (seq <= 122)
+            for i in range(0, len(cluster), batch_size):
+                batch = cluster[i:i + batch_size]
+                lengths[batch] = longest_runs(
+                    mask[(starts[batch] - first)[:, None] +
+                         np.arange(oligos.size)])
+
+    return lengths
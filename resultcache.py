@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import hashlib
+import sqlite3
+import time
+
+import pandas as pd  # >=0.17
+
+# the values stored for each kind of result
+kinds = {'repeats': ('repeat_length', 'repeat_type'),
+         'alignments': ('multimap', 'matches', 'mismatches')}
+
+def fingerprint(*parts):
+    """Returns a short digest of the settings that a result depends on,
+    e.g. the tool, its parameters and the genome
+
+    """
+
+    return hashlib.sha1('\t'.join(str(x) for x in parts).encode()).hexdigest(
+        )[:16]
+
+class ResultCache(object):
+    """Local SQLite cache of per-oligo repeat and alignment results, so that
+    oligos shared between designs are only sent to RepeatMasker and the
+    aligner once
+
+    Results are keyed by oligo sequence and a `fingerprint` of the tool
+    settings and genome that produced them. Every lookup and store marks
+    the entries it touches as used; when the cache holds more than
+    `max_entries` results, the least recently used are removed. Lookups
+    are counted as hits or misses, per kind of result, in the cache file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite file; created if it does not exist
+    max_entries : int, optional
+        The most results (of both kinds) kept, default = 5000000
+
+    """
+
+    def __init__(self, path, max_entries=5000000):
+        self.path = path
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(path)
+        with self._db:
+            for kind, columns in kinds.items():
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS {} (fingerprint TEXT, '
+                    'sequence TEXT, {}, used REAL, PRIMARY KEY (fingerprint, '
+                    'sequence)) WITHOUT ROWID'.format(kind, ', '.join(columns)))
+                self._db.execute('CREATE INDEX IF NOT EXISTS {0}_used ON {0} '
+                                 '(used)'.format(kind))
+            self._db.execute('CREATE TABLE IF NOT EXISTS lookups (kind TEXT '
+                             'PRIMARY KEY, hits INTEGER, misses INTEGER)')
+
+    def _load_query(self, sequences):
+        """Fills a temporary table with the distinct `sequences`"""
+
+        self._db.execute('CREATE TEMP TABLE IF NOT EXISTS query (sequence TEXT '
+                         'PRIMARY KEY)')
+        self._db.execute('DELETE FROM query')
+        self._db.executemany('INSERT OR IGNORE INTO query VALUES (?)',
+                             ((x,) for x in sequences))
+
+        return None
+
+    def get(self, kind, key, sequences):
+        """Looks up the results of oligos
+
+        Parameters
+        ----------
+        kind : {'repeats', 'alignments'}
+            Kind of result
+        key : str
+            `fingerprint` of the settings the results were produced with
+        sequences : sequence of str
+            Oligo sequences
+
+        Returns
+        -------
+        found : numpy.ndarray
+            Boolean mask of the oligos with a cached result
+        values : pandas.DataFrame
+            The cached values of the oligos in `found`, in order
+
+        """
+
+        columns = kinds[kind]
+        with self._db:
+            self._load_query(sequences)
+            cached = pd.read_sql_query(
+                'SELECT sequence, {} FROM {} JOIN query USING (sequence) '
+                'WHERE fingerprint = ?'.format(', '.join(columns), kind),
+                self._db, params=(key,))
+            self._db.execute('UPDATE {} SET used = ? WHERE fingerprint = ? AND '
+                             'sequence IN (SELECT sequence FROM query)'.format(
+                                 kind), (time.time(), key))
+            rows = pd.Index(cached['sequence']).get_indexer(sequences)
+            found = rows >= 0
+            self._db.execute(
+                'INSERT OR IGNORE INTO lookups VALUES (?, 0, 0)', (kind,))
+            self._db.execute('UPDATE lookups SET hits = hits + ?, misses = '
+                             'misses + ? WHERE kind = ?',
+                             (int(found.sum()), int((~found).sum()), kind))
+        values = cached.iloc[rows[found]][list(columns)].reset_index(drop=True)
+
+        return found, values
+
+    def put(self, kind, key, sequences, values):
+        """Stores the results of oligos, then removes the least recently
+        used results if the cache is full
+
+        Parameters
+        ----------
+        kind : {'repeats', 'alignments'}
+            Kind of result
+        key : str
+            `fingerprint` of the settings the results were produced with
+        sequences : sequence of str
+            Oligo sequences
+        values : pandas.DataFrame
+            The values of each oligo, with the columns of `kind`
+
+        """
+
+        columns = kinds[kind]
+        now = time.time()
+        records = zip(sequences, *[values[x].tolist() for x in columns])
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO {} VALUES (?, ?, {}, ?)'.format(
+                    kind, ', '.join('?' * len(columns))),
+                ((key,) + tuple(x) + (now,) for x in records))
+            self._evict()
+
+        return None
+
+    def _evict(self):
+        """Removes the least recently used results beyond `max_entries`"""
+
+        excess = sum(self._db.execute('SELECT COUNT(*) FROM {}'.format(
+            x)).fetchone()[0] for x in kinds) - self.max_entries
+        if excess <= 0:
+            return None
+        # how many of the oldest results are of each kind
+        oldest = self._db.execute(
+            'SELECT kind, COUNT(*) FROM ({} ORDER BY used LIMIT ?) GROUP BY '
+            'kind'.format(' UNION ALL '.join(
+                "SELECT '{0}' AS kind, used FROM {0}".format(x)
+                for x in sorted(kinds))), (excess,)).fetchall()
+        for kind, n_results in oldest:
+            self._db.execute(
+                'DELETE FROM {0} WHERE (fingerprint, sequence) IN (SELECT '
+                'fingerprint, sequence FROM {0} ORDER BY used LIMIT ?)'.format(
+                    kind), (n_results,))
+
+        return None
+
+    def stats(self):
+        """Returns the number of results held, and of hits and misses over
+        all lookups, for each kind of result, as a DataFrame
+
+        """
+
+        lookups = dict((x[0], x[1:]) for x in self._db.execute(
+            'SELECT kind, hits, misses FROM lookups'))
+        rows = []
+        for kind in sorted(kinds):
+            entries = self._db.execute('SELECT COUNT(*) FROM {}'.format(
+                kind)).fetchone()[0]
+            hits, misses = lookups.get(kind, (0, 0))
+            rows.append((kind, entries, hits, misses))
+
+        return pd.DataFrame(rows, columns=['kind', 'entries', 'hits',
+                                           'misses']).set_index('kind')
+
+    def close(self):
+        """Closes the SQLite file"""
+
+        self._db.close()
+
+        return None
+
+    def __repr__(self):
+
+        return 'ResultCache(path={}, max_entries={})'.format(self.path,
+                                                             self.max_entries)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import contextlib
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# functions called with each stage record as the stage finishes
+hooks = []
+
+def register_hook(hook):
+    """Registers a function to be called with the record (a dict, see
+    `RunReport`) of a pipeline stage each time it finishes, e.g. to log
+    stages or send them to a monitoring system; returns `hook`, so it can
+    be used as a decorator
+
+    """
+
+    hooks.append(hook)
+
+    return hook
+
+def remove_hook(hook):
+    """Stops calling a function registered with `register_hook`"""
+
+    hooks.remove(hook)
+
+    return None
+
+def _rss_mb(maxrss):
+    """Converts ru_maxrss, in KB (bytes on macOS), to MB"""
+
+    return maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+
+def _usage():
+    """Returns the CPU time (s) of this process and its waited-for child
+    processes, and the peak RSS (MB) of this process so far
+
+    """
+
+    if resource is None:
+        return time.process_time(), None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+    return cpu, _rss_mb(own.ru_maxrss)
+
+class RunReport(object):
+    """Wall time, CPU time, peak memory and item counts of the stages of a
+    pipeline run
+
+    Each stage has one record, a dict of its name, the number of times it
+    was run (`calls`), total wall and CPU time (s), peak RSS (MB) and the
+    number of items it produced or processed. Stages run more than once,
+    e.g. a cut site lookup per chromosome, add up into one record. For
+    in-process stages the CPU time includes any tools they waited for and
+    the peak RSS is that of this process by the end of the stage; external
+    tools are recorded with their own CPU time and peak RSS. Peak RSS is
+    None where the platform does not report it.
+
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._started_cpu = _usage()[0]
+        self.records = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Context manager that records a stage; the record is yielded so
+        that the stage can set its `items`, e.g.::
+
+            with report.stage('write_fasta') as stage:
+                ...
+                stage['items'] = len(oligos)
+
+        """
+
+        counts = {'items': None}
+        wall, (cpu, _) = time.time(), _usage()
+        try:
+            yield counts
+        finally:
+            end_cpu, peak = _usage()
+            self.record(name, time.time() - wall, end_cpu - cpu, peak,
+                        counts['items'])
+
+    def record(self, name, wall, cpu, peak_rss_mb, items=None):
+        """Adds a stage run to the report and calls the registered hooks
+        with its record
+
+        """
+
+        for stage in self.records:
+            if stage['name'] == name:
+                break
+        else:
+            stage = {'name': name, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+                     'peak_rss_mb': None, 'items': None}
+            self.records.append(stage)
+        stage['calls'] += 1
+        stage['wall_s'] += wall
+        stage['cpu_s'] += cpu
+        if peak_rss_mb is not None:
+            stage['peak_rss_mb'] = max(stage['peak_rss_mb'] or 0, peak_rss_mb)
+        if items is not None:
+            stage['items'] = (stage['items'] or 0) + items
+        for hook in list(hooks):
+            hook(dict(stage))
+
+        return None
+
+    def to_dict(self):
+        """Returns the report as a JSON-serializable dict"""
+
+        return {'started': time.strftime('%Y-%m-%dT%H:%M:%S',
+                                         time.localtime(self.started)),
+                'wall_s': time.time() - self.started,
+                'cpu_s': _usage()[0] - self._started_cpu,
+                'peak_rss_mb': _usage()[1],
+                'pid': os.getpid(),
+                'argv': sys.argv,
+                'stages': [dict(x) for x in self.records]}
+
+    def write(self, path):
+        """Writes the report to a JSON file"""
+
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+        return None
+
+    def __repr__(self):
+
+        return 'RunReport({} stages)'.format(len(self.records))
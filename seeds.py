@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+from concurrent.futures import ProcessPoolExecutor  # Python 2: futures
+
+import numpy as np  # >=1.7
+
+from indexcache import ArrayIndex
+
+# 2-bit codes of the bases; anything else (e.g. N) is 4
+base_codes = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(('Aa', 'Cc', 'Gg', 'Tt')):
+    base_codes[[ord(x) for x in _bases]] = _code
+# complements of the codes, where oligo bases other than A, C, G and T are
+# 5, so that they never match the genome
+complement = np.array([3, 2, 1, 0, 4, 5], dtype=np.uint8)
+
+def _code_dtype(k):
+    if not 1 <= k <= 32:
+        raise ValueError('k-mer length must be between 1 and 32')
+
+    return np.uint32 if k <= 16 else np.uint64
+
+def kmer_codes(bases, k, chunk_size=2**24):
+    """Returns the 2-bit code of every k-mer of a sequence, and whether it
+    contains only A, C, G and T
+
+    Parameters
+    ----------
+    bases : numpy.ndarray
+        Sequence as base codes (see `base_codes`)
+    k : int
+        k-mer length, 1-32; codes are uint32 for k <= 16, else uint64
+    chunk_size : int, optional
+        The number of k-mers encoded at a time, default = 2**24
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        Code of the k-mer starting at each position
+    valid : numpy.ndarray
+        Boolean mask of the k-mers made up of A, C, G and T only
+
+    """
+
+    dtype = _code_dtype(k)
+    n_kmers = max(len(bases) - k + 1, 0)
+    codes = np.zeros(n_kmers, dtype=dtype)
+    for i in range(0, n_kmers, chunk_size):
+        chunk = codes[i:i + chunk_size]
+        for j in range(k):
+            chunk <<= dtype(2)
+            chunk |= (bases[i + j:i + j + len(chunk)] & 3).astype(dtype)
+    other = np.concatenate(([0], np.cumsum(bases > 3)))
+    valid = other[k:] == other[:n_kmers]
+
+    return codes, valid
+
+def _seed_codes(queries, offset, k):
+    """Returns the code of the k-mer at `offset` in each row of a (oligos,
+    length) matrix of base codes, and whether it is made up of A, C, G and
+    T only
+
+    """
+
+    dtype = _code_dtype(k)
+    seeds = queries[:, offset:offset + k]
+    codes = np.zeros(len(queries), dtype=dtype)
+    for j in range(k):
+        codes <<= dtype(2)
+        codes |= (seeds[:, j] & 3).astype(dtype)
+
+    return codes, (seeds < 4).all(axis=1)
+
+def _row_chunks(counts, size):
+    """Splits rows into runs of neighbouring rows with at most `size`
+    candidate sites between them, or a single row with more
+
+    """
+
+    ends = np.cumsum(counts)
+    chunks, row = [], 0
+    while row < len(counts):
+        stop = max(int(np.searchsorted(ends, ends[row] - counts[row] + size,
+                                       side='right')), row + 1)
+        chunks.append((row, stop))
+        row = stop
+
+    return chunks
+
+def _chrom_hits(index, chrom, queries, offsets, mismatches, batch_size,
+                max_seed_hits):
+    """Finds the hits of oligos on one chromosome, on either strand, with
+    up to `mismatches` mismatches
+
+    Returns the oligo (row of `queries`) and number of mismatches of each
+    distinct hit, and the oligos with a seed that occurs more than
+    `max_seed_hits` times in the index of the chromosome; such seeds are
+    not searched for.
+
+    """
+
+    codes, positions = index[chrom]
+    bases = base_codes[index.genome.fetch_array(chrom)]
+    size = queries.shape[1]
+    n_starts = max(len(bases) - size + 1, 0)
+    oligos, scores, repeated = [], [], []
+    for i in range(0, len(queries), batch_size):
+        forward = queries[i:i + batch_size]
+        batch = np.vstack((forward, complement[forward[:, ::-1]]))
+        batch_oligos, batch_starts, batch_scores = [], [], []
+        for offset in offsets:
+            seeds, valid = _seed_codes(batch, offset, index.k)
+            # sorted seeds are searched for faster
+            order = np.argsort(seeds)
+            first, counts = np.zeros((2, len(seeds)), dtype=np.int64)
+            first[order] = np.searchsorted(codes, seeds[order], side='left')
+            counts[order] = np.searchsorted(codes, seeds[order],
+                                            side='right') - first[order]
+            counts[~valid] = 0
+            over = counts > max_seed_hits
+            repeated.append(np.flatnonzero(over) % len(forward) + i)
+            counts[over] = 0
+            # candidate sites are compared about batch_size at a time
+            for row, stop in _row_chunks(counts, batch_size):
+                chunk = counts[row:stop]
+                # index of every hit of every seed in the sorted k-mers
+                ends = np.cumsum(chunk)
+                hits = np.arange(ends[-1]) + np.repeat(
+                    first[row:stop] - ends + chunk, chunk)
+                rows = np.repeat(np.arange(row, stop), chunk)
+                starts = positions[hits].astype(np.int64) - offset
+                keep = (starts >= 0) & (starts < n_starts)
+                rows, starts = rows[keep], starts[keep]
+                windows = bases[starts[:, None] + np.arange(size)]
+                score = (windows != batch[rows]).sum(axis=1)
+                hit = score <= mismatches
+                batch_oligos.append(rows[hit] % len(forward) + i)
+                batch_starts.append(starts[hit])
+                batch_scores.append(score[hit])
+        if not batch_oligos:
+            continue
+        # a hit found through several seeds, or that matches both strands
+        # (e.g. a palindrome), is one hit
+        batch_oligos, batch_starts, batch_scores = (
+            np.concatenate(x) for x in (batch_oligos, batch_starts,
+                                        batch_scores))
+        order = np.lexsort((batch_scores, batch_starts, batch_oligos))
+        distinct = np.ones(len(order), dtype=bool)
+        distinct[1:] = ((np.diff(batch_oligos[order]) != 0) |
+                        (np.diff(batch_starts[order]) != 0))
+        oligos.append(batch_oligos[order][distinct])
+        scores.append(batch_scores[order][distinct])
+    repeated = np.concatenate(repeated + [np.zeros(0, dtype=np.int64)])
+    if not oligos:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                repeated)
+
+    return np.concatenate(oligos), np.concatenate(scores), repeated
+
+class SeedIndex(ArrayIndex):
+    """Persistent k-mer index of a genome, for counting where oligos bind
+    without an external aligner
+
+    For each chromosome, the k-mers made up of A, C, G and T that start
+    every `sample` bp are sorted by their 2-bit code, i.e. a sampled suffix
+    array truncated at depth k. The codes and start coordinates are
+    computed the first time that chromosome is requested and saved to
+    `<cache_dir>/<genome fingerprint>/seeds<k>-<sample>/<chrom>.codes.npy`
+    and `.starts.npy`; later requests, from this or any other run against
+    the same fasta, memory-map the saved arrays. Each indexed k-mer takes 8
+    bytes (12 for k > 16), so the index needs 8 / `sample` bytes per base
+    of the genome on disk: about 6 GB for hg38 with the default `sample`
+    = 4. Building stops early if there is not enough free space.
+
+    Oligos are searched for with pigeonhole seeds: an oligo split into
+    `mismatches` + 1 segments has at least one segment that matches a hit
+    with up to `mismatches` mismatches exactly, and any `sample` bp of such
+    a segment include the start of an indexed k-mer. The k-mers at the
+    first `sample` positions of each segment are looked up in the index
+    with binary searches, and every candidate site is then compared base
+    by base with the oligo. Hits are ungapped. Seeds that occur more than
+    `max_seed_hits` times, e.g. in Alu or L1 repeats, are skipped, as STAR
+    skips seeds with more than --seedMultimapNmax loci, so that a batch
+    never expands one seed into millions of candidate sites.
+
+    Parameters
+    ----------
+    genome : Genome
+        Indexed reference genome
+    k : int, optional
+        Seed length (bp), 1-32, default = 16
+    sample : int, optional
+        Distance (bp) between the starts of indexed k-mers, default = 4;
+        oligos must be at least (`mismatches` + 1) * (k + `sample` - 1)
+        bp long
+    cache_dir : str, optional
+        Directory in which indexes are stored, default = CACHE_PATH in
+        config.txt
+
+    """
+
+    def __init__(self, genome, k=16, sample=4, cache_dir=None):
+        _code_dtype(k)
+        if sample < 1:
+            raise ValueError('sample must be at least 1')
+        self.k = k
+        self.sample = sample
+        ArrayIndex.__init__(self, genome, 'seeds{}-{}'.format(k, sample),
+                            cache_dir)
+
+    def _stems(self, chrom):
+
+        return ['{}.{}'.format(chrom, x) for x in ('codes', 'starts')]
+
+    def _chrom_bytes(self, chrom):
+        """Returns the size (bytes) of the saved arrays of a chromosome,
+        at most
+
+        """
+
+        length = self.genome.length(chrom)
+        itemsize = (np.dtype(_code_dtype(self.k)).itemsize +
+                    (4 if length < 2**32 else 8))
+
+        return -(-length // self.sample) * itemsize
+
+    def __getitem__(self, chrom):
+        """Returns the sorted k-mer codes of a chromosome and their start
+        coordinates
+
+        """
+
+        if chrom not in self.genome:
+            raise KeyError('{} is not in {}'.format(chrom, self.genome.fa))
+
+        return self._arrays(self._stems(chrom), lambda: self._build(chrom))
+
+    def __contains__(self, chrom):
+
+        return chrom in self.genome
+
+    def _build(self, chrom):
+        """Sorts the sampled k-mers of a chromosome and returns their codes
+        and start coordinates
+
+        """
+
+        dtype = np.uint32 if self.genome.length(chrom) < 2**32 else np.int64
+        codes, valid = kmer_codes(base_codes[self.genome.fetch_array(chrom)],
+                                  self.k)
+        codes, valid = codes[::self.sample], valid[::self.sample]
+        starts = (np.flatnonzero(valid) * self.sample).astype(dtype)
+        codes = codes[valid]
+        order = np.argsort(codes, kind='mergesort')
+
+        return codes[order], starts[order]
+
+    def count_hits(self, seqs, mismatches=2, threads=1, batch_size=65536,
+                   max_seed_hits=11000):
+        """Counts the sites in the genome, on either strand, that each oligo
+        matches exactly and with up to `mismatches` mismatches
+
+        Parameters
+        ----------
+        seqs : numpy.ndarray
+            (oligos, length) uint8 matrix of oligo sequences
+        mismatches : int, optional
+            The most mismatches a hit can have, default = 2; oligos must be
+            at least (`mismatches` + 1) * (k + `sample` - 1) bp long
+        threads : int, optional
+            The number of processes to search chromosomes in, default = 1
+        batch_size : int, optional
+            The number of oligos searched for, and candidate sites
+            compared, at a time, default = 65536
+        max_seed_hits : int, optional
+            The most times a seed can occur in the index of a chromosome
+            for its sites to be compared with the oligo, default = 11000
+            (the --seedMultimapNmax STAR is run with)
+
+        Returns
+        -------
+        exact, hits : numpy.ndarray
+            For each oligo, the number of sites that match it exactly, and
+            with up to `mismatches` mismatches; oligos over the multimap
+            limit have at least `max_seed_hits` hits
+        repeated : numpy.ndarray
+            Whether each oligo is over the multimap limit, i.e. has a seed
+            that occurs more than `max_seed_hits` times on a chromosome;
+            its other seeds are still searched for
+
+        Raises
+        ------
+        ValueError
+            If the oligos are too short to be split into `mismatches` + 1
+            segments of k + `sample` - 1 bp
+        OSError
+            If the chromosomes that are not indexed yet need more disk
+            space than is free
+
+        """
+
+        size = seqs.shape[1]
+        segment = size // (mismatches + 1)
+        if segment < self.k + self.sample - 1:
+            raise ValueError('{}bp oligos are too short to find hits with {} '
+                             'mismatches using {}bp seeds sampled every {}bp'
+                             .format(size, mismatches, self.k, self.sample))
+        offsets = [segment * x + y for x in range(mismatches + 1)
+                   for y in range(self.sample)]
+        queries = base_codes[seqs]
+        queries[queries == 4] = 5
+
+        chroms = list(self.genome)
+        self._check_space(sum(self._chrom_bytes(x) for x in chroms
+                              if not self._saved(self._stems(x))))
+        args = [(self, x, queries, offsets, mismatches, batch_size,
+                 max_seed_hits) for x in chroms]
+        if threads == 1:
+            parts = [_chrom_hits(*x) for x in args]
+        else:
+            with ProcessPoolExecutor(max_workers=threads) as pool:
+                parts = list(pool.map(_chrom_hits, *zip(*args)))
+        oligos, scores, over = (np.concatenate([x[i] for x in parts] + [
+            np.zeros(0, dtype=np.int64)]) for i in range(3))
+        exact = np.bincount(oligos[scores == 0], minlength=len(seqs))
+        hits = np.bincount(oligos, minlength=len(seqs))
+        repeated = np.zeros(len(seqs), dtype=bool)
+        repeated[over] = True
+        hits[repeated] = np.maximum(hits[repeated], max_seed_hits)
+
+        return exact, hits, repeated
+
+    def __repr__(self):
+
+        return 'SeedIndex(genome={}, k={}, sample={})'.format(
+            self.genome.fa, self.k, self.sample)
@@ -0,0 +1,1315 @@
+#!/usr/bin/env python
+
+import contextlib
+import gzip
+import io
+import os
+import pickle
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock
+
+import numpy as np
+import pandas as pd
+import pysam
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from alignments import decode_cigars, tally_psl, tally_sam
+from cutsites import CutSiteIndex
+from design import Batch, Capture, OffTarget, Tiled, read_manifest
+from enzymes import find_sites, recognition_seq, register_enzyme
+from genome import SAMPLE_BLOCKS, SAMPLE_SIZE, Genome
+from kmers import KmerTable
+from oligos import OligoTable, parse_key
+from repeats import has_repeats, masked_repeats, read_repeats
+from resultcache import ResultCache
+import runreport
+from seeds import SeedIndex, base_codes, complement
+from windows import ContigWindows, oligo_names, oligo_sequences
+import tools
+
+rng = np.random.RandomState(0)
+random_seq = np.frombuffer(b'ACGTNacgtn', dtype=np.uint8)[
+    rng.randint(0, 10, size=200000)]
+
+class FindSitesTest(unittest.TestCase):
+    
+    def test_exact_sites_match_regex_scan(self):
+        seq_str = random_seq.tobytes().decode().upper()
+        for enzyme in ('DpnII', 'NlaIII', 'HindIII', 'MseI'):
+            site = recognition_seq[enzyme]
+            expected = [x.start() for x in re.finditer(site, seq_str)]
+            self.assertListEqual(find_sites(random_seq, site).tolist(),
+                                 expected)
+    
+    def test_degenerate_sites_include_overlapping_matches(self):
+        seq_str = random_seq.tobytes().decode().upper()
+        expected = [x.start() for x in
+                    re.finditer('(?=[AG]AATT[CT])', seq_str)]
+        self.assertListEqual(find_sites(random_seq, 'RAATTY').tolist(),
+                             expected)
+    
+    def test_chunk_boundaries_do_not_lose_sites(self):
+        self.assertListEqual(
+            find_sites(random_seq, 'GANTC', chunk_size=1000).tolist(),
+            find_sites(random_seq, 'GANTC').tolist())
+    
+    def test_str_input_is_case_insensitive(self):
+        self.assertListEqual(find_sites('ttgatcGATCnGAtc', 'GATC').tolist(),
+                             [2, 6, 11])
+    
+    def test_sequence_shorter_than_site_has_no_sites(self):
+        self.assertEqual(len(find_sites('GAT', 'GATC')), 0)
+    
+    def test_invalid_site_raises_value_error(self):
+        with self.assertRaises(ValueError):
+            register_enzyme('Bad', 'GAXC')
+
+class OligoTableTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.table = OligoTable(4)
+        self.table.append('chr1', [5, 100],
+                          np.frombuffer(b'ACGTTTTT', np.uint8).reshape(2, 4))
+        self.table.append('chr2', [7, 26],
+                          np.frombuffer(b'GGGGCCCC', np.uint8).reshape(2, 4),
+                          frag_starts=[7, 7], frag_stops=[30, 30], sides='LR')
+        self.expected = {'chr1:5-9-000-000-X': 'ACGT',
+                         'chr1:100-104-000-000-X': 'TTTT',
+                         'chr2:7-11-7-30-L': 'GGGG',
+                         'chr2:26-30-7-30-R': 'CCCC'}
+    
+    def test_table_behaves_like_oligo_seqs_dict(self):
+        self.assertDictEqual(dict(self.table.items()), self.expected)
+        self.assertListEqual(list(self.table), list(self.expected))
+        for key, seq in self.expected.items():
+            self.assertEqual(self.table[key], seq)
+    
+    def test_missing_keys_raise_key_error(self):
+        self.assertNotIn('chr2:7-11-7-31-L', self.table)
+        with self.assertRaises(KeyError):
+            self.table['chr3:7-11-000-000-X']
+    
+    def test_fasta_matches_records(self):
+        fasta = ''.join('>{}\n{}\n'.format(*x) for x in self.expected.items())
+        self.assertEqual(self.table.fasta().decode(), fasta)
+        self.table.batch_size = 3
+        self.assertEqual(b''.join(self.table.fasta_blocks()).decode(), fasta)
+    
+    def test_select_keeps_requested_rows_in_order(self):
+        selected = self.table.select(np.array([3, 0]))
+        self.assertListEqual(list(selected),
+                             ['chr2:26-30-7-30-R', 'chr1:5-9-000-000-X'])
+    
+    def test_extend_keeps_interleaved_chromosomes_in_order(self):
+        records = [list(self.expected.items())[x] for x in (0, 2, 1, 3)]
+        source = OligoTable.from_records(iter(records))
+        table = OligoTable(4).extend(self.table.select(np.array([1])))
+        table.extend(source)
+        self.assertListEqual(list(table.items()),
+                             [records[2]] + records)
+        self.assertEqual(table.index(records[1][0]), 2)
+    
+    def test_from_records_keeps_keys_and_order(self):
+        records = list(self.expected.items())[::-1]
+        table = OligoTable.from_records(iter(records))
+        self.assertListEqual(list(table.items()), records)
+    
+    def test_gc_matches_per_sequence_formula(self):
+        def gc(seq):
+            gc_decimal = (seq.count('C') + seq.count('G'))/len(seq)
+            return int(float("{0:.2f}".format(gc_decimal))*100)
+        
+        seqs = random_seq[:70 * 500].reshape(500, 70) & ~np.uint8(0x20)
+        expected = [gc(x) for x in oligo_sequences(seqs)]
+        gc_perc = tools.Tools(genome='mm10', fa='')._get_gc(seqs)
+        self.assertListEqual(gc_perc.tolist(), expected)
+    
+    def test_parse_key(self):
+        self.assertEqual(parse_key('chr2:26-30-7-30-R'),
+                         ('chr2', 26, 30, 7, 30, 'R'))
+        self.assertEqual(parse_key('chr1:5-9-000-000-X'),
+                         ('chr1', 5, 9, None, None, 'X'))
+
+class TallyAlignmentsTest(unittest.TestCase):
+    
+    records = [('a', 2, '70M'), ('b', 1, '30M2I38M'), ('a', 2, '10S50M3D10M'),
+               ('c', 3, '5H65M')]
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _write(self, name, mode):
+        path = os.path.join(self.tmp_dir, name)
+        header = {'HD': {'VN': '1.4'}, 'SQ': [{'SN': 'chr1', 'LN': 10000}]}
+        with pysam.AlignmentFile(path, mode, header=header) as sf:
+            for i, (oligo, hits, cigar) in enumerate(self.records):
+                r = pysam.AlignedSegment(sf.header)
+                r.query_name, r.reference_id = oligo, 0
+                r.reference_start, r.cigarstring = 100 * i, cigar
+                r.set_tag('NH', hits)
+                sf.write(r)
+        
+        return path
+    
+    def test_decode_cigars(self):
+        np.testing.assert_array_equal(
+            decode_cigars(['70M', '30M2I38M', '*', '10S50M13D10M1I']),
+            [[70, 0, 0], [68, 2, 0], [0, 0, 0], [60, 1, 13]])
+    
+    def test_sam_and_bam_give_the_same_totals(self):
+        for name, mode, threads in (('oligos.sam', 'w', 1),
+                                    ('oligos.sam', 'w', 3),
+                                    ('oligos.bam', 'wb', 2)):
+            multimap, matches, mismatches = tally_sam(
+                self._write(name, mode), ['c', 'a', 'b', 'd'], threads=threads,
+                batch_size=3, block_size=40)
+            self.assertListEqual(multimap.tolist(), [3, 2, 1, 0])
+            self.assertListEqual(matches.tolist(), [65, 130, 68, 0])
+            self.assertListEqual(mismatches.tolist(), [0, 3, 2, 0])
+    
+    def test_missing_nh_tag_raises_value_error(self):
+        path = os.path.join(self.tmp_dir, 'oligos.sam')
+        with open(path, 'w') as f:
+            f.write('a\t0\tchr1\t1\t255\t70M\t*\t0\t0\t*\t*\tNH:i:1\n'
+                    'b\t0\tchr1\t1\t255\t70M\t*\t0\t0\t*\t*\tAS:i:68\n')
+        with self.assertRaisesRegex(ValueError, 'b has no NH tag'):
+            tally_sam(path, ['a', 'b'])
+    
+    def test_unknown_oligo_raises_key_error(self):
+        with self.assertRaises(KeyError):
+            tally_sam(self._write('oligos.sam', 'w'), ['a', 'b'])
+    
+    def _write_psl(self, rows):
+        path = os.path.join(self.tmp_dir, 'blat_out.psl')
+        with open(path, 'w') as f:
+            f.write('psLayout version 3\n\nmatch\tmis-\n\tmatch\n---\n')
+            for name, q_gap_bases, q_start, q_end in rows:
+                fields = [70, 0, 0, 0, 0, q_gap_bases, 0, 0, '+', name, 70,
+                          q_start, q_end, 'chr1', 1000, 0, 70, 1, '70,', '0,',
+                          '0,']
+                f.write('\t'.join(map(str, fields)) + '\n')
+        
+        return path
+    
+    def test_psl_totals_are_aggregated_per_oligo(self):
+        psl = self._write_psl([('a', 0, 0, 69), ('b', 2, 5, 64),
+                               ('a', 1, 10, 59)])
+        for chunk_size in (1, 2, 10):
+            multimap, matches, mismatches = tally_psl(psl, ['b', 'a', 'c'],
+                                                      chunk_size=chunk_size)
+            self.assertListEqual(multimap.tolist(), [1, 2, 0])
+            self.assertListEqual(matches.tolist(), [60, 120, 0])
+            self.assertListEqual(mismatches.tolist(), [2, 1, 0])
+    
+    def test_psl_without_alignments(self):
+        counts = tally_psl(self._write_psl([]), ['a'])
+        self.assertListEqual([x.tolist() for x in counts], [[0], [0], [0]])
+
+class ReadRepeatsTest(unittest.TestCase):
+    
+    names = ['chr1:100-170-50-300-L', 'chr1:230-300-50-300-R',
+             'chr2:0-70-000-000-X']
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.rm_out = os.path.join(self.tmp_dir, 'oligo_seqs.fa.out')
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _write(self, lines):
+        with open(self.rm_out, 'w') as f:
+            f.writelines(lines)
+    
+    def test_file_without_repeats(self):
+        self._write(['There were no repetitive sequences detected in '
+                     'oligo_seqs.fa\n'])
+        self.assertFalse(has_repeats(self.rm_out))
+        lengths, types = read_repeats(self.rm_out, self.names)
+        self.assertListEqual(lengths.tolist(), [0, 0, 0])
+        self.assertListEqual(types.tolist(), ['NA'] * 3)
+    
+    def test_longest_first_repeat_is_kept_per_oligo(self):
+        repeats = [('chr1:100-170-50-300-L', 1, 20, '(A)n'),
+                   ('chr1:100-170-50-300-L_1', 5, 44, 'L1Md_A'),
+                   ('chr1:100-170-50-300-L', 1, 40, 'B1_Mm'),
+                   ('chr2:0-70-000-000-X', 30, 39, '(TG)n')]
+        self._write(RepeatShardsTest.header + [
+            '  20  0.0  0.0  0.0  {}  {}  {}  (0) +  {}  LINE/L1  1  4  (0)  '
+            '{}{}\n'.format(name, start, end, repeat, i, ' *' * (i % 2))
+            for i, (name, start, end, repeat) in enumerate(repeats, 1)])
+        self.assertTrue(has_repeats(self.rm_out))
+        for chunk_size in (1, 3, 10):
+            lengths, types = read_repeats(self.rm_out, self.names,
+                                          chunk_size=chunk_size)
+            self.assertListEqual(lengths.tolist(), [40, 0, 10])
+            self.assertListEqual(types.tolist(), ['L1Md_A', 'NA', '(TG)n'])
+
+class MaskedRepeatsTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        # random_seq is a mix of upper and lower case bases; add a 60bp
+        # lower case run
+        seq = random_seq[:3000].tobytes().decode()
+        self.seq = seq[:499] + 'A' + seq[500:560].lower() + 'C' + seq[561:]
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n')
+            f.write(''.join(self.seq[i:i + 60] + '\n'
+                            for i in range(0, len(self.seq), 60)))
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_longest_lower_case_run_of_each_oligo(self):
+        starts = list(range(0, 2900, 23)) + [510, 2950]
+        oligos = OligoTable(40).append('chr1', starts, np.zeros(
+            (len(starts), 40), dtype=np.uint8))
+        with contextlib.redirect_stdout(io.StringIO()):
+            lengths = masked_repeats(Genome(self.fa), oligos, batch_size=10)
+        expected = [max([len(x) for x in re.findall('[a-z]+',
+                                                    self.seq[y:y + 40])] or
+                        [0]) for y in starts]
+        self.assertListEqual(lengths.tolist(), expected)
+        self.assertEqual(lengths[-2], 40)
+    
+    def test_clusters_fetch_only_the_sequence_near_oligos(self):
+        starts = [2950, 510, 0, 100, 2900, 530, -5]
+        oligos = OligoTable(40).append('chr1', starts, np.zeros(
+            (len(starts), 40), dtype=np.uint8))
+        with contextlib.redirect_stdout(io.StringIO()):
+            genome = Genome(self.fa)
+        fetched = []
+        fetch_array = genome.fetch_array
+        def fetch(chrom, start, end):
+            fetched.append((start, end))
+            return fetch_array(chrom, start, end)
+        genome.fetch_array = fetch
+        lengths = masked_repeats(genome, oligos, max_gap=300)
+        self.assertListEqual(fetched, [(-5, 140), (510, 570), (2900, 2990)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            expected = masked_repeats(Genome(self.fa), oligos,
+                                      max_gap=10000)
+        self.assertListEqual(lengths.tolist(), expected.tolist())
+    
+    def test_soft_mask_replaces_repeatmasker(self):
+        t = tools.Tools(genome='mm10', fa=self.fa, soft_mask=True)
+        t.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        with open(t.fasta, 'w') as f:
+            f.write('>chr1:495-565-000-000-X\n{}\n'.format(
+                self.seq[495:565].upper()))
+        self.assertEqual(t._repeat_commands(), ([], []))
+        with contextlib.redirect_stdout(io.StringIO()):
+            t.extract_repeats()
+        self.assertListEqual(
+            t._oligo_stats[['repeat_length', 'repeat_type']].values.tolist(),
+            [[60, 'soft_masked']])
+
+class GenomeTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        seq = random_seq.tobytes().decode()
+        # (name, length, line width, line ending): a last line shorter
+        # than the others, a full last line, a single line and CRLF lines
+        self.layout = [('chr1', 1000, 60, '\n'), ('chr2', 1200, 50, '\n'),
+                       ('chr3', 77, 80, '\n'), ('chr4', 503, 70, '\r\n')]
+        self.seqs = {}
+        with open(self.fa, 'w', newline='') as f:
+            for i, (chrom, length, width, end) in enumerate(self.layout):
+                self.seqs[chrom] = seq[i * 2000:i * 2000 + length]
+                f.write('>{} description{}'.format(chrom, end))
+                f.write(''.join(self.seqs[chrom][j:j + width] + end
+                                for j in range(0, length, width)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.genome = Genome(self.fa)
+        self.pysam = pysam.FastaFile(self.fa)
+    
+    def tearDown(self):
+        self.pysam.close()
+        shutil.rmtree(self.tmp_dir)
+    
+    def _ranges(self, length):
+        """Ranges within, across the ends of and outside a chromosome"""
+        
+        return [(0, None), (0, length), (1, 2), (59, 61), (49, 101),
+                (length - 3, length), (length - 1, length + 10),
+                (-10, 5), (length, length + 5), (30, 30), (40, 20),
+                (length + 1, None)]
+    
+    def test_fetch_matches_pysam(self):
+        self.assertListEqual(list(self.genome), [x[0] for x in self.layout])
+        for chrom, length, _, _ in self.layout:
+            self.assertEqual(self.genome.length(chrom), length)
+            for start, stop in self._ranges(length):
+                stop_in = length if stop is None else min(stop, length)
+                # out of range or empty ranges are empty, not errors
+                expected = (self.pysam.fetch(chrom, max(start, 0), stop_in)
+                            if stop_in > max(start, 0) else '')
+                self.assertEqual(self.genome.fetch(chrom, start, stop,
+                                                   upper=False), expected)
+                self.assertEqual(self.genome.fetch(chrom, start, stop),
+                                 expected.upper())
+                for upper in (False, True):
+                    seq = self.genome.fetch_array(chrom, start, stop,
+                                                  upper=upper)
+                    self.assertEqual(seq.dtype, np.uint8)
+                    self.assertEqual(seq.tobytes().decode(),
+                                     expected.upper() if upper else expected)
+        self.assertEqual(self.genome.fetch('chr1', 0, 10, upper=False),
+                         self.seqs['chr1'][:10])
+    
+    def test_unknown_chromosome_raises_key_error(self):
+        for fetch in (self.genome.fetch, self.genome.fetch_array):
+            with self.assertRaises(KeyError):
+                fetch('chrX', 0, 10)
+    
+    def test_fetch_array_after_pickling(self):
+        self.genome.fetch_array('chr2', 10, 20)
+        genome = pickle.loads(pickle.dumps(self.genome))
+        self.assertEqual(genome.fetch_array('chr4', 65, 75).tobytes().decode(),
+                         self.seqs['chr4'][65:75])
+    
+    def test_checksum_changes_with_the_fasta(self):
+        with open(self.fa, 'rb') as f:
+            data = f.read()
+        copy = os.path.join(self.tmp_dir, 'copy.fa')
+        # the same fasta at another path; one base changed, keeping case;
+        # a chromosome 1bp shorter
+        changed = bytearray(data)
+        position = data.index(b'\n', data.index(b'>chr2')) + 5
+        changed[position] = ord({b'A': 'C', b'a': 'c'}.get(
+            data[position:position + 1], 'A'))
+        shorter = data.replace(data[data.index(b'>chr3'):
+                                    data.index(b'>chr4')],
+                               '>chr3 description\n{}\n'.format(
+                                   self.seqs['chr3'][:-1]).encode())
+        checksums = []
+        for contents in (data, bytes(changed), shorter):
+            for x in (copy, copy + '.fai'):
+                if os.path.exists(x):
+                    os.remove(x)
+            with open(copy, 'wb') as f:
+                f.write(contents)
+            with contextlib.redirect_stdout(io.StringIO()):
+                genome = Genome(copy)
+            checksums.append(genome.checksum)
+            self.assertEqual(genome.fingerprint, genome.checksum[:16])
+        self.assertEqual(checksums[0], self.genome.checksum)
+        self.assertEqual(len(set(checksums)), 3)
+    
+    def test_checksum_samples_large_fastas(self):
+        fa = os.path.join(self.tmp_dir, 'large.fa')
+        seq = (random_seq.tobytes().decode() * 8)[:SAMPLE_BLOCKS *
+                                                   SAMPLE_SIZE * 2]
+        checksums = []
+        for masked in (seq, seq.upper()):
+            with open(fa, 'w') as f:
+                f.write('>chr1\n')
+                f.write(''.join(masked[i:i + 60] + '\n'
+                                for i in range(0, len(masked), 60)))
+            with contextlib.redirect_stdout(io.StringIO()):
+                checksums.append(Genome(fa).checksum)
+        self.assertNotEqual(checksums[0], checksums[1])
+
+class GenomeIndexTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        seq = random_seq[:20000].tobytes().decode()
+        self.fastas = []
+        # the same build soft-masked and hard-masked: equal lengths and .fai
+        for name, masked in (('soft', seq), ('hard', re.sub('[a-z]', 'N',
+                                                             seq))):
+            fa = os.path.join(self.tmp_dir, name + '.fa')
+            with open(fa, 'w') as f:
+                f.write('>chr1\n')
+                f.write(''.join(masked[i:i + 60] + '\n'
+                                for i in range(0, len(masked), 60)))
+            self.fastas.append(fa)
+        self.sites = [len(find_sites(np.frombuffer(x.upper().encode(),
+                                                   dtype=np.uint8), 'GATC'))
+                      for x in (seq, re.sub('[a-z]', 'N', seq))]
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _genomes(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return [Genome(x) for x in self.fastas]
+    
+    def test_masked_copies_have_different_fingerprints(self):
+        soft, hard = self._genomes()
+        self.assertNotEqual(self.sites[0], self.sites[1])
+        self.assertNotEqual(soft.fingerprint, hard.fingerprint)
+        for genome, n_sites in zip((soft, hard, soft), self.sites * 2):
+            index = CutSiteIndex(genome, 'GATC', cache_dir=self.tmp_dir)
+            self.assertEqual(len(index['chr1']), n_sites)
+    
+    def test_index_of_another_fasta_is_rebuilt(self):
+        soft, hard = self._genomes()
+        CutSiteIndex(soft, 'GATC', cache_dir=self.tmp_dir)['chr1']
+        # as if the two fastas had the same fingerprint
+        hard._checksum = soft.checksum[:16] + hard.checksum[16:]
+        index = CutSiteIndex(hard, 'GATC', cache_dir=self.tmp_dir)
+        self.assertEqual(len(index['chr1']), self.sites[1])
+        with open(os.path.join(index.path, 'genome.sha1')) as f:
+            self.assertEqual(f.read().strip(), hard.checksum)
+
+class ParallelDesignTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        seq = random_seq[:50000].tobytes().decode()
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n')
+            f.write(''.join(seq[i:i + 60] + '\n'
+                            for i in range(0, len(seq), 60)))
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_genome_reopens_fasta_when_unpickled(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            genome = Genome(self.fa)
+        genome.fetch_array('chr1')
+        copy = pickle.loads(pickle.dumps(genome))
+        self.assertEqual(copy.fetch('chr1', 100, 200),
+                         genome.fetch('chr1', 100, 200))
+        np.testing.assert_array_equal(copy.fetch_array('chr1'),
+                                      genome.fetch_array('chr1'))
+    
+    def test_jobs_do_not_change_contig_design(self):
+        designs = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for jobs in (1, 3):
+                t = Tiled(genome='mm10', fa=self.fa)
+                t.gen_oligos_contig('1', region='100-40000', step=7, oligo=50,
+                                    jobs=jobs)
+                designs.append(list(t.oligo_seqs.items()))
+        self.assertEqual(len(designs[0]), (39900 - 50) // 7 + 1)
+        self.assertListEqual(designs[1], designs[0])
+
+class CaptureTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        seq = bytearray(b'A' * 5000)
+        for site in (1000, 2000, 3000, 4000):
+            seq[site:site + 4] = b'GATC'
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n{}\n'.format(seq.decode()))
+        self.bed = os.path.join(self.tmp_dir, 'viewpoints.bed')
+        self.cache_path = tools.paths.get('CACHE_PATH')
+        tools.paths['CACHE_PATH'] = self.tmp_dir
+    
+    def tearDown(self):
+        tools.paths['CACHE_PATH'] = self.cache_path
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_viewpoints_sharing_a_fragment_are_all_associated(self):
+        # a and b share a fragment; c starts within the cut site at 2000
+        with open(self.bed, 'w') as f:
+            f.write('chr1\t1500\t1501\ta\nchr1\t1700\t1701\tb\n'
+                    'chr1\t2002\t2003\tc\nchr1\t3500\t3501\td\n')
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()) as err:
+            c = Capture(genome='mm10', fa=self.fa).gen_oligos(bed=self.bed)
+        self.assertDictEqual(c._assoc, {'chr1:1000-2004': 'a,b,',
+                                        'chr1:2000-3004': 'c,',
+                                        'chr1:3000-4004': 'd,'})
+        self.assertListEqual(list(c.oligo_seqs.keys())[:2], [
+            'chr1:1000-1070-1000-2004-L', 'chr1:1934-2004-1000-2004-R'])
+        self.assertEqual(len(c.oligo_seqs), 6)
+        self.assertIn('(b) is in a fragment that is shared', err.getvalue())
+
+class OffTargetTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        self.seq = random_seq[:2000].tobytes().decode()
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n{}\n'.format(self.seq))
+        self.bed = os.path.join(self.tmp_dir, 'off_targets.bed')
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_shared_oligos_are_designed_once_for_the_last_site(self):
+        # b shares an oligo on either side with a; c is near the start of
+        # the chromosome, so its first upstream oligo is dropped
+        with open(self.bed, 'w') as f:
+            f.write('chr1\t500\t520\ta\nchr1\t530\t550\tb\n'
+                    'chr1\t50\t70\tc\n')
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = OffTarget(genome='mm10', fa=self.fa)
+            t.gen_oligos(bed=self.bed, oligo=20, step=10, max_dist=60)
+        
+        starts, names = [], {}
+        for name, start, stop in (('a', 500, 520), ('b', 530, 550),
+                                  ('c', 50, 70)):
+            for x in [start - 60, start - 50, start - 40, start - 30,
+                      stop + 10, stop + 20, stop + 30, stop + 40]:
+                if x < 0:
+                    continue
+                if x not in names:
+                    starts.append(x)
+                names[x] = name
+        self.assertEqual(len(starts), 21)
+        self.assertListEqual(list(t.oligo_seqs.items()), [
+            ('chr1:{}-{}-000-000-X'.format(x, x + 20),
+             self.seq[x:x + 20].upper()) for x in starts])
+        self.assertDictEqual(t._assoc, dict(
+            ('chr1:{}-{}'.format(x, x + 20), y) for x, y in names.items()))
+        self.assertEqual(t._assoc['chr1:470-490'], 'b')
+
+class BatchTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        seq = random_seq[:50000].tobytes().decode()
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n')
+            f.write(''.join(seq[i:i + 60] + '\n'
+                            for i in range(0, len(seq), 60)))
+        with open(os.path.join(self.tmp_dir, 'sites.bed'), 'w') as f:
+            f.write('chr1\t10000\t10001\ta\nchr1\t30000\t30001\tb\n')
+        self.cache_path = tools.paths.get('CACHE_PATH')
+        tools.paths['CACHE_PATH'] = self.tmp_dir
+    
+    def tearDown(self):
+        tools.paths['CACHE_PATH'] = self.cache_path
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_jobs_match_separate_designs(self):
+        manifest = os.path.join(self.tmp_dir, 'jobs.tsv')
+        with open(manifest, 'w') as f:
+            f.write('design\toutput\tbed\tchrom\tregion\tcontig\tstep\n'
+                    '# separate designs are compared below\n'
+                    'Capture\tcapture\tsites.bed\t\t\t\t\n'
+                    'Tiled\ttiled\t\t1\t100-20000\t\t\n'
+                    'Tiled\tcontig\t\t1\t100-20000\ttrue\t35\n'
+                    'OffTarget\toff_target\tsites.bed\t\t\t\t20\n')
+        jobs = read_manifest(manifest)
+        self.assertEqual(jobs[0]['bed'],
+                         os.path.join(self.tmp_dir, 'sites.bed'))
+        self.assertEqual(jobs[2]['step'], 35)
+        self.assertNotIn('contig', jobs[1])
+        
+        cwd = os.getcwd()
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            batch = Batch(genome='mm10', fa=self.fa, blat=True)
+            batch.run(jobs, fasta_only=True)
+            designs = [Capture(genome='mm10', fa=self.fa).gen_oligos(
+                           bed=jobs[0]['bed']),
+                       Tiled(genome='mm10', fa=self.fa).gen_oligos_capture(
+                           '1', region='100-20000'),
+                       Tiled(genome='mm10', fa=self.fa).gen_oligos_contig(
+                           '1', region='100-20000', step=35),
+                       OffTarget(genome='mm10', fa=self.fa).gen_oligos(
+                           bed=jobs[3]['bed'], step=20)]
+        self.assertEqual(os.getcwd(), cwd)
+        self.assertListEqual(list(batch.cut_sites), ['GATC'])
+        self.assertEqual(batch.run_report.records[1]['calls'], 4)
+        for job, design in zip(jobs, designs):
+            self.assertGreater(len(design.oligo_seqs), 0)
+            with open(os.path.join(job['output'], 'oligo_seqs.fa')) as f:
+                self.assertListEqual(f.read().split(), [
+                    y for x in design.oligo_seqs.items()
+                    for y in ('>' + x[0], x[1])])
+
+class ContigWindowsTest(unittest.TestCase):
+    
+    def setUp(self):
+        # N runs at both ends and across the middle of the sequence
+        self.seq = 'N' * 30 + 'ACGTTGCA' * 10 + 'N' * 25 + 'GATTACA' * 3
+        self.seq += 'N' * 11
+    
+    def _windows(self, offset, size, step, batch_size=100000):
+        seq = np.frombuffer(self.seq.encode(), dtype=np.uint8)
+        return ContigWindows('chr2', seq, offset, size, step,
+                             batch_size=batch_size)
+    
+    def test_windows_stop_at_end_of_sequence(self):
+        size, step = 20, 7
+        windows = self._windows(0, size, step, batch_size=4)
+        starts = list(range(0, len(self.seq) - size + 1, step))
+        expected = [('chr2:{}-{}-000-000-X'.format(x, x + size),
+                     self.seq[x:x + size]) for x in starts]
+        self.assertEqual(len(windows), len(starts))
+        self.assertListEqual(list(windows), expected)
+        self.assertEqual(b''.join(windows.fasta_blocks()).decode(),
+                         ''.join('>{}\n{}\n'.format(*x) for x in expected))
+        self.assertIn('N' * size, [x[1] for x in expected])
+    
+    def test_names_across_digit_widths(self):
+        starts = [0, 9, 95, 99990, 100000]
+        self.assertListEqual(oligo_names('chr2', starts, 10), [
+            'chr2:{}-{}-000-000-X'.format(x, x + 10) for x in starts])
+        self.assertListEqual(oligo_names('chr2', [], 10), [])
+        windows = self._windows(99990, 12, 5)
+        self.assertEqual(windows.names(0, 3), [
+            'chr2:{}-{}-000-000-X'.format(x, x + 12)
+            for x in (99990, 99995, 100000)])
+    
+    def test_too_short_sequence_has_no_windows(self):
+        windows = self._windows(0, len(self.seq) + 1, 1)
+        self.assertEqual(len(windows), 0)
+        self.assertListEqual(list(windows), [])
+        self.assertEqual(windows.fasta(), b'')
+    
+    def test_region_past_chromosome_end_is_clipped(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            fa = os.path.join(tmp_dir, 'genome.fa')
+            with open(fa, 'w') as f:
+                f.write('>chr2\n{}\n'.format(self.seq))
+            with contextlib.redirect_stdout(io.StringIO()):
+                t = Tiled(genome='mm10', fa=fa)
+                t.gen_oligos_contig('2', region='5-100000', step=9, oligo=30)
+        finally:
+            shutil.rmtree(tmp_dir)
+        starts = range(5, len(self.seq) - 30 + 1, 9)
+        self.assertListEqual(list(t.oligo_seqs.items()), [
+            ('chr2:{}-{}-000-000-X'.format(x, x + 30), self.seq[x:x + 30])
+            for x in starts])
+
+class StreamingTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        seq = random_seq[:60000].tobytes().decode()
+        with open(self.fa, 'w') as f:
+            f.write('>chr1\n')
+            f.write(''.join(seq[i:i + 60] + '\n'
+                            for i in range(0, len(seq), 60)))
+        self.cache_path = tools.paths.get('CACHE_PATH')
+        tools.paths['CACHE_PATH'] = self.tmp_dir
+    
+    def tearDown(self):
+        tools.paths['CACHE_PATH'] = self.cache_path
+        shutil.rmtree(self.tmp_dir)
+    
+    def _fasta(self, t, name, records=None):
+        t.fasta = os.path.join(self.tmp_dir, name)
+        with contextlib.redirect_stdout(io.StringIO()):
+            t.write_fasta(records)
+        with open(t.fasta, 'rb') as f:
+            return f.read()
+    
+    def test_streamed_fasta_matches_stored_design(self):
+        # small batches, so that records are streamed over several
+        designs = (('capture', dict(enzyme='DpnII', oligo=50)),
+                   ('contig', dict(step=17, oligo=60)))
+        for mode, kwargs in designs:
+            with contextlib.redirect_stdout(io.StringIO()), \
+                    contextlib.redirect_stderr(io.StringIO()):
+                t = Tiled(genome='mm10', fa=self.fa)
+                getattr(t, 'gen_oligos_' + mode)('1', region='50-59000',
+                                                 **kwargs)
+                records = getattr(t, 'iter_oligos_' + mode)(
+                    '1', region='50-59000', batch_size=7, **kwargs)
+            self.assertGreater(len(t.oligo_seqs), 7)
+            self.assertEqual(self._fasta(t, 'streamed.fa', records),
+                             self._fasta(t, 'stored.fa'))
+
+class SeedIndexTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        bases = np.frombuffer(b'ACGTacgt', dtype=np.uint8)[
+            rng.randint(0, 8, size=32000)]
+        chroms = {'chr1': bases[:20000], 'chr2': bases[20000:]}
+        chroms['chr1'][5000:5060] = np.frombuffer(b'ACGT', dtype=np.uint8)[
+            rng.randint(0, 4, size=60)]
+        self.oligo = chroms['chr1'][5000:5060].copy()
+        # copies of the oligo with 1 and 3 mismatches, and on the
+        # reverse strand
+        for start, changes in ((100, [7]), (400, [3, 30, 50])):
+            chroms['chr2'][start:start + 60] = self.oligo
+            for x in changes:
+                chroms['chr2'][start + x] = ord('A' if self.oligo[x] != ord('A')
+                                                else 'C')
+        chroms['chr2'][900:960] = np.frombuffer(
+            self.oligo[::-1].tobytes().decode().translate(
+                str.maketrans('ACGT', 'TGCA')).encode(), dtype=np.uint8)
+        chroms['chr2'][2000:2100] = ord('N')
+        with open(self.fa, 'w') as f:
+            for chrom, seq in sorted(chroms.items()):
+                seq = seq.tobytes().decode()
+                f.write('>{}\n'.format(chrom))
+                f.write(''.join(seq[i:i + 60] + '\n'
+                                for i in range(0, len(seq), 60)))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.genome = Genome(self.fa)
+        self.chroms = chroms
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _brute_force(self, seqs, mismatches):
+        """Counts hits by comparing every oligo with every genome window"""
+        
+        counts = []
+        for oligo in seqs:
+            rc = complement[base_codes[oligo][::-1]]
+            exact = hits = 0
+            for seq in self.chroms.values():
+                windows = np.lib.stride_tricks.sliding_window_view(
+                    base_codes[seq], len(oligo))
+                scores = np.minimum(
+                    (windows != base_codes[oligo]).sum(axis=1),
+                    (windows != rc).sum(axis=1))
+                exact += (scores == 0).sum()
+                hits += (scores <= mismatches).sum()
+            counts.append((exact, hits))
+        
+        return counts
+    
+    def test_hits_match_brute_force(self):
+        starts = [5000, 1000, 15000] + list(range(4900, 5100, 9))
+        seqs = np.array([self.chroms['chr1'][x:x + 60] for x in starts])
+        index = SeedIndex(self.genome, k=12, cache_dir=self.tmp_dir)
+        exact, hits, repeated = index.count_hits(seqs, mismatches=2)
+        self.assertListEqual(list(zip(exact.tolist(), hits.tolist())),
+                             self._brute_force(seqs, 2))
+        # the planted oligo, its reverse complement and 1 mismatch copy
+        self.assertEqual((exact[0], hits[0]), (2, 3))
+        self.assertFalse(repeated.any())
+    
+    def test_processes_and_batches_do_not_change_counts(self):
+        seqs = np.array([self.chroms['chr1'][x:x + 60]
+                         for x in range(4900, 5100, 3)])
+        index = SeedIndex(self.genome, k=12, cache_dir=self.tmp_dir)
+        expected = index.count_hits(seqs, mismatches=3)
+        reloaded = SeedIndex(self.genome, k=12, cache_dir=self.tmp_dir)
+        for counts in (reloaded.count_hits(seqs, 3, threads=2, batch_size=7),
+                       pickle.loads(pickle.dumps(index)).count_hits(seqs, 3)):
+            for x, y in zip(counts, expected):
+                np.testing.assert_array_equal(x, y)
+    
+    def test_sampled_seeds_match_brute_force(self):
+        starts = [5000, 1000, 15000] + list(range(4900, 5100, 9))
+        seqs = np.array([self.chroms['chr1'][x:x + 60] for x in starts])
+        expected = self._brute_force(seqs, 2)
+        for sample in (1, 3, 7):
+            index = SeedIndex(self.genome, k=10, sample=sample,
+                              cache_dir=self.tmp_dir)
+            exact, hits, repeated = index.count_hits(seqs, mismatches=2)
+            self.assertListEqual(list(zip(exact.tolist(), hits.tolist())),
+                                 expected)
+        # only the k-mers starting at multiples of 7 are indexed
+        self.assertEqual(len(index['chr1'][0]), (20000 - 10) // 7 + 1)
+    
+    def test_oligos_shorter_than_seeds_raise_value_error(self):
+        index = SeedIndex(self.genome, k=16, cache_dir=self.tmp_dir)
+        with self.assertRaises(ValueError):
+            index.count_hits(np.zeros((1, 40), dtype=np.uint8), mismatches=2)
+        # 57bp is (2 + 1) * 19bp, enough for 16bp seeds sampled every 4bp
+        index.count_hits(np.zeros((1, 57), dtype=np.uint8), mismatches=2)
+        with self.assertRaises(ValueError):
+            index.count_hits(np.zeros((1, 56), dtype=np.uint8), mismatches=2)
+    
+    def test_repeated_seeds_are_over_the_multimap_limit(self):
+        # 300 copies of a 20bp unit, one of them followed by the rest of
+        # an oligo
+        unit = np.frombuffer(b'ACGT', dtype=np.uint8)[rng.randint(0, 4,
+                                                                  size=20)]
+        fa = os.path.join(self.tmp_dir, 'repeats.fa')
+        seq = b''.join(unit.tobytes() + self.chroms['chr1'][i:i + 40].tobytes()
+                       for i in range(0, 12000, 40)).decode()
+        with open(fa, 'w') as f:
+            f.write('>chr1\n{}\n'.format(seq))
+        with contextlib.redirect_stdout(io.StringIO()):
+            genome = Genome(fa)
+        seqs = np.array([list(seq[:60].encode()),
+                         list(seq[70:130].encode())], dtype=np.uint8)
+        index = SeedIndex(genome, k=12, sample=1, cache_dir=self.tmp_dir)
+        exact, hits, repeated = index.count_hits(seqs, mismatches=2,
+                                                 max_seed_hits=100)
+        # the first oligo starts with the unit, and the second only
+        # overlaps it
+        self.assertListEqual(repeated.tolist(), [True, False])
+        self.assertEqual((exact[0], hits[0]), (1, 100))
+        unlimited = index.count_hits(seqs, mismatches=2, max_seed_hits=1000)
+        self.assertEqual(hits[1], unlimited[1][1])
+        self.assertFalse(unlimited[2].any())
+        self.assertEqual(unlimited[1][0], 1)
+    
+    def test_too_little_disk_space_raises_os_error(self):
+        index = SeedIndex(self.genome, k=12, cache_dir=self.tmp_dir)
+        usage = shutil.disk_usage(self.tmp_dir)
+        seqs = np.array([self.chroms['chr1'][5000:5060]])
+        with unittest.mock.patch('shutil.disk_usage',
+                                 return_value=usage._replace(free=1000)):
+            with self.assertRaises(OSError):
+                index.count_hits(seqs)
+        self.assertFalse([x for x in os.listdir(index.path)
+                          if x.endswith('.npy')])
+        index.count_hits(seqs)
+        # an index that is already built needs no more space
+        with unittest.mock.patch('shutil.disk_usage',
+                                 return_value=usage._replace(free=0)):
+            index.count_hits(seqs)
+    
+    def test_density_from_seed_hits(self):
+        t = tools.Tools(genome='mm10', fa=self.fa, seed_index=True)
+        t.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        with open(t.fasta, 'w') as f:
+            f.write('>chr1:5000-5060-000-000-X\n{}\n'.format(
+                self.oligo.tobytes().decode()))
+        cwd, cache_path = os.getcwd(), tools.paths.get('CACHE_PATH')
+        os.chdir(self.tmp_dir)
+        tools.paths['CACHE_PATH'] = self.tmp_dir
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                t.align_to_genome()
+                t.calculate_density()
+        finally:
+            os.chdir(cwd)
+            tools.paths['CACHE_PATH'] = cache_path
+        stats = t._oligo_stats.iloc[0]
+        self.assertEqual((stats['multimap'], stats['density']), (3, 3.0))
+
+class KmerTableTest(unittest.TestCase):
+    
+    k = 5
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.fa = os.path.join(self.tmp_dir, 'genome.fa')
+        self.chroms = {'chr1': random_seq[:3000].tobytes().decode(),
+                       'chr2': random_seq[3000:4800].tobytes().decode() +
+                               'ACGT' * 50}
+        with open(self.fa, 'w') as f:
+            for chrom, seq in sorted(self.chroms.items()):
+                f.write('>{}\n{}\n'.format(chrom, seq))
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.table = KmerTable(Genome(self.fa), k=self.k,
+                                   cache_dir=self.tmp_dir)
+            self.table.table
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _canonical(self, kmer):
+        return min(kmer, kmer[::-1].translate(str.maketrans('ACGT', 'TGCA')))
+    
+    def _expected_counts(self):
+        counts = {}
+        for seq in self.chroms.values():
+            seq = seq.upper()
+            for i in range(len(seq) - self.k + 1):
+                if 'N' not in seq[i:i + self.k]:
+                    kmer = self._canonical(seq[i:i + self.k])
+                    counts[kmer] = counts.get(kmer, 0) + 1
+        
+        return counts
+    
+    def test_counts_cover_both_strands(self):
+        expected = self._expected_counts()
+        codes, counts = self.table.table
+        kmers = [''.join('ACGT'[(x >> (2 * (self.k - 1 - i))) & 3]
+                         for i in range(self.k)) for x in codes.tolist()]
+        self.assertDictEqual(dict(zip(kmers, counts.tolist())), expected)
+    
+    def test_merging_in_small_chunks_does_not_change_table(self):
+        cache_dir = os.path.join(self.tmp_dir, 'chunks')
+        for merge_size in (1, 7, 100):
+            with contextlib.redirect_stdout(io.StringIO()):
+                table = KmerTable(self.table.genome, k=self.k,
+                                  cache_dir=cache_dir, merge_size=merge_size)
+                for x, y in zip(table.table, self.table.table):
+                    np.testing.assert_array_equal(x, y)
+            # the per-chromosome runs are removed once merged
+            self.assertListEqual(sorted(os.listdir(table.path)),
+                                 ['codes.npy', 'counts.npy', 'genome.sha1'])
+            shutil.rmtree(cache_dir)
+    
+    def test_scores_are_max_and_mean_kmer_counts(self):
+        expected = self._expected_counts()
+        seqs = [self.chroms['chr1'][i:i + 20].upper()
+                for i in range(0, 1000, 37)]
+        max_counts, mean_counts = KmerTable(
+            self.table.genome, k=self.k, cache_dir=self.tmp_dir).score(
+                np.array([list(x.encode()) for x in seqs], dtype=np.uint8),
+                batch_size=4)
+        for seq, max_count, mean_count in zip(seqs, max_counts, mean_counts):
+            counts = [expected[self._canonical(seq[i:i + self.k])]
+                      for i in range(20 - self.k + 1)
+                      if 'N' not in seq[i:i + self.k]]
+            self.assertEqual(max_count, max(counts or [0]))
+            self.assertAlmostEqual(mean_count, np.mean(counts or [0]))
+    
+    def test_filter_removes_oligos_with_common_kmers(self):
+        t = tools.Tools(genome='mm10', fa=self.fa)
+        t._create_attr(20)
+        seqs = np.array([list(self.chroms['chr1'][:20].upper().encode()),
+                         list(b'ACGTACGTACGTACGTACGT')], dtype=np.uint8)
+        t.oligo_seqs.append('chr1', [0, 100], seqs)
+        cache_path = tools.paths.get('CACHE_PATH')
+        tools.paths['CACHE_PATH'] = self.tmp_dir
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                t.filter_kmers(mean_count=np.mean(list(
+                    self._expected_counts().values())) * 2, k=self.k)
+        finally:
+            tools.paths['CACHE_PATH'] = cache_path
+        self.assertListEqual(list(t.oligo_seqs), ['chr1:0-20-000-000-X'])
+
+class RunCommandsTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        tools.paths['PYTHON_PATH'] = os.path.dirname(sys.executable)
+        self.tools = tools.Tools(genome='mm10', fa='')
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _command(self, name, code):
+        log = os.path.join(self.tmp_dir, '{}_log.txt'.format(name))
+        options = ('PYTHON_PATH', os.path.basename(sys.executable), name, log,
+                   log)
+        
+        return options, '-c "{}"'.format(code), 'Running'
+    
+    def test_each_tool_writes_its_own_log(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tools._run_commands([self._command('a', 'print(1)'),
+                                      self._command('b', 'print(2)')])
+        for name, text in (('a', '1'), ('b', '2')):
+            with open(os.path.join(self.tmp_dir, name + '_log.txt')) as f:
+                self.assertEqual(f.read().strip(), text)
+    
+    def test_failure_stops_other_tools(self):
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()), \
+                contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(subprocess.CalledProcessError) as cm:
+                self.tools._run_commands(
+                    [self._command('slow', 'import time; time.sleep(30)'),
+                     self._command('crash', 'import sys; sys.exit(3)')],
+                    poll=0.05)
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertLess(time.time() - start, 10)
+    
+    def test_tools_are_added_to_run_report(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tools._run_commands([
+                self._command('a', 'x = sum(range(10**6))'),
+                self._command('b', 'print(2)')], poll=0.05)
+        records = dict((x['name'], x) for x in self.tools.run_report.records)
+        self.assertListEqual(sorted(records), ['a', 'b'])
+        self.assertEqual(records['a']['calls'], 1)
+        self.assertGreater(records['a']['wall_s'], 0)
+        self.assertGreaterEqual(records['a']['cpu_s'], 0)
+    
+    def test_failed_work_stops_tools(self):
+        def work():
+            raise ValueError
+        
+        start = time.time()
+        with contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(ValueError):
+                self.tools._run_commands(
+                    [self._command('slow', 'import time; time.sleep(30)')],
+                    work=work)
+        self.assertLess(time.time() - start, 10)
+    
+    def test_star_command_uses_threads_and_shared_memory(self):
+        self.tools.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        open(self.tools.fasta, 'w').close()
+        for shared_memory, genome_load in ((False, 'NoSharedMemory'),
+                                           (True, 'LoadAndKeep')):
+            self.tools.threads = 12
+            self.tools.shared_memory = shared_memory
+            cmd = self.tools._align_command('/mm9/STAR')[1].split()
+            self.assertEqual(cmd[cmd.index('--runThreadN') + 1], '12')
+            self.assertEqual(cmd[cmd.index('--genomeLoad') + 1], genome_load)
+
+class RunReportTest(unittest.TestCase):
+    
+    def test_repeated_stages_add_up_and_call_hooks(self):
+        report = runreport.RunReport()
+        seen = runreport.register_hook(lambda x: calls.append(x))
+        calls = []
+        try:
+            for items in (3, 4):
+                with report.stage('cut_sites') as stage:
+                    stage['items'] = items
+            with self.assertRaises(ValueError):
+                with report.stage('write_fasta'):
+                    raise ValueError
+        finally:
+            runreport.remove_hook(seen)
+        report.record('STAR', 2.0, 1.5, 100.0)
+        self.assertListEqual([x['name'] for x in calls],
+                             ['cut_sites', 'cut_sites', 'write_fasta'])
+        stages = report.to_dict()['stages']
+        self.assertListEqual([(x['name'], x['calls'], x['items'])
+                              for x in stages],
+                             [('cut_sites', 2, 7), ('write_fasta', 1, None),
+                              ('STAR', 1, None)])
+        self.assertEqual(stages[2]['peak_rss_mb'], 100.0)
+        self.assertTrue(all(x['wall_s'] >= 0 for x in stages))
+
+class RepeatShardsTest(unittest.TestCase):
+    
+    header = ['   SW  perc perc perc  query      position in query\n',
+              'score  div. del. ins.  sequence    begin     end\n', '\n']
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tools = tools.Tools(genome='mm10', fa='')
+        self.tools.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        with open(self.tools.fasta, 'w') as f:
+            f.writelines('>chr1:{}-{}-000-000-X\nACGT\n'.format(i, i + 4)
+                         for i in range(5))
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _repeat_line(self, oligo, repeat_id):
+        return ('  20  0.0  0.0  0.0  {}  1  4  (0) +  (A)n  Simple_repeat  '
+                '1  4  (0)  {}\n'.format(oligo, repeat_id))
+    
+    def test_shards_split_oligos_evenly_and_in_order(self):
+        shard_files = self.tools._shard_fasta(2)
+        records = []
+        for shard_file in shard_files:
+            with open(shard_file) as f:
+                records.append(f.read().split('\n')[:-1])
+        self.assertListEqual([len(x) // 2 for x in records], [2, 3])
+        with open(self.tools.fasta) as f:
+            self.assertEqual(sum(records, []), f.read().split('\n')[:-1])
+    
+    def test_merged_output_renumbers_ids_and_removes_shards(self):
+        shard_files = self.tools._shard_fasta(3)
+        outputs = [self.header + [self._repeat_line('chr1:0-4-000-000-X', 1)],
+                   ['There were no repetitive sequences detected\n'],
+                   self.header + [self._repeat_line('chr1:3-7-000-000-X', 1),
+                                  self._repeat_line('chr1:4-8-000-000-X', 2)]]
+        for shard_file, lines in zip(shard_files, outputs):
+            with open(shard_file + '.out', 'w') as f:
+                f.writelines(lines)
+        self.tools._merge_repeats(shard_files)
+        
+        with open(self.tools.fasta + '.out') as f:
+            lines = f.readlines()
+        self.assertListEqual(lines[:3], self.header)
+        self.assertListEqual([x.split()[4] for x in lines[3:]],
+                             ['chr1:0-4-000-000-X', 'chr1:3-7-000-000-X',
+                              'chr1:4-8-000-000-X'])
+        self.assertListEqual([x.split()[-1] for x in lines[3:]],
+                             ['1', '2', '3'])
+        self.assertListEqual(sorted(os.listdir(self.tmp_dir)),
+                             ['oligo_seqs.fa', 'oligo_seqs.fa.out'])
+
+class ResultCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'results.sqlite')
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _repeats(self, lengths):
+        return pd.DataFrame({'repeat_length': lengths,
+                             'repeat_type': ['(A)n'] * len(lengths)})
+    
+    def test_results_are_found_by_sequence_and_key(self):
+        cache = ResultCache(self.path)
+        cache.put('repeats', 'a', ['AAAA', 'CCCC'], self._repeats([4, 0]))
+        found, values = cache.get('repeats', 'a', ['CCCC', 'GGGG', 'AAAA'])
+        self.assertListEqual(found.tolist(), [True, False, True])
+        self.assertListEqual(values['repeat_length'].tolist(), [0, 4])
+        found = cache.get('repeats', 'b', ['AAAA'])[0]
+        self.assertListEqual(found.tolist(), [False])
+        found = cache.get('alignments', 'a', ['AAAA'])[0]
+        self.assertListEqual(found.tolist(), [False])
+        cache.close()
+        
+        stats = ResultCache(self.path).stats()
+        self.assertListEqual(stats.loc['repeats'].tolist(), [2, 2, 2])
+        self.assertListEqual(stats.loc['alignments'].tolist(), [0, 0, 1])
+    
+    def test_least_recently_used_results_are_evicted(self):
+        cache = ResultCache(self.path, max_entries=3)
+        for seq in ('AAAA', 'CCCC', 'GGGG'):
+            cache.put('repeats', 'a', [seq], self._repeats([1]))
+            time.sleep(0.01)
+        cache.get('repeats', 'a', ['AAAA'])
+        time.sleep(0.01)
+        cache.put('repeats', 'a', ['TTTT'], self._repeats([1]))
+        found = cache.get('repeats', 'a', ['AAAA', 'CCCC', 'GGGG', 'TTTT'])[0]
+        self.assertListEqual(found.tolist(), [True, False, True, True])
+        cache.close()
+    
+    def test_only_uncached_oligos_are_sent_to_tools(self):
+        fa = os.path.join(self.tmp_dir, 'genome.fa')
+        with open(fa, 'w') as f:
+            f.write('>chr1\n{}\n'.format('ACGT' * 10))
+        t = tools.Tools(genome='mm10', fa=fa, blat=True, cache=self.path)
+        t.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        seqs = ['AAAA', 'CCCC', 'GGGG', 'TTTT']
+        with open(t.fasta, 'w') as f:
+            f.writelines('>chr1:{}-{}-000-000-X\n{}\n'.format(i, i + 4, x)
+                         for i, x in enumerate(seqs))
+        with contextlib.redirect_stdout(io.StringIO()):
+            keys = t._cache_key('repeats'), t._cache_key('alignments')
+        cache = ResultCache(self.path)
+        cache.put('repeats', keys[0], seqs[:2], self._repeats([4, 3]))
+        cache.put('alignments', keys[1], seqs,
+                  pd.DataFrame({'multimap': [1, 2, 3, 4], 'matches': 4,
+                                'mismatches': 0}))
+        cache.close()
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            commands, shard_files = t._repeat_commands()
+            self.assertListEqual(t._align_commands(''), [])
+        self.assertEqual(len(commands), 1)
+        with open(shard_files[0]) as f:
+            self.assertListEqual(f.read().split()[1::2], seqs[2:])
+        with open(shard_files[0] + '.out', 'w') as f:
+            f.writelines(RepeatShardsTest.header + [
+                '  20  0.0  0.0  0.0  chr1:3-7-000-000-X  1  2  (0) +  (T)n  '
+                'Simple_repeat  1  2  (0)  1\n'])
+        with contextlib.redirect_stdout(io.StringIO()):
+            t._merge_repeats(shard_files)
+            t.extract_repeats().calculate_density()
+        
+        stats = t._oligo_stats
+        self.assertListEqual(stats['repeat_length'].tolist(), [4, 3, 0, 2])
+        self.assertListEqual(stats['repeat_type'].tolist(),
+                             ['(A)n', '(A)n', 'NA', '(T)n'])
+        self.assertListEqual(stats['multimap'].tolist(), [1, 2, 3, 4])
+        self.assertListEqual(stats['density'].tolist(), [1.0] * 4)
+        cache = ResultCache(self.path)
+        found, values = cache.get('repeats', keys[0], seqs)
+        self.assertTrue(found.all())
+        self.assertListEqual(values['repeat_length'].tolist(), [4, 3, 0, 2])
+        cache.close()
+
+class PreviousDesignTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def _tools(self, records):
+        t = tools.Tools(genome='mm10', fa='', blat=True)
+        t.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        with open(t.fasta, 'w') as f:
+            f.writelines('>{}\n{}\n'.format(*x) for x in records)
+        return t
+    
+    def test_only_new_oligos_are_scored(self):
+        previous = self._tools([('chr1:0-4-0-20-L', 'AAAA'),
+                                ('chr1:16-20-0-20-R', 'CCCC'),
+                                ('chr2:5-9-000-000-X', 'GGGG')])
+        previous._populate_oligo_stats()
+        stats = previous._oligo_stats
+        stats['multimap'] = [3, 1, 2]
+        stats['density'] = [2.57, 1.0, 0.33]
+        stats['repeat_length'] = [4, 0, 2]
+        stats['repeat_type'] = ['(A)n', 'NA', '(G)n']
+        path = os.path.join(self.tmp_dir, 'previous_info.txt.gz')
+        with contextlib.redirect_stdout(io.StringIO()):
+            previous.write_oligo_info(path)
+        
+        # one oligo is removed, one added and one has another sequence
+        t = self._tools([('chr1:16-20-0-20-R', 'CCCC'),
+                         ('chr2:5-9-000-000-X', 'GGGA'),
+                         ('chr1:0-4-0-20-L', 'AAAA'),
+                         ('chr3:1-5-000-000-X', 'TTTT')])
+        with contextlib.redirect_stdout(io.StringIO()):
+            t.load_oligo_info(path)
+            commands, shard_files = t._repeat_commands()
+            commands += t._align_commands('')
+        self.assertEqual(len(commands), 2)
+        with open(shard_files[0]) as f:
+            self.assertListEqual(f.read().split()[::2],
+                                 ['>chr2:5-9-000-000-X', '>chr3:1-5-000-000-X'])
+        with open(shard_files[0] + '.out', 'w') as f:
+            f.write('There were no repetitive sequences detected\n')
+        blat_file = os.path.join(self.tmp_dir, 'blat_out.psl')
+        with open(blat_file, 'w') as f:
+            f.write('psLayout version 3\n\nmatch\tmis-\n\tmatch\n---\n')
+            f.write('4\t0\t0\t0\t0\t0\t0\t0\t+\tchr3:1-5-000-000-X\t4\t0\t'
+                    '4\tchr3\t100\t1\t5\t1\t4,\t0,\t1,\n')
+        with contextlib.redirect_stdout(io.StringIO()):
+            t._merge_repeats(shard_files)
+            t.extract_repeats().calculate_density(blat_file=blat_file)
+        
+        stats = t._oligo_stats
+        self.assertListEqual(stats['multimap'].tolist(), [1, 0, 3, 1])
+        self.assertListEqual(stats['density'].tolist(), [1.0, 0, 2.57, 1.25])
+        self.assertListEqual(stats['repeat_length'].tolist(), [0, 0, 4, 0])
+        self.assertListEqual(stats['repeat_type'].tolist(),
+                             ['NA', 'NA', '(A)n', 'NA'])
+
+class WriteOligoInfoTest(unittest.TestCase):
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tools = tools.Tools(genome='mm10', fa='')
+        self.tools.fasta = os.path.join(self.tmp_dir, 'oligo_seqs.fa')
+        keys = ['chr10:5-9-000-000-X', 'chrX:1-5-000-000-X',
+                'chr2:8-12-0-20-R', 'chr2:3-7-0-20-L', 'chr1:2-6-000-000-X']
+        with open(self.tools.fasta, 'w') as f:
+            f.writelines('>{}\nACGT\n'.format(x) for x in keys)
+        self.tools._assoc = {'chr2:0-20': 'gene'}
+    
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_rows_are_in_natural_chromosome_order(self):
+        path = os.path.join(self.tmp_dir, 'oligo_info.txt')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tools.write_oligo_info(path, batch_size=2)
+        with open(path) as f:
+            lines = [x.rstrip('\n').split('\t') for x in f]
+        self.assertEqual(len(lines), 6)
+        self.assertListEqual([x[:3] for x in lines[1:]],
+                             [['chr1', '2', '6'], ['chr2', '3', '7'],
+                              ['chr2', '8', '12'], ['chr10', '5', '9'],
+                              ['chrX', '1', '5']])
+        self.assertListEqual(lines[1][3:6] + lines[1][10:], ['.'] * 3 + [
+            'NA', '50', '.'])
+        self.assertListEqual(lines[2][3:7] + lines[2][-1:],
+                             ['0', '20', 'L', 'ACGT', 'gene'])
+    
+    def test_gzip_output_matches_text(self):
+        path = os.path.join(self.tmp_dir, 'oligo_info.txt')
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.tools.write_oligo_info(path)
+            self.tools.write_oligo_info(path + '.gz')
+        with open(path, 'rb') as f, gzip.open(path + '.gz') as g:
+            self.assertEqual(f.read(), g.read())
+
+if __name__ == '__main__':
+    unittest.main()
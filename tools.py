@@ -3,13 +3,31 @@
 from __future__ import print_function, division
 
 from collections import namedtuple
+import contextlib
+import functools
+import gzip
+from concurrent.futures import ProcessPoolExecutor  # Python 2: futures
+import itertools
 import os
 import re
+import shlex
+import signal
 import subprocess
+import sys
+import time
 
+import numpy as np  # >=1.7
 import pandas as pd  # >=0.17
-import pysam  # >=0.8
-from Bio import SeqIO  # >=1.60
+
+from alignments import tally_hits, tally_psl, tally_sam
+from genome import Genome
+from kmers import KmerTable
+from oligos import OligoTable
+from repeats import has_repeats, masked_repeats, read_repeats
+from resultcache import ResultCache, fingerprint, kinds
+from runreport import RunReport, _rss_mb
+from seeds import SeedIndex
+from windows import oligo_sequences
 
 species = {'mm9': 'mouse',
            'mm10': 'mouse',
@@ -19,17 +37,93 @@ species = {'mm9': 'mouse',
 
 repeat_param = '-noint -s -species {} {}'
 blat_param = '-stepSize=5 -minScore=10 -minIdentity=0 -repMatch=999999'
-star_param = '--readFilesIn {} --genomeDir {} --runThreadN 4 --genomeLoad NoSharedMemory ' \
+star_param = '--readFilesIn {} --genomeDir {} --runThreadN {} --genomeLoad {} ' \
              '--outFilterMultimapScoreRange 1000 --outFilterMultimapNmax ' \
              '100000 --outFilterMismatchNmax 110 --seedSearchStartLmax 4 ' \
              '--seedSearchLmax 20 --alignIntronMax 10 --seedPerWindowNmax ' \
              '15 --seedMultimapNmax 11000 --winAnchorMultimapNmax 200 ' \
              '--limitOutSAMoneReadBytes 400000 --outFileNamePrefix oligos_'
+star_load_param = '--genomeDir {} --genomeLoad {} --outFileNamePrefix {}'
 
 pat = re.compile('^[A-Z]')
 config_path = os.path.join(os.path.dirname(__file__), 'config.txt')
 paths = dict((x.strip().split(' = ') for x in open(config_path) if pat.match(x)))
 
+def _round_2dp(values):
+    """Rounds to 2 decimal places as float('{0:.2f}'.format(x)) does, once
+    per distinct value
+    
+    """
+    
+    uniques, inverse = np.unique(values, return_inverse=True)
+    rounded = np.array([float('{0:.2f}'.format(x)) for x in uniques.tolist()])
+    
+    return rounded[inverse].reshape(np.shape(values))
+
+def _stage(name, items=None):
+    """Decorator that records each call of a `Tools` method as a stage of
+    its `run_report`; `items`, if given, is called with the object after
+    the method returns to count the items of the stage
+    
+    """
+    
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.run_report.stage(name) as stage:
+                result = method(self, *args, **kwargs)
+                if items is not None:
+                    stage['items'] = items(self)
+            return result
+        return wrapper
+    
+    return decorator
+
+def _n_stats(tools):
+    
+    return len(tools._oligo_stats)
+
+def _poll(proc):
+    """Returns the exit status of a tool, None while it is running, and
+    its resource usage (None where the platform does not report it)
+    
+    """
+    
+    if proc.returncode is not None or not hasattr(os, 'wait4'):
+        return proc.poll(), None
+    pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+    if not pid:
+        return None, None
+    # the process has been reaped, so its status is set here for Popen
+    if os.WIFEXITED(status):
+        proc.returncode = os.WEXITSTATUS(status)
+    else:
+        proc.returncode = -os.WTERMSIG(status)
+    
+    return proc.returncode, usage
+
+def _stop(proc):
+    """Terminates a running tool, and any processes it started"""
+    
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except (AttributeError, OSError):
+        proc.terminate()
+    proc.wait()
+    
+    return None
+
+def _design_chunk(design, method, args):
+    """Runs one chunk of a design in a worker process and returns the
+    oligos and associations it produced
+    
+    """
+    
+    design._create_attr(design.oligo)
+    getattr(design, method)(*args)
+    
+    return design.oligo_seqs, design._assoc
+
 class Tools(object):
     """
     
@@ -45,61 +139,307 @@ class Tools(object):
     blat : bool
         Check off-target binding using BLAT instead of STAR (not
         recommended for large designs), default = False
+    threads : int
+        The number of threads STAR aligns with, or processes the seed
+        index searches in, default = 4
+    shared_memory : bool
+        Align with a STAR index held in shared memory, loading it first
+        if it is not already loaded; it stays loaded for later runs on the
+        same machine until `remove_star_index` is called, default = False
+    seed_index : bool
+        Count off-target hits in this process with a `seeds.SeedIndex` of
+        the reference, instead of running STAR or BLAT, default = False
+    mismatches : int
+        The most mismatches an off-target hit can have when `seed_index`
+        = True, default = 2
+    soft_mask : bool
+        Take repeats from the soft-masked (lower case) bases of the
+        reference, as in UCSC and iGenomes fastas, instead of running
+        RepeatMasker, default = False
+    cache : str
+        Path to a `resultcache.ResultCache` file of repeat and alignment
+        results from earlier runs; only oligos without a cached result are
+        sent to RepeatMasker and the aligner, and new results are added to
+        the file. Default = None (no cache)
     fasta : str
         Name of fasta file for oligo sequences, default = oligo_seqs.fa
-    oligo_seqs : dict
-        Contains all oligo sequences after generating oligos
+    run_report : runreport.RunReport
+        Wall time, CPU time, peak memory and item counts of each stage run
+        by this object (loading the genome, generating oligos, writing the
+        fasta, each external tool, parsing their output and writing the
+        oligo information); see `runreport.register_hook` to follow stages
+        as they finish
+    genome_seq : Genome
+        Indexed reference genome; sequences are read from `fa` on demand.
+        A `Genome` of `fa` that is already open can be passed to
+        `__init__` instead, to share it between designs (see
+        `design.Batch`)
+    cut_sites : dict
+        The `cutsites.CutSiteIndex` of each recognition sequence the
+        design has used, keyed by sequence
+    oligo_seqs : OligoTable
+        Contains all oligo sequences after generating oligos; behaves as a
+        read-only dict of sequences keyed by oligo coordinates
         
     """
     
-    def __init__(self, genome, fa, blat=False):
+    def __init__(self, genome, fa, blat=False, threads=4, shared_memory=False,
+                 seed_index=False, mismatches=2, soft_mask=False, cache=None,
+                 genome_seq=None):
         self.genome = genome
         self.fa = fa
         self.blat = blat
+        self.threads = threads
+        self.shared_memory = shared_memory
+        self.seed_index = seed_index
+        self.mismatches = mismatches
+        self.soft_mask = soft_mask
+        self.cache = cache
         self.fasta = 'oligo_seqs.fa'
-        if self.__class__.__name__ != 'Tools':
+        self._uncached = {}
+        self.run_report = RunReport()
+        self.cut_sites = {}
+        if genome_seq is not None:
+            self.genome_seq = genome_seq
+        elif self.__class__.__name__ != 'Tools':
             print('Loading reference fasta file...')
-            self.genome_seq = SeqIO.to_dict(SeqIO.parse(fa, 'fasta'))
+            with self.run_report.stage('genome_load') as stage:
+                self.genome_seq = Genome(fa)
+                stage['items'] = len(self.genome_seq)
             print('\t...complete')
             
     def _create_attr(self, oligo):
         """Creates `oligo`, `oligo_seqs` and `_assoc` attributes"""
         
         self.oligo = oligo
-        self.oligo_seqs = {}
+        self.oligo_seqs = OligoTable(oligo)
         self._assoc = {}
+    
+    @_stage('generate', lambda x: len(x.oligo_seqs))
+    def _run_chunks(self, method, chunks, jobs=1):
+        """Calls `method` once for each tuple of arguments in `chunks`
+        
+        With `jobs` > 1 the chunks are spread over a pool of worker
+        processes; each worker opens the reference fasta itself, and the
+        oligos and associations they return are merged in chunk order, so
+        the result is the same as running the chunks one after another.
+        
+        """
+        
+        if jobs == 1 or len(chunks) < 2:
+            for args in chunks:
+                getattr(self, method)(*args)
+            return None
+        
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(_design_chunk, self, method, args)
+                       for args in chunks]
+            results = [x.result() for x in futures]
+        for oligo_seqs, assoc in results:
+            self.oligo_seqs.extend(oligo_seqs)
+            self._assoc.update(assoc)
+        
+        return None
 
-    def write_fasta(self):
-        """Writes `oligo_seqs` attribute to fasta file"""
+    @_stage('filter_kmers', lambda x: len(x.oligo_seqs))
+    def filter_kmers(self, max_count=None, mean_count=None, k=17):
+        """Removes oligos made up of k-mers that are common in the genome
+        from `oligo_seqs`, before they are written to the fasta, so that
+        RepeatMasker and the aligner have fewer oligos to process
+        
+        Each oligo is scored with the largest and the mean number of times
+        its k-mers occur in the genome (on either strand), looked up in a
+        `kmers.KmerTable`; the table is built the first time it is used
+        for a genome and k, and memory-mapped afterwards.
         
+        Parameters
+        ----------
+        max_count : int, optional
+            Remove oligos with any k-mer that occurs more often than this
+        mean_count : float, optional
+            Remove oligos whose k-mers occur more often than this on
+            average
+        k : int, optional
+            k-mer length (bp), default = 17
+        
+        Returns
+        -------
+        self : object
+        
+        """
+        
+        oligos = self.oligo_seqs
+        keep = np.ones(len(oligos), dtype=bool)
+        if len(oligos) and (max_count is not None or mean_count is not None):
+            max_counts, mean_counts = KmerTable(self._reference(), k=k).score(
+                oligos.seqs)
+            if max_count is not None:
+                keep &= max_counts <= max_count
+            if mean_count is not None:
+                keep &= mean_counts <= mean_count
+            self.oligo_seqs = oligos.select(keep)
+        print('Removed {} of {} oligos with repetitive {}-mers'.format(
+            len(oligos) - len(self.oligo_seqs), len(oligos), k))
+        
+        return self
+    
+    @_stage('write_fasta', lambda x: None if x._fasta_oligos is None else len(
+        x._fasta_oligos))
+    def write_fasta(self, records=None, batch_size=100000):
+        """Writes oligos to fasta file
+        
+        Parameters
+        ----------
+        records : iterable, optional
+            (key, sequence) records to write, e.g. from one of the
+            streaming `iter_oligos` methods; objects with a `fasta_blocks`
+            method (such as `windows.ContigWindows`) are written from their
+            pre-formatted blocks. Omit to write the `oligo_seqs` attribute
+        batch_size : int, optional
+            The number of records formatted and written at a time,
+            default = 100000
+        
+        """
+        
+        records = self.oligo_seqs if records is None else records
+        # statistics belong to the oligos in the fasta, so any from a
+        # previous fasta are discarded
+        self.__dict__.pop('_oligo_stats', None)
+        self.__dict__.pop('_previous', None)
+        self._uncached = {}
+        self._fasta_oligos = records if isinstance(records, OligoTable) else None
+        if hasattr(records, 'fasta_blocks'):
+            with open(self.fasta, 'wb') as fa_w:
+                for block in records.fasta_blocks():
+                    fa_w.write(block)
+            print('Wrote oligos to {}'.format(self.fasta))
+            return None
+        
+        records = iter(records.items() if hasattr(records, 'items') else records)
         with open(self.fasta, 'w') as fa_w:
-            for key, value in self.oligo_seqs.items():
-                fa_w.write('>{}\n{}\n'.format(key, value))
+            while True:
+                batch = ''.join('>{}\n{}\n'.format(key, value) for key, value
+                                in itertools.islice(records, batch_size))
+                if not batch:
+                    break
+                fa_w.write(batch)
         
         print('Wrote oligos to {}'.format(self.fasta))
         
         return None
     
-    def detect_repeats(self):
-        """Detects repeat sequences in oligos, using RepeatMasker"""
+    def load_oligo_info(self, path):
+        """Loads the scores of a previous design, so that only the oligos
+        that are new since then are sent to RepeatMasker and the aligner;
+        call after `write_fasta`
         
-        options = ('RM_PATH', 'RepeatMasker', 'RepeatMasker',
-                   'rm_log.txt', ''.join((self.fasta, '.out')))
-        cmd = repeat_param.format(species[self.genome.lower()], self.fasta)
-        msg = 'Checking for repeat sequences in oligos,'
+        The oligos in the fasta are matched to those of the previous design
+        by coordinates and sequence. Oligos found in both keep their
+        previous repeat length and class, number of alignments and density
+        score, while new oligos are scored as usual, and oligos of the
+        previous design that are no longer designed are dropped. As the
+        oligos and their associations are generated afresh (e.g. from a bed
+        file with added viewpoints, including any that share a fragment
+        with an existing one), the oligo information written afterwards is
+        the same as that of a full rerun with the same settings.
+        
+        Parameters
+        ----------
+        path : str
+            oligo_info file of the previous design, as written by
+            `write_oligo_info` (text, .gz or .parquet)
+        
+        Returns
+        -------
+        self : object
+        
+        """
+        
+        try:
+            self._oligo_stats
+        except AttributeError:
+            self._populate_oligo_stats()
+        
+        if path.endswith('.parquet'):
+            info = pd.read_parquet(path)
+        else:
+            info = pd.read_csv(path, sep='\t', keep_default_na=False,
+                               dtype={'chr': str, 'fragment_start': str,
+                                      'fragment_stop': str,
+                                      'side_of_fragment': str,
+                                      'repeat_class': str})
+        # missing values are '.' or 'NA' in text, and null in Parquet
+        sides = info['side_of_fragment'].fillna('.').astype(str).values
+        is_x = sides == '.'
+        coors = [info[x].astype(str).values for x in ('start', 'stop')] + [
+            np.where(is_x, '000', info[x].astype(str).values)
+            for x in ('fragment_start', 'fragment_stop')] + [
+                np.where(is_x, 'X', sides)]
+        keys = info['chr'].astype(str).values + ':' + coors[0]
+        for column in coors[1:]:
+            keys = keys + '-' + column
+        repeat_types = info['repeat_class'].fillna('NA').values
+        previous = pd.DataFrame({
+            'multimap': info['total_number_of_alignments'].values,
+            'density': info['density_score'].values,
+            'repeat_length': info['repeat_length'].values,
+            'repeat_type': repeat_types.astype(object),
+        }, index=pd.Index(keys))
+        unique = ~previous.index.duplicated()
+        previous = previous[unique]
+        
+        rows = previous.index.get_indexer(self._oligo_stats.index)
+        # an oligo at the same coordinates but with another sequence (e.g.
+        # from another build) is scored again
+        found = np.flatnonzero(rows >= 0)
+        seqs = np.array(oligo_sequences(self._stats_oligos.seqs[found]),
+                        dtype=object)
+        rows[found[info['sequence'].values[unique][rows[found]] != seqs]] = -1
+        self._previous = (rows, previous)
+        n_found = int((rows >= 0).sum())
+        print('{} of {} oligos were scored by the previous design; {} of its '
+              'oligos are no longer designed'.format(
+                  n_found, len(rows), len(previous) - n_found))
+        
+        return self
+    
+    def detect_repeats(self, shards=None):
+        """Detects repeat sequences in oligos, using RepeatMasker; nothing
+        is run if `soft_mask` = True, as `extract_repeats` then reads the
+        repeats from the reference. With a `cache` or a previous design
+        (see `load_oligo_info`), only the oligos whose repeats are not
+        known yet are checked
+        
+        Parameters
+        ----------
+        shards : int, optional
+            The number of RepeatMasker processes to run at once, each on an
+            equal share of the oligos; their output is merged into a single
+            .out file. Default = RM_SHARDS in config.txt
         
-        self._run_command(options, cmd, msg)
+        """
+        
+        commands, shard_files = self._repeat_commands(shards)
+        self._run_commands(commands)
+        self._merge_repeats(shard_files)
         
         return self
     
     def align_to_genome(self, s_idx=''):
-        """Aligns oligos to the genome using BLAT or STAR
+        """Aligns oligos to the genome using BLAT or STAR, or counts their
+        hits with a seed index if `seed_index` = True (see
+        `count_seed_hits`)
+        
+        With a `cache` or a previous design (see `load_oligo_info`), only
+        the oligos whose alignments are not known yet are aligned, from
+        their own fasta (e.g. oligo_seqs.uncached1.fa), and the aligner is
+        not run at all if every oligo has them.
         
         Parameters
         ----------
         s_idx : str
             Path to the directory containing the STAR index for this
-            genome (not required if blat=True)
+            genome (not required if blat=True or seed_index=True)
             
         Raises
         ------
@@ -111,31 +451,354 @@ class Tools(object):
             
         """
         
+        if self.seed_index:
+            self.count_seed_hits()
+        else:
+            self._run_commands(self._align_commands(s_idx))
+        
+        return None
+    
+    def detect_repeats_and_align(self, s_idx='', shards=None):
+        """Runs `detect_repeats` and `align_to_genome` at the same time
+        
+        Both tools only read the oligo fasta, so they are started together
+        and the stage takes as long as the slower of the two. Each writes
+        to its own log file. If either exits with an error the other is
+        stopped straight away. With `seed_index` = True, hits are counted
+        in this process while RepeatMasker runs.
+        
+        Parameters
+        ----------
+        s_idx : str
+            Path to the directory containing the STAR index for this
+            genome (not required if blat=True or seed_index=True)
+        shards : int, optional
+            The number of RepeatMasker processes to run, see
+            `detect_repeats`; default = RM_SHARDS in config.txt
+        
+        Returns
+        -------
+        self : object
+        
+        Raises
+        ------
+        subprocess.CalledProcessError
+            If RepeatMasker or the aligner exits with a non-zero status
+        
+        """
+        
+        commands, shard_files = self._repeat_commands(shards)
+        if self.seed_index:
+            self._run_commands(commands, work=self.count_seed_hits)
+        else:
+            self._run_commands(commands + self._align_commands(s_idx))
+        self._merge_repeats(shard_files)
+        
+        return self
+    
+    @_stage('count_seed_hits', _n_stats)
+    def count_seed_hits(self, hits_file='seed_hits.txt'):
+        """Counts the off-target hits of every oligo with a
+        `seeds.SeedIndex` of the reference genome, without an external
+        aligner
+        
+        The index is built the first time a chromosome is searched and
+        memory-mapped afterwards. Hits are ungapped sites, on either
+        strand, with up to `mismatches` mismatches; chromosomes are
+        searched in `threads` processes. Oligos with a seed in a highly
+        repeated sequence are over the multimap limit, and counted as
+        having at least as many hits as STAR's --seedMultimapNmax.
+        
+        Parameters
+        ----------
+        hits_file : str, optional
+            Output file, with the number of exact hits and of hits with up
+            to `mismatches` mismatches of every oligo, and whether it is
+            over the multimap limit, default = seed_hits.txt
+        
+        Returns
+        -------
+        self : object
+        
+        """
+        
+        try:
+            self._oligo_stats
+        except AttributeError:
+            self._populate_oligo_stats()
+        
+        print('Counting off-target hits with a seed index...')
+        index = SeedIndex(self._reference())
+        exact, hits, repeated = index.count_hits(
+            self._stats_oligos.seqs, mismatches=self.mismatches,
+            threads=self.threads)
+        pd.DataFrame({'oligo': self._oligo_stats.index, 'exact': exact,
+                      'hits': hits, 'repeated': repeated}).to_csv(
+                          hits_file, sep='\t', index=False)
+        print('\t...complete. Output written to {}'.format(hits_file))
+        
+        return self
+    
+    def load_star_index(self, s_idx):
+        """Loads a STAR index into shared memory, where it stays for any
+        number of alignments with `shared_memory` = True, from this or
+        other processes, until `remove_star_index` is called
+        
+        Parameters
+        ----------
+        s_idx : str
+            Path to the directory containing the STAR index for this genome
+        
+        """
+        
+        options = ('STAR_PATH', 'STAR', 'STAR', 'star_load_log.txt',
+                   'shared memory')
+        cmd = star_load_param.format(s_idx, 'LoadAndExit', 'star_load_')
+        msg = 'Loading the genome index into shared memory,'
+        self._run_commands([(options, cmd, msg)])
+        
+        return self
+    
+    def remove_star_index(self, s_idx):
+        """Removes a STAR index from shared memory
+        
+        Parameters
+        ----------
+        s_idx : str
+            Path to the directory containing the STAR index for this genome
+        
+        """
+        
+        options = ('STAR_PATH', 'STAR', 'STAR', 'star_remove_log.txt',
+                   'shared memory')
+        cmd = star_load_param.format(s_idx, 'Remove', 'star_remove_')
+        msg = 'Removing the genome index from shared memory,'
+        self._run_commands([(options, cmd, msg)])
+        
+        return self
+    
+    @contextlib.contextmanager
+    def star_session(self, s_idx):
+        """Context manager that keeps a STAR index in shared memory for
+        the alignments run inside it, and removes it on exit
+        
+        Loading a large index can take longer than aligning the oligos, so
+        this is worth using when the same object designs several sets of
+        oligos, e.g.::
+        
+            with c.star_session(s_idx='/mm9/STAR'):
+                for bed in beds:
+                    c.gen_oligos(bed=bed)
+                    ...
+        
+        Parameters
+        ----------
+        s_idx : str
+            Path to the directory containing the STAR index for this genome
+        
+        """
+        
+        shared_memory = self.shared_memory
+        self.load_star_index(s_idx)
+        self.shared_memory = True
+        try:
+            yield self
+        finally:
+            self.shared_memory = shared_memory
+            self.remove_star_index(s_idx)
+    
+    def _repeat_commands(self, shards=None):
+        """Returns the (options, cmd, msg) of each RepeatMasker run, and
+        the names of the shard fasta files they read (empty if the oligos
+        are not sharded)
+        
+        Oligos with cached or previously scored repeats are left out of the
+        shards; if every oligo has them, RepeatMasker is not run and an
+        empty .out file is written for `extract_repeats`.
+        
+        """
+        
+        if self.soft_mask:
+            return [], []
+        rows = self._lookup_cached('repeats')
+        if rows is not None and not rows.any():
+            self._write_no_repeats()
+            return [], []
+        shards = int(paths.get('RM_SHARDS', 1)) if shards is None else shards
+        msg = 'Checking for repeat sequences in oligos,'
+        if shards > 1 or rows is not None:
+            shard_files = self._shard_fasta(shards, rows)
+        else:
+            shard_files = []
+        if len(shard_files) < 2 and rows is None:
+            for shard_file in shard_files:
+                os.remove(shard_file)
+            options = ('RM_PATH', 'RepeatMasker', 'RepeatMasker',
+                       'rm_log.txt', ''.join((self.fasta, '.out')))
+            cmd = repeat_param.format(species[self.genome.lower()], self.fasta)
+            return [(options, cmd, msg)], []
+        
+        commands = []
+        for i, shard_file in enumerate(shard_files, 1):
+            options = ('RM_PATH', 'RepeatMasker',
+                       'RepeatMasker (shard {})'.format(i),
+                       'rm_log.{}.txt'.format(i),
+                       ''.join((shard_file, '.out')))
+            cmd = repeat_param.format(species[self.genome.lower()], shard_file)
+            commands.append((options, cmd, msg))
+        
+        return commands, shard_files
+    
+    def _shard_fasta(self, shards, rows=None, name='shard'):
+        """Splits the oligo fasta into at most `shards` files with equal
+        numbers of oligos, in their original order, and returns the names
+        of the files written
+        
+        Parameters
+        ----------
+        shards : int
+            The most files to write
+        rows : numpy.ndarray, optional
+            Boolean mask of the oligos to write, default = all of them
+        name : str, optional
+            Inserted before the shard number in the file names, e.g.
+            oligo_seqs.shard1.fa, default = shard
+        
+        """
+        
+        if rows is None:
+            with open(self.fasta) as f:
+                n_oligos = sum(1 for line in f if line.startswith('>'))
+        else:
+            n_oligos = int(rows.sum())
+        shards = max(min(shards, n_oligos), 1)
+        root, ext = os.path.splitext(self.fasta)
+        shard_files = ['{}.{}{}{}'.format(root, name, i, ext)
+                       for i in range(1, shards + 1)]
+        
+        # the oligo fasta has one line of sequence per oligo
+        with open(self.fasta) as f:
+            lines = f
+            if rows is not None:
+                lines = itertools.chain.from_iterable(
+                    itertools.compress(zip(f, f), rows))
+            for i, shard_file in enumerate(shard_files):
+                size = n_oligos * (i + 1) // shards - n_oligos * i // shards
+                with open(shard_file, 'w') as shard:
+                    shard.writelines(itertools.islice(lines, 2 * size))
+        
+        return shard_files
+    
+    def _merge_repeats(self, shard_files):
+        """Concatenates the RepeatMasker .out files of the shards into the
+        .out file of the oligo fasta, renumbering the repeat IDs so they
+        stay unique, then removes the shard files
+        
+        """
+        
+        if not shard_files:
+            return None
+        
+        header, body, last_id = [], [], 0
+        id_pat = re.compile(r'(\d+)(\s*\*?\s*)$')
+        for shard_file in shard_files:
+            with open(''.join((shard_file, '.out'))) as rm_out:
+                lines = rm_out.readlines()
+            if len(lines) <= 1:  # no repeats in this shard
+                continue
+            header = header or lines[:3]
+            shard_id = 0
+            for line in lines[3:]:
+                match = id_pat.search(line)
+                if match:
+                    shard_id = max(shard_id, int(match.group(1)))
+                    line = ''.join((line[:match.start()],
+                                    str(int(match.group(1)) + last_id),
+                                    match.group(2)))
+                body.append(line)
+            last_id += shard_id
+        
+        if header:
+            with open(''.join((self.fasta, '.out')), 'w') as rm_out:
+                rm_out.writelines(header + body)
+        else:
+            self._write_no_repeats()
+        
+        for shard_file in shard_files:
+            for suffix in ('', '.out', '.masked', '.tbl', '.cat', '.cat.gz',
+                           '.log'):
+                if os.path.exists(shard_file + suffix):
+                    os.remove(shard_file + suffix)
+        
+        return None
+    
+    def _write_no_repeats(self):
+        """Writes the .out file RepeatMasker leaves when no oligo has
+        repeats
+        
+        """
+        
+        with open(''.join((self.fasta, '.out')), 'w') as rm_out:
+            rm_out.write('There were no repetitive sequences detected in '
+                         '{}\n'.format(self.fasta))
+        
+        return None
+    
+    def _align_commands(self, s_idx):
+        """Returns the BLAT or STAR run as a list of (options, cmd, msg),
+        which is empty if every oligo has cached or previously scored
+        alignments
+        
+        """
+        
+        rows = self._lookup_cached('alignments')
+        if rows is None:
+            return [self._align_command(s_idx)]
+        if not rows.any():
+            return []
+        fasta = self._shard_fasta(1, rows, 'uncached')[0]
+        
+        return [self._align_command(s_idx, fasta)]
+    
+    def _align_command(self, s_idx, fasta=None):
+        """Returns the (options, cmd, msg) of the BLAT or STAR run, on
+        `fasta` (default = the oligo fasta)
+        
+        """
+        
+        fasta = self.fasta if fasta is None else fasta
         if (not self.blat) and (not s_idx):
             raise AttributeError('Path to STAR index must be set if '
                                  'blat=False')
-        if not os.path.exists(self.fasta):
+        if not os.path.exists(fasta):
             raise FileNotFoundError('A valid FASTA file with the name {} was '
-                                    'not found'.format(self.fasta))
+                                    'not found'.format(fasta))
         
         if self.blat:
             blat_out = 'blat_out.psl'
             options = ('BLAT_PATH', 'blat', 'BLAT', 'blat_log.txt', blat_out)
-            cmd = ' '.join((blat_param, self.fa, self.fasta, blat_out))
+            cmd = ' '.join((blat_param, self.fa, fasta, blat_out))
         else:
             options = ('STAR_PATH', 'STAR', 'STAR', 'star_log.txt',
                        'oligos_Aligned.out.sam')
-            cmd = star_param.format(self.fasta, s_idx)
+            genome_load = ('LoadAndKeep' if self.shared_memory
+                           else 'NoSharedMemory')
+            cmd = star_param.format(fasta, s_idx, self.threads,
+                                    genome_load)
         msg = 'Aligning oligos to the genome,'
         
-        self._run_command(options, cmd, msg)
-        
-        return None
+        return options, cmd, msg
     
+    @_stage('parse_repeats', _n_stats)
     def extract_repeats(self):
         """Extracts information of repeat content from RepeatMasker output
         file for every oligo
         
+        If `soft_mask` = True, the longest run of soft-masked (lower case)
+        bases at the coordinates of each oligo in the reference is used
+        instead, with the repeat class 'soft_masked'. With a `cache`, the
+        repeats found are added to it.
+        
         """
         
         try:
@@ -143,35 +806,36 @@ class Tools(object):
         except AttributeError:
             self._populate_oligo_stats()
         
-        with open('.'.join((self.fasta, 'out'))) as repeats_file:
-            if len(repeats_file.readlines())>1:
-                repeats_file.seek(0)
-                for _ in range(3):
-                    next(repeats_file)
-                for line in repeats_file:
-                    parts = re.split("\s+", line.strip())
-                    oligo_name = parts[4]
-                    repeat_type = parts[9]
-                    fragment_side = re.split("\W+", oligo_name)[5]
-                    if len(fragment_side)>1:
-                        oligo_name = oligo_name.split('_')[0]
-                    
-                    qstart, qstop = map(int, (parts[5:7]))
-                    length = (qstop-qstart) + 1
-                    if length > self._oligo_stats[oligo_name]['repeat_length']:
-                        self._oligo_stats[oligo_name]['repeat_length'] = length
-                        self._oligo_stats[oligo_name]['repeat_type'] = repeat_type
-                msg = 'Repeat scores calculated'
-            else:
-                msg = 'No repeats detected'
+        stats = self._oligo_stats
+        rm_out = '.'.join((self.fasta, 'out'))
+        if self.soft_mask:
+            lengths = masked_repeats(self._reference(), self._stats_oligos)
+            types = np.where(lengths > 0, 'soft_masked', 'NA').astype(object)
+        elif has_repeats(rm_out):
+            lengths, types = read_repeats(rm_out, stats.index)
+        else:
+            lengths, types = np.zeros(len(stats), dtype=np.int64), None
+        if lengths.any():
+            longer = lengths > stats['repeat_length'].values
+            stats['repeat_length'] = np.where(longer, lengths,
+                                              stats['repeat_length'].values)
+            stats['repeat_type'] = np.where(longer, types,
+                                            stats['repeat_type'].values)
+        self._store_cached('repeats')
+        if stats['repeat_length'].values.any():
+            msg = 'Repeat scores calculated'
+        else:
+            msg = 'No repeats detected'
         
         print(msg)
         
         return self
     
+    @_stage('parse_alignments', _n_stats)
     def calculate_density(self,
                           sam='oligos_Aligned.out.sam',
-                          blat_file='blat_out.psl'):
+                          blat_file='blat_out.psl',
+                          hits_file='seed_hits.txt'):
         """Calculates the repeat scores and off-target binding for
         each oligo based on their scores from RepeatMasker and
         STAR/BLAT. Outputs results to `oligo_info.txt`.
@@ -179,11 +843,20 @@ class Tools(object):
         Parameters
         ----------
         sam : str
-            Path to STAR alignment (.sam) file from `align_to_genome`
-            (not required if `blat`=True), default = oligos_Aligned.out.sam
+            Path to STAR alignment (.sam or .bam) file from
+            `align_to_genome` (not required if `blat`=True),
+            default = oligos_Aligned.out.sam
         blat_file : str
             Path to BLAT alignment (.psl) file from `align_to_genome`
             (not required if `blat`=False), default = blat_out.psl
+        hits_file : str
+            Path to the hits file from `count_seed_hits` (only required
+            if `seed_index`=True), default = seed_hits.txt
+        
+        With a `cache`, oligos with cached alignments keep their cached
+        values, and the alignments found for the others are added to it.
+        Oligos scored by a previous design (see `load_oligo_info`) keep
+        its number of alignments and density score.
         
         """
         
@@ -192,144 +865,399 @@ class Tools(object):
         except AttributeError:
             self._populate_oligo_stats()
         
-        if self.blat:        
-            with open(blat_file) as f:
-                for _ in range(5):
-                    next(f)
-                for line in f:
-                    parts = re.split("\s+", line.strip())
-                    oligo_name = parts[9]
-                    qgapbases, qstart, qend = map(int, (parts[5], parts[11], 
-                                                        parts[12]))
-                    self._oligo_stats[oligo_name]['multimap'] += 1
-                    self._oligo_stats[oligo_name]['matches'] += (int(qend) -
-                                                           int(qstart)) + 1
-                    self._oligo_stats[oligo_name]['mismatches'] += int(qgapbases)  
+        stats = self._oligo_stats
+        uncached = self._uncached.get('alignments')
+        if uncached is not None and not uncached.any():
+            # the aligner was not run, as every oligo had cached alignments
+            matches = mismatches = 0
+        elif self.seed_index:
+            multimap, matches, mismatches = tally_hits(
+                hits_file, stats.index, self._stats_oligos.size)
+            stats['multimap'] += multimap
+        elif self.blat:
+            multimap, matches, mismatches = tally_psl(blat_file, stats.index)
+            stats['multimap'] += multimap
         else:
-            sf = pysam.AlignmentFile(sam, 'r')
-            for r in sf.fetch(until_eof=True):
-                oligo_name = r.query_name
-                if self._oligo_stats[oligo_name]['multimap'] == 0:
-                    self._oligo_stats[oligo_name]['multimap'] = r.get_tag('NH')
-                        
-                for block in r.cigartuples:
-                    if block[0] == 0:
-                        self._oligo_stats[oligo_name]['matches'] += block[1]
-                    elif (block[0] == 1) | (block[0] == 2):
-                        self._oligo_stats[oligo_name]['mismatches'] += block[1]
-            
-        for oligo in self._oligo_stats:
-            score = self._oligo_stats[oligo]['matches'] - self._oligo_stats[oligo]['mismatches']
-            density = score / len(self._oligo_stats[oligo]['sequence'])
-            self._oligo_stats[oligo]['density'] = float("{0:.2f}".format(density))      
+            multimap, matches, mismatches = tally_sam(sam, stats.index,
+                                                      threads=self.threads)
+            # STAR reports the number of alignments in the NH tag
+            stats['multimap'] = np.where(stats['multimap'].values == 0,
+                                         multimap, stats['multimap'].values)
+        stats['matches'] += matches
+        stats['mismatches'] += mismatches
+        self._store_cached('alignments')
+        
+        score = stats['matches'] - stats['mismatches']
+        density = _round_2dp(score.values / (self._stats_oligos.size or 1))
+        previous = self._previous_results('alignments')
+        if previous is not None:
+            # oligos scored by the previous design keep its density scores
+            density = np.where(previous[0] >= 0, stats['density'].values,
+                               density)
+        stats['density'] = density
         
         print('Density scores calculated')
         
         return self
     
-    def write_oligo_info(self):
-        """Writes oligo stats to oligo_info.txt"""
-        
-        p = re.compile('\W+')
-        with open('oligo_info.txt', 'w') as output:
-            output.write('chr\tstart\tstop\tfragment_start\tfragment_stop\t'
-                    'side_of_fragment\tsequence\ttotal_number_of_alignments\t'
-                    'density_score\trepeat_length\trepeat_class\tGC%\t'
-                    'associations\n')
-            for oligo, stats in self._oligo_stats.items():
-                oligo_parts = (chrom, read_start, read_stop, frag_start,
-                               frag_stop, frag_side) = p.split(oligo)
-                
-                has_fragment = True
-                if (frag_start, frag_stop, frag_side) == ('000', '000', 'X'):
-                    has_fragment = False
-                    #frag_start, frag_stop, frag_side = '.' * 3
-                    oligo_parts[3:] = '.' * 3
-                
-                try:
-                    self._assoc
-                except AttributeError:
-                    associations = '.'
-                else:
-                    if self._assoc:
-                        if has_fragment:
-                            coor = '{}:{}-{}'.format(chrom, frag_start, frag_stop)
-                        else:
-                            coor = '{}:{}-{}'.format(chrom, read_start, read_stop)
-                        associations = self._assoc.get(coor, '.')
-                    else:
-                        associations = '.'
-                
-                keys = ('sequence', 'multimap', 'density', 'repeat_length',
-                        'repeat_type', 'GC%')
-                to_write = oligo_parts + [str(stats[x])
-                                          for x in keys] + [associations]
-                output.write('{}\n'.format('\t'.join(to_write)))
-    
-        sorted_df = self._sort_file()
-        sorted_df.to_csv('oligo_info.txt', sep='\t', index=False, na_rep='NA')
-        print('Oligo information written to oligo_info.txt')
+    @_stage('write_oligo_info', _n_stats)
+    def write_oligo_info(self, path='oligo_info.txt', batch_size=100000):
+        """Writes oligo stats to `path` in a single pass, sorted by
+        chromosome (in natural order, so chr2 comes before chr10) and start
+        
+        Parameters
+        ----------
+        path : str, optional
+            Output file, default = oligo_info.txt. Names ending in .gz are
+            written as gzip-compressed text, and names ending in .parquet
+            as a Parquet table with typed columns and nulls for missing
+            values (requires pyarrow or fastparquet)
+        batch_size : int, optional
+            The number of rows formatted at a time when writing text,
+            default = 100000
+        
+        """
+        
+        try:
+            self._oligo_stats
+        except AttributeError:
+            self._populate_oligo_stats()
+        
+        order = self._info_order()
+        if path.endswith('.parquet'):
+            self._oligo_info(order).to_parquet(path, index=False)
+        else:
+            opener = gzip.open if path.endswith('.gz') else open
+            fragment = ['fragment_start', 'fragment_stop', 'side_of_fragment',
+                        'associations']
+            with opener(path, 'wt') as output:
+                for i in range(0, max(len(order), 1), batch_size):
+                    table = self._oligo_info(order[i:i + batch_size])
+                    table[fragment] = table[fragment].astype(object).fillna(
+                        '.')
+                    table.to_csv(output, sep='\t', index=False, na_rep='NA',
+                                 header=i == 0)
+        print('Oligo information written to {}'.format(path))
         
         return None
     
+    def _info_order(self):
+        """Returns the rows of `_oligo_stats` sorted by chromosome, in
+        natural order, then by start; ties keep their fasta order
+        
+        """
+        
+        oligos = self._stats_oligos
+        
+        def natural(chrom):
+            return [int(x) if x.isdigit() else x
+                    for x in re.split(r'(\d+)', chrom)]
+        
+        ranks = np.zeros(len(oligos.chroms), dtype=np.int64)
+        ranks[sorted(range(len(oligos.chroms)),
+                     key=lambda x: natural(oligos.chroms[x]))] = np.arange(
+                         len(oligos.chroms))
+        
+        return np.lexsort((oligos.starts, ranks[oligos.chrom_ids]))
+    
+    def _oligo_info(self, rows):
+        """Returns the oligo_info.txt columns of the given rows as a
+        DataFrame; values that do not apply to an oligo are null
+        
+        """
+        
+        oligos = self._stats_oligos
+        stats = self._oligo_stats.iloc[rows]
+        chroms = np.array(oligos.chroms, dtype=object)[oligos.chrom_ids[rows]]
+        starts = oligos.starts[rows]
+        stops = starts + oligos.size
+        is_x = oligos.sides[rows] == ord('X')
+        frag_starts = oligos.frag_starts[rows]
+        frag_stops = oligos.frag_stops[rows]
+        sides = oligos.sides[rows].view('S1').astype(str).astype(object)
+        sides[is_x] = None
+        
+        assoc = getattr(self, '_assoc', None)
+        if assoc:
+            # fragment-independent oligos are associated by their own
+            # coordinates
+            coor_starts = np.where(is_x, starts, frag_starts)
+            coor_stops = np.where(is_x, stops, frag_stops)
+            associations = [assoc.get('{}:{}-{}'.format(*x))
+                            for x in zip(chroms.tolist(), coor_starts.tolist(),
+                                         coor_stops.tolist())]
+        else:
+            associations = [None] * len(starts)
+        
+        return pd.DataFrame({
+            'chr': chroms,
+            'start': starts,
+            'stop': stops,
+            'fragment_start': pd.array(np.where(is_x, None, frag_starts),
+                                       dtype='Int64'),
+            'fragment_stop': pd.array(np.where(is_x, None, frag_stops),
+                                      dtype='Int64'),
+            'side_of_fragment': sides,
+            'sequence': oligo_sequences(oligos.seqs[rows]),
+            'total_number_of_alignments': stats['multimap'].values,
+            'density_score': stats['density'].values,
+            'repeat_length': stats['repeat_length'].values,
+            'repeat_class': np.where(stats['repeat_type'].values == 'NA',
+                                     None, stats['repeat_type'].values),
+            'GC%': stats['GC%'].values,
+            'associations': np.array(associations, dtype=object),
+        })
+    
+    def _cache_key(self, kind):
+        """Returns the `resultcache.fingerprint` of the tool settings (and,
+        for alignments, the genome) that results of `kind` depend on, or
+        None if they are not cached
+        
+        """
+        
+        if not self.cache:
+            return None
+        if kind == 'repeats':
+            if self.soft_mask:
+                return None
+            return fingerprint('RepeatMasker', paths['RM_PATH'],
+                               repeat_param.format(
+                                   species[self.genome.lower()], ''))
+        if self.seed_index:
+            return None
+        genome = self._reference().checksum
+        if self.blat:
+            return fingerprint('BLAT', paths['BLAT_PATH'], blat_param, genome)
+        
+        return fingerprint('STAR', paths['STAR_PATH'],
+                           star_param.format('', '', '', ''), genome)
+    
+    def _open_cache(self):
+        """Opens the `cache` file"""
+        
+        return ResultCache(os.path.expanduser(self.cache), max_entries=int(
+            paths.get('RESULT_CACHE_ENTRIES', 5000000)))
+    
+    def _previous_results(self, kind):
+        """Returns the row of each oligo in the design loaded by
+        `load_oligo_info` (-1 for new oligos) and its scores, or None if
+        results of `kind` are not taken from a previous design
+        
+        """
+        
+        previous = getattr(self, '_previous', None)
+        if (previous is None or (kind == 'repeats' and self.soft_mask) or
+                (kind == 'alignments' and self.seed_index)):
+            return None
+        
+        return previous
+    
+    def _fill_stats(self, rows, values, columns):
+        """Sets `columns` of the given rows of `_oligo_stats` to `values`"""
+        
+        stats = self._oligo_stats
+        for column in columns:
+            column_values = stats[column].values.copy()
+            column_values[rows] = values[column].values
+            stats[column] = column_values
+        
+        return None
+    
+    def _lookup_cached(self, kind):
+        """Fills `_oligo_stats` with the results of `kind` scored by a
+        previous design (see `load_oligo_info`) or held in the `cache`, and
+        returns a boolean mask of the oligos with neither, or None if
+        results of `kind` are not reused
+        
+        """
+        
+        key = self._cache_key(kind)
+        previous = self._previous_results(kind)
+        if key is None and previous is None:
+            return None
+        try:
+            self._oligo_stats
+        except AttributeError:
+            self._populate_oligo_stats()
+        
+        found = np.zeros(len(self._oligo_stats), dtype=bool)
+        if previous is not None:
+            rows, scores = previous
+            found = rows >= 0
+            columns = kinds[kind] if kind == 'repeats' else ('multimap',
+                                                            'density')
+            self._fill_stats(found, scores.iloc[rows[found]], columns)
+        if key is not None:
+            missing = np.flatnonzero(~found)
+            with contextlib.closing(self._open_cache()) as cache:
+                hit, values = cache.get(kind, key, oligo_sequences(
+                    self._stats_oligos.seqs[missing]))
+            self._fill_stats(missing[hit], values, kinds[kind])
+            found[missing[hit]] = True
+            print('\tFound cached {} for {} of {} oligos'.format(
+                kind, hit.sum(), len(found)))
+        self._uncached[kind] = ~found
+        
+        return ~found
+    
+    def _store_cached(self, kind):
+        """Adds the results of `kind` for the oligos that were not found in
+        the cache to it
+        
+        """
+        
+        key = self._cache_key(kind)
+        if key is None:
+            return None
+        
+        rows = self._uncached.get(kind)
+        if rows is None:
+            rows = np.ones(len(self._oligo_stats), dtype=bool)
+        if rows.any():
+            with contextlib.closing(self._open_cache()) as cache:
+                cache.put(kind, key, self._stats_oligos.select(
+                    rows).sequences(), self._oligo_stats[list(kinds[kind])][
+                        rows])
+        
+        return None
+    
+    def _reference(self):
+        """Returns the reference `Genome`, opening `fa` if this object has
+        not loaded it
+        
+        """
+        
+        genome_seq = getattr(self, 'genome_seq', None)
+        
+        return Genome(self.fa) if genome_seq is None else genome_seq
+    
     def _run_command(self, options, cmd, msg):
         """Runs a command using subprocess"""
         
+        self._run_commands([(options, cmd, msg)])
+        
+        return None
+    
+    def _run_commands(self, commands, poll=0.5, work=None):
+        """Runs external tools side by side and waits for all of them
+        
+        Each command is an (options, cmd, msg) tuple, where `options` are
+        the paths key, executable, display name, log file and output file
+        of the tool. stdout and stderr of each tool go to its own log file.
+        As soon as one tool exits with a non-zero status, those still
+        running are stopped and `subprocess.CalledProcessError` is raised.
+        Each tool that finishes is added to `run_report`, under its display
+        name, with its own CPU time and peak RSS.
+        `work`, if given, is called once the tools have started, and the
+        tools are stopped if it raises an exception.
+        
+        """
+        
         CmdOptions = namedtuple('CmdOptions', ['paths_key', 'exe', 'name',
-                                               'log_file', 'output_file'])           
-        run_options = CmdOptions._make(options)
-        path = os.path.join(paths[run_options.paths_key], run_options.exe)
-        print('{} with {}...'.format(msg, run_options.name))
-        log = open(run_options.log_file, 'w')
-        subprocess.call(' '.join((path, cmd)), shell=True, stdout=log,
-                        stderr=log)
-        log.close()
-        print('\t...complete. Output written to {}'.format(
-            run_options.output_file))
+                                               'log_file', 'output_file'])
+        running = []
+        try:
+            for options, cmd, msg in commands:
+                run_options = CmdOptions._make(options)
+                path = os.path.join(paths[run_options.paths_key],
+                                    run_options.exe)
+                print('{} with {}...'.format(msg, run_options.name))
+                log = open(run_options.log_file, 'w')
+                # each tool gets its own process group, so that any
+                # processes it starts are stopped along with it
+                proc = subprocess.Popen([path] + shlex.split(cmd), stdout=log,
+                                        stderr=log, start_new_session=True)
+                running.append((proc, log, run_options, time.time()))
+            if work is not None:
+                work()
+            
+            while running:
+                for job in list(running):
+                    proc, log, run_options, started = job
+                    status, usage = _poll(proc)
+                    if status is None:
+                        continue
+                    log.close()
+                    running.remove(job)
+                    if usage is None:
+                        self.run_report.record(run_options.name,
+                                               time.time() - started, 0.0,
+                                               None)
+                    else:
+                        self.run_report.record(
+                            run_options.name, time.time() - started,
+                            usage.ru_utime + usage.ru_stime,
+                            _rss_mb(usage.ru_maxrss))
+                    if status:
+                        print('{} exited with status {}; see {}'.format(
+                            run_options.name, status, run_options.log_file),
+                            file=sys.stderr)
+                        raise subprocess.CalledProcessError(status,
+                                                            proc.args)
+                    print('\t...{} complete. Output written to {}'.format(
+                        run_options.name, run_options.output_file))
+                if running:
+                    time.sleep(poll)
+        finally:
+            for proc, log, run_options, started in running:
+                _stop(proc)
+                log.close()
         
         return None
     
     def _populate_oligo_stats(self):
-        """Populates _oligo_stats attribute with default values""" 
-        self._oligo_stats = {}
-        with open(self.fasta) as fasta_file:
-            for line in fasta_file:
-                oligo_name = line.lstrip('>').strip()
-                read_seq = next(fasta_file).strip()
-                self._oligo_stats[oligo_name] = {
-                    'sequence': read_seq,
-                    'multimap': 0,
-                    'density': 0,
-                    'repeat_length': 0,
-                    'repeat_type': 'NA',
-                    'GC%': self._get_gc(read_seq),
-                    'matches': 0,
-                    'mismatches': 0,
-                }
+        """Populates _oligo_stats attribute with default values
+        
+        The statistics are a DataFrame with one row per oligo, indexed by
+        oligo name, in the order of the oligo fasta. They are built from
+        the `OligoTable` that was written to the fasta; the fasta is only
+        read back if the oligos are not held in memory (e.g. they were
+        streamed, or this object did not generate them).
+        
+        """
+        
+        oligos = getattr(self, '_fasta_oligos', None)
+        if oligos is None:
+            with open(self.fasta) as fasta_file:
+                records = ((line.lstrip('>').strip(), next(fasta_file).strip())
+                           for line in fasta_file)
+                oligos = OligoTable.from_records(records)
+        self._stats_oligos = oligos
+        
+        n_oligos = len(oligos)
+        self._oligo_stats = pd.DataFrame({
+            'multimap': np.zeros(n_oligos, dtype=np.int64),
+            'density': np.zeros(n_oligos),
+            'repeat_length': np.zeros(n_oligos, dtype=np.int64),
+            'repeat_type': np.full(n_oligos, 'NA', dtype=object),
+            'GC%': self._get_gc(oligos.seqs),
+            'matches': np.zeros(n_oligos, dtype=np.int64),
+            'mismatches': np.zeros(n_oligos, dtype=np.int64),
+        }, index=pd.Index(oligos.names(), name='oligo'))
         
         return None
         
     def _get_gc(self, x):
-        """Calculates GC percentage of a DNA sequence"""
+        """Calculates GC percentage of DNA sequences, given as a (oligos,
+        length) uint8 matrix
         
-        gc_decimal = (x.count('C') + x.count('G'))/len(x)
-        gc_decimal = float("{0:.2f}".format(gc_decimal))
-        gc_perc = int(gc_decimal*100)
+        """
         
-        return gc_perc
-    
-    def _sort_file(self):
-        """Sorts oligo output file"""
-        df = pd.read_table('oligo_info.txt', header=0)
-        #df['chr'] = [int(x[3:]) for x in df['chr']]  # this threw an error for chromosomes X and Y
-        df.sort_values(['chr', 'start'], inplace=True)
-        #df['chr'] = 'chr' + df['chr'].map(str)
+        gc_count = ((x == ord('C')) | (x == ord('G'))).sum(axis=1)
+        gc_decimal = _round_2dp(gc_count / x.shape[1])
+        gc_perc = (gc_decimal * 100).astype(np.int64)
         
-        return df
+        return gc_perc
     
     def __repr__(self):
         
-        return '{}(genome={}, fa={}, blat={})'.format(self.__class__.__name__,
-                                                      self.genome,
-                                                      self.fa,
-                                                      self.blat)
+        return '{}(genome={}, fa={}, blat={}, threads={}, ' \
+               'shared_memory={}, seed_index={}, mismatches={})'.format(
+                   self.__class__.__name__,
+                   self.genome,
+                   self.fa,
+                   self.blat,
+                   self.threads,
+                   self.shared_memory,
+                   self.seed_index,
+                   self.mismatches)
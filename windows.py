@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+from __future__ import print_function, division
+
+import numpy as np  # >=1.7
+
+def strided_windows(seq, size, step):
+    """Returns every `size` bp window of `seq`, `step` bp apart, as a
+    read-only (windows, size) view of the same buffer; no bases are copied
+
+    """
+
+    n_windows = max((len(seq) - size) // step + 1, 0)
+
+    return np.lib.stride_tricks.as_strided(
+        seq, shape=(n_windows, size),
+        strides=(seq.strides[0] * step, seq.strides[0]), writeable=False)
+
+def ascii_digits(values):
+    """Converts non-negative integers to a (values, width) uint8 matrix of
+    zero-padded ASCII digits, plus a boolean mask of the digits that are
+    significant (i.e. not leading zeros)
+
+    """
+
+    values = np.asarray(values, dtype=np.int64)
+    width = len(str(int(values.max()))) if len(values) else 1
+    powers = 10 ** np.arange(width - 1, -1, -1, dtype=np.int64)
+    digits = ((values[:, None] // powers) % 10 + 48).astype(np.uint8)
+    significant = (values[:, None] >= powers) | (powers == 1)
+
+    return digits, significant
+
+def join_columns(columns, n_rows):
+    """Concatenates columns of ASCII text row by row into one bytes object
+
+    Each column is a bytes constant repeated on every row, a (rows, width)
+    uint8 matrix, or a (matrix, mask) pair where only the masked-in bytes
+    of each row are kept.
+
+    """
+
+    matrices, masks = [], []
+    for column in columns:
+        if isinstance(column, bytes):
+            column = np.tile(np.frombuffer(column, dtype=np.uint8),
+                             (n_rows, 1))
+        if isinstance(column, tuple):
+            matrix, mask = column
+        else:
+            matrix, mask = column, np.ones(column.shape, dtype=bool)
+        matrices.append(matrix)
+        masks.append(mask)
+
+    return np.hstack(matrices)[np.hstack(masks)].tobytes()
+
+def oligo_names(chrom, starts, size, suffix=b'-000-000-X'):
+    """Returns the `oligo_seqs` keys of fragment-independent oligos as a
+    list of str, formatted in one vectorized pass
+
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    if not len(starts):
+        return []
+    columns = [chrom.encode('ascii') + b':', ascii_digits(starts), b'-',
+               ascii_digits(starts + size), suffix, b'\n']
+
+    return join_columns(columns, len(starts)).decode('ascii').split('\n')[:-1]
+
+def oligo_sequences(rows):
+    """Converts a (oligos, length) uint8 matrix to a list of str"""
+
+    rows = np.ascontiguousarray(rows)
+
+    return rows.view('S{}'.format(rows.shape[1])).ravel().astype(
+        'U{}'.format(rows.shape[1])).tolist()
+
+class ContigWindows(object):
+    """Adjacent oligos across a region, held as a strided view over one
+    uint8 buffer of the region's sequence
+
+    Keys and sequences are only turned into `str` or `bytes` when they are
+    requested, one batch at a time, and are formatted with vectorized
+    operations rather than once per oligo. Iterating yields (key, sequence)
+    records.
+
+    Parameters
+    ----------
+    chrom : str
+        Chromosome name
+    seq : numpy.ndarray
+        uint8 sequence of the region, e.g. from `Genome.fetch_array`
+    offset : int
+        Chromosome coordinate of the first base of `seq`
+    size : int
+        Oligo length (bp)
+    step : int
+        Distance (bp) between the starts of adjacent oligos
+    batch_size : int, optional
+        The number of oligos converted at a time, default = 100000
+
+    """
+
+    def __init__(self, chrom, seq, offset, size, step, batch_size=100000):
+        self.chrom = chrom
+        self.size = size
+        self.batch_size = batch_size
+        self.windows = strided_windows(seq, size, step)
+        self.starts = offset + step * np.arange(len(self.windows),
+                                                dtype=np.int64)
+
+    def __len__(self):
+
+        return len(self.windows)
+
+    def names(self, i=0, j=None):
+        """Returns the names (`oligo_seqs` keys) of oligos `i` to `j` as a
+        list of str
+
+        """
+
+        return oligo_names(self.chrom, self.starts[i:j], self.size)
+
+    def sequences(self, i=0, j=None):
+        """Returns the sequences of oligos `i` to `j` as a list of str"""
+
+        return oligo_sequences(self.windows[i:j])
+
+    def fasta(self, i=0, j=None):
+        """Returns oligos `i` to `j` as fasta-formatted bytes"""
+
+        j = len(self) if j is None else min(j, len(self))
+        if j <= i:
+            return b''
+        starts = self.starts[i:j]
+        columns = [b'>', self.chrom.encode('ascii') + b':',
+                   ascii_digits(starts), b'-', ascii_digits(starts + self.size),
+                   b'-000-000-X\n', self.windows[i:j], b'\n']
+
+        return join_columns(columns, j - i)
+
+    def fasta_blocks(self):
+        """Yields the fasta-formatted bytes of every batch of oligos"""
+
+        for i in range(0, len(self), self.batch_size):
+            yield self.fasta(i, i + self.batch_size)
+
+    def __iter__(self):
+        for i in range(0, len(self), self.batch_size):
+            j = i + self.batch_size
+            for record in zip(self.names(i, j), self.sequences(i, j)):
+                yield record